@@ -2,19 +2,82 @@
 """codelist.csvの複数銘柄を一括処理し、最新データをまとめてCSV出力するバッチツール"""
 
 import pandas as pd
+import argparse
+import asyncio
+import itertools
 import os
+import queue
+import subprocess
 import sys
+import threading
 import time
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 from qq import (
     fetch_kabutan_page, 
-    get_fiscal_year_end_month, 
     extract_quarterly_data, 
     calculate_qoq_growth_rate,
     fetch_weekly_stock_data,
-    find_stock_price_after_announcement,
+    fetch_weekly_stock_pages,
+    parse_weekly_stock_pages,
+    weekly_pages_to_fetch,
+    oldest_announcement_date,
+    update_weekly_prices,
+    attach_balance_sheet_data,
+    attach_prices_to_quarters,
     calculate_stock_correlations
 )
+from src.http_cache import get_default_cache, set_default_cache
+from src.pdf_store import get_default_pdf_store, set_default_pdf_store
+from src.price_store import set_default_price_store
+from src.work_queue import (
+    DEFAULT_CLAIM_SIZE, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, DEFAULT_QUEUE_PATH, LeaseKeeper, WorkQueue,
+    worker_id
+)
+from src.summary_writer import (
+    DEFAULT_SUMMARY_PATH, NUMERIC_COLUMNS, SUMMARY_COLUMNS, SUMMARY_FORMATS, SummaryWriter, read_summary_head,
+    summary_path
+)
+from src.pdf_analyzer import format_extraction_stats
+from src.finance_page import FinancePage, parse_finance_page
+from src.http_client import (
+    HttpClient, DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, DEFAULT_TOTAL_TIMEOUT, set_default_client
+)
+from src.rate_limiter import HostRateLimiter, DEFAULT_HOST_RATES, host_rates
+from src.retry import DEFAULT_MAX_RETRIES, RetryPolicy
+from src.deadline import (
+    DEFAULT_CODE_DEADLINE, code_deadline, partial_result_label, set_default_code_deadline, start_code_deadline
+)
+from src.batch_state import disclosure_signature, load_batch_state, save_batch_state
+from src.journal import BatchJournal, DEFAULT_JOURNAL_PATH, load_journal
+from src.history_store import enable_history_store, get_default_history_store
+from src.screening import (
+    DEFAULT_SCREENING_PATH, ScreeningEngine, ScreeningFilter, check_filter_columns, parse_filter
+)
+from src.correlation import (
+    add_correlation_arguments, set_default_correlation_settings, settings_from_args as correlation_settings_from_args
+)
+from src.live_metrics import DEFAULT_METRICS_INTERVAL, enable_live_metrics, get_default_metrics, stop_live_metrics
+from src.profiling import (
+    DEFAULT_PROFILE_DIR, enable_profiler, finish_code, get_default_profiler, profile_code, profile_stage
+)
+
+
+# --async/--pipeline時の同時処理銘柄数
+DEFAULT_CONCURRENCY = 8
+
+# --pipeline時の各ステージ間キューの上限（満杯になると上流ステージが待機する）
+DEFAULT_QUEUE_SIZE = 32
+
+# 終了時に画面に表示するサマリーの行数
+SUMMARY_PREVIEW_ROWS = 10
+
+# パイプラインのステージ終了を伝える番兵
+_STAGE_END = object()
+
+# 1銘柄の処理が終わるたびに呼ばれるコールバック（銘柄情報, 結果。失敗時の結果はNone）
+ResultCallback = Callable[[Dict[str, str], Optional[Dict]], None]
 
 
 def load_code_list(csv_file: str = "codelist.csv") -> List[Dict[str, str]]:
@@ -42,73 +105,113 @@ def load_code_list(csv_file: str = "codelist.csv") -> List[Dict[str, str]]:
         return []
 
 
-def process_single_stock(code: str, name: str = "") -> Optional[Dict]:
+def attach_stock_prices(data_with_growth: List[Dict], weekly_data: List[Dict]) -> None:
+    """各四半期データに発表日翌日以降の株価情報を追加し、株価相関を計算"""
+    attach_prices_to_quarters(data_with_growth, weekly_data)
+    
+    # 株価相関を計算
+    calculate_stock_correlations(data_with_growth)
+
+
+def build_summary_row(code: str, name: str, data_with_growth: List[Dict]) -> Tuple[Dict, Dict]:
+    """最新四半期のデータからサマリー行を作成（サマリー行と最新データを返す）"""
+    # 最新データ（新しい順にソート後の最初のデータ）を取得
+    sorted_data = sorted(data_with_growth, key=lambda x: x['決算期'], reverse=True)
+    latest_data = sorted_data[0]
+    
+    # 必要な項目のみ抽出（パーセント項目は100分の1に変換）
+    # 列順: コード、銘柄名、株価日付、始値、発表日、決算期...
+    result = {
+        'コード': code,
+        '銘柄名': name,
+        '株価日付': latest_data.get('株価日付'),
+        '始値': latest_data.get('始値'),
+        '発表日': latest_data.get('発表日'),
+        '決算期': latest_data.get('決算期'),
+        '四半期': latest_data.get('四半期'),
+        '売上高': latest_data.get('売上高'),
+        '経常益': latest_data.get('経常益'),
+        '資本合計(純資産)': latest_data.get('資本合計'),
+        '売上高成長率': latest_data.get('売上高成長率') / 100 if latest_data.get('売上高成長率') is not None else None,
+        '四半期成長率': latest_data.get('四半期成長率') / 100 if latest_data.get('四半期成長率') is not None else None,
+        '経常益利回り': latest_data.get('経常益利回り') / 100 if latest_data.get('経常益利回り') is not None else None,
+        '四半期割安率_四半期平均': latest_data.get('四半期割安率_四半期平均') / 100 if latest_data.get('四半期割安率_四半期平均') is not None else None,
+        '四半期割安率_前年同期ベース': latest_data.get('四半期割安率_前年同期ベース') / 100 if latest_data.get('四半期割安率_前年同期ベース') is not None else None,
+        '四半期割安率_前四半期': latest_data.get('四半期割安率_前四半期') / 100 if latest_data.get('四半期割安率_前四半期') is not None else None,
+        '四半期成長率株価相関': latest_data.get('四半期成長率株価相関'),
+        '経常益利回り株価相関': latest_data.get('経常益利回り株価相関'),
+        # 処理期限を過ぎて取得を諦めた項目（資本合計・株価）。その項目を使う指標は空欄になる
+        '部分結果': partial_result_label(),
+    }
+    
+    return result, latest_data
+
+
+def record_quarterly_history(code: str, data_with_growth: List[Dict]) -> None:
+    """--history指定時に全四半期の指標を履歴ストアに追加
+
+    履歴の書き出しに失敗しても銘柄の処理は成功として扱う（貯めた行は次の書き出しで再試行する）。
+    """
+    store = get_default_history_store()
+    if store:
+        try:
+            store.add(code, data_with_growth)
+        except Exception as e:
+            print(f"警告: 履歴の書き出しに失敗しました（次の書き出しで再試行します）: {e}")
+
+
+def process_single_stock(code: str, name: str = "", client: Optional[HttpClient] = None,
+                         page: Optional[FinancePage] = None) -> Optional[Dict]:
+    """単一銘柄の最新データを取得（--profile指定時は処理段階ごとに計測、--code-deadlineの期限内で取得）
+    
+    解析済みの財務ページ（増分モードの判定で取得したもの）を渡すと財務ページを取得し直さない。
+    """
+    with profile_code(code), code_deadline(start_code_deadline()):
+        result = _process_single_stock(code, name, client, page)
+    finish_code(code, result is not None)
+    return result
+
+
+def _process_single_stock(code: str, name: str, client: Optional[HttpClient],
+                          page: Optional[FinancePage] = None) -> Optional[Dict]:
     """単一銘柄の最新データを取得"""
     print(f"\n=== {code} ({name}) の処理開始 ===")
     
     try:
-        # HTMLを取得
-        html = fetch_kabutan_page(code)
-        if not html:
-            print(f"{code}: ページの取得に失敗")
-            return None
-        
-        # 決算月を取得
-        fiscal_year_end_month = get_fiscal_year_end_month(html)
+        html = None
+        if page is None:
+            # HTMLを取得
+            html = fetch_kabutan_page(code, client=client)
+            if not html:
+                print(f"{code}: ページの取得に失敗")
+                return None
+            
+            # 財務ページを1回だけ解析し、決算月と四半期データを取り出す
+            with profile_stage('財務ページ解析'):
+                page = parse_finance_page(html)
+        fiscal_year_end_month = page.fiscal_year_end_month
         print(f"{code}: 決算月 = {fiscal_year_end_month}月")
         
         # 四半期データを抽出
-        quarterly_data = extract_quarterly_data(html)
+        quarterly_data = extract_quarterly_data(html, client=client, code=code, page=page)
         if not quarterly_data:
             print(f"{code}: 四半期データが見つかりません")
             return None
         
         # 成長率計算
-        data_with_growth = calculate_qoq_growth_rate(quarterly_data, fiscal_year_end_month)
+        with profile_stage('指標計算'):
+            data_with_growth = calculate_qoq_growth_rate(quarterly_data, fiscal_year_end_month)
         
         # 週足データを取得
         print(f"{code}: 週足データを取得中...")
-        weekly_data = fetch_weekly_stock_data(code)
-        
-        # 各四半期データに株価情報を追加
-        for item in data_with_growth:
-            if item.get('発表日'):
-                stock_info = find_stock_price_after_announcement(item['発表日'], weekly_data)
-                item['株価日付'] = stock_info['株価日付']
-                item['始値'] = stock_info['始値']
-            else:
-                item['株価日付'] = None
-                item['始値'] = None
-        
-        # 株価相関を計算
-        calculate_stock_correlations(data_with_growth)
-        
-        # 最新データ（新しい順にソート後の最初のデータ）を取得
-        sorted_data = sorted(data_with_growth, key=lambda x: x['決算期'], reverse=True)
-        latest_data = sorted_data[0]
+        weekly_data = fetch_weekly_stock_data(code, client=client,
+                                              oldest_announcement=oldest_announcement_date(quarterly_data))
         
-        # 必要な項目のみ抽出（パーセント項目は100分の1に変換）
-        # 列順: コード、銘柄名、株価日付、始値、発表日、決算期...
-        result = {
-            'コード': code,
-            '銘柄名': name,
-            '株価日付': latest_data.get('株価日付'),
-            '始値': latest_data.get('始値'),
-            '発表日': latest_data.get('発表日'),
-            '決算期': latest_data.get('決算期'),
-            '四半期': latest_data.get('四半期'),
-            '売上高': latest_data.get('売上高'),
-            '経常益': latest_data.get('経常益'),
-            '資本合計(純資産)': latest_data.get('資本合計'),
-            '売上高成長率': latest_data.get('売上高成長率') / 100 if latest_data.get('売上高成長率') is not None else None,
-            '四半期成長率': latest_data.get('四半期成長率') / 100 if latest_data.get('四半期成長率') is not None else None,
-            '経常益利回り': latest_data.get('経常益利回り') / 100 if latest_data.get('経常益利回り') is not None else None,
-            '四半期割安率_四半期平均': latest_data.get('四半期割安率_四半期平均') / 100 if latest_data.get('四半期割安率_四半期平均') is not None else None,
-            '四半期割安率_前年同期ベース': latest_data.get('四半期割安率_前年同期ベース') / 100 if latest_data.get('四半期割安率_前年同期ベース') is not None else None,
-            '四半期割安率_前四半期': latest_data.get('四半期割安率_前四半期') / 100 if latest_data.get('四半期割安率_前四半期') is not None else None,
-            '四半期成長率株価相関': latest_data.get('四半期成長率株価相関'),
-            '経常益利回り株価相関': latest_data.get('経常益利回り株価相関')
-        }
+        # 株価情報と株価相関を追加し、最新データを取り出す
+        with profile_stage('指標計算'):
+            attach_stock_prices(data_with_growth, weekly_data)
+            result, latest_data = build_summary_row(code, name, data_with_growth)
+        record_quarterly_history(code, data_with_growth)
         
         print(f"{code}: 最新データ取得完了 ({latest_data.get('決算期')} {latest_data.get('四半期')})")
         if latest_data.get('始値'):
@@ -120,47 +223,688 @@ def process_single_stock(code: str, name: str = "") -> Optional[Dict]:
         return None
 
 
-def create_batch_summary(results: List[Dict], output_file: str = "data/output/batch_summary.csv"):
-    """バッチ処理結果をCSVファイルに保存"""
+def print_summary_preview(results: List[Dict], output_file: str, total: Optional[int] = None) -> None:
+    """保存したサマリーの件数と先頭の数銘柄を表示（全件は出力ファイルで確認する）"""
+    print(f"\n=== バッチ処理結果 ===")
+    print(f"処理完了銘柄数: {len(results) if total is None else total}件")
+    print(f"保存先: {output_file}")
+    
+    preview = pd.DataFrame(results[:SUMMARY_PREVIEW_ROWS], columns=SUMMARY_COLUMNS)
+    for col in NUMERIC_COLUMNS:
+        preview[col] = pd.to_numeric(preview[col], errors='coerce')
+    print(f"\n=== データプレビュー（先頭{len(preview)}件） ===")
+    with pd.option_context('display.max_columns', None, 'display.width', None,
+                           'display.float_format', lambda x: '%.2f' % x if pd.notna(x) else ''):
+        print(preview.to_string(index=False))
+
+
+def create_batch_summary(results: List[Dict], output_file: str = DEFAULT_SUMMARY_PATH,
+                         fmt: str = 'csv') -> Optional[str]:
+    """バッチ処理結果をまとめて保存（保存先を返す）"""
     if not results:
         print("保存するデータがありません")
         return None
     
-    # データフレームを作成
-    df = pd.DataFrame(results)
+    writer = SummaryWriter(output_file, fmt)
+    writer.add_all(results)
+    output_file = writer.close()
+    print_summary_preview(results, output_file)
+    return output_file
+
+
+def create_screening_report(results: Iterable[Dict], filters: List[ScreeningFilter], top_n: int,
+                            output_file: str = DEFAULT_SCREENING_PATH) -> Optional[pd.DataFrame]:
+    """バッチ結果を横断的に順位付けしてCSVに保存し、総合スコアの上位銘柄を表示"""
+    return write_screening_report(ScreeningEngine.from_rows(results, filters=filters), top_n, output_file)
+
+
+def write_screening_report(engine: ScreeningEngine, top_n: int,
+                           output_file: str = DEFAULT_SCREENING_PATH,
+                           order: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """スクリーニングエンジンの全銘柄のスコアをCSVに保存し、総合スコアの上位銘柄を表示
     
-    # 数値列の型を設定
-    numeric_columns = [
-        '売上高', '経常益', '資本合計(純資産)', '売上高成長率', '四半期成長率', 
-        '経常益利回り', '四半期割安率_四半期平均', '四半期割安率_前年同期ベース', '四半期割安率_前四半期',
-        '始値', '四半期成長率株価相関', '経常益利回り株価相関'
-    ]
-    for col in numeric_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    orderを指定すると行をその銘柄順（codelist.csvの並び順など）に並べて保存する。
+    """
+    if not len(engine):
+        return None
     
-    # 出力ディレクトリを作成
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    df = engine.scores()
+    if order is not None:
+        position = {code: i for i, code in enumerate(order)}
+        df = df.sort_values('コード', key=lambda codes: codes.map(position), kind='stable', ignore_index=True)
     
-    # CSVに保存
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
     df.to_csv(output_file, index=False, encoding='utf-8-sig')
     
-    print(f"\n=== バッチ処理結果 ===")
-    print(f"処理完了銘柄数: {len(df)}件")
+    conditions = ', '.join(str(f) for f in engine.filters) or 'なし'
+    print(f"\n=== スクリーニング結果（条件: {conditions}） ===")
+    print(f"条件一致: {int(df['条件一致'].sum())}/{len(df)}銘柄")
     print(f"保存先: {output_file}")
-    
-    # サマリー表示
-    print("\n=== データプレビュー ===")
-    pd.set_option('display.max_columns', None)
-    pd.set_option('display.width', None)
-    pd.set_option('display.float_format', lambda x: '%.2f' % x if pd.notna(x) else '')
-    print(df.to_string(index=False))
+    for rank, row in enumerate(engine.top(top_n), 1):
+        print(f"{rank:3d}. {row['コード']} {row['銘柄名']}: 総合スコア {row['総合スコア']:.3f}")
     
     return df
 
 
+def run_batch_serial(code_list: List[Dict[str, str]], client: Optional[HttpClient] = None,
+                     on_result: Optional[ResultCallback] = None) -> int:
+    """銘柄を1つずつ順番に処理（銘柄間で3秒待機）し、処理できた銘柄数を返す"""
+    succeeded = 0
+    total_codes = len(code_list)
+    
+    for i, stock_info in enumerate(code_list, 1):
+        code = stock_info['code']
+        name = stock_info['name']
+        print(f"\n[{i}/{total_codes}] 処理中...")
+        
+        result = process_single_stock(code, name, client=client, page=stock_info.pop('page', None))
+        if on_result:
+            on_result(stock_info, result)
+        if result:
+            succeeded += 1
+        
+        # サーバー負荷軽減のため待機（最後の銘柄以外）
+        if i < total_codes:
+            print("次の銘柄処理まで3秒待機...")
+            time.sleep(3)
+    
+    return succeeded
+
+
+async def run_batch_async(code_list: List[Dict[str, str]], client: HttpClient,
+                          concurrency: int = DEFAULT_CONCURRENCY,
+                          on_result: Optional[ResultCallback] = None) -> int:
+    """複数銘柄を並行処理し（流量はクライアントのホスト別レートリミッタで制御）、処理できた銘柄数を返す"""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    total_codes = len(code_list)
+    completed = 0
+    
+    async def run_one(stock_info: Dict[str, str]) -> bool:
+        nonlocal completed
+        async with semaphore:
+            result = await asyncio.to_thread(
+                process_single_stock, stock_info['code'], stock_info['name'], client, stock_info.pop('page', None)
+            )
+        completed += 1
+        print(f"\n[{completed}/{total_codes}] {stock_info['code']} 処理終了")
+        if on_result:
+            on_result(stock_info, result)
+        # 結果の行はon_resultに渡したら保持しない
+        return result is not None
+    
+    return sum(await asyncio.gather(*(run_one(stock_info) for stock_info in code_list)))
+
+
+def parse_stock_pages(html: str, weekly_pages: List[Tuple[int, str]]) -> Tuple[int, List[Dict], List[Dict]]:
+    """財務ページと週足ページを解析（パイプラインではプロセスプールで実行、週足は重複除去前）"""
+    finance_page = parse_finance_page(html)
+    return finance_page.fiscal_year_end_month, finance_page.quarterly_rows, parse_weekly_stock_pages(weekly_pages)
+
+
+def _start_stage(name: str, func: Callable[[Dict], Optional[Dict]], in_queue: queue.Queue,
+                 out_queue: Optional[queue.Queue], workers: int,
+                 on_drop: Optional[Callable[[Dict], None]] = None) -> List[threading.Thread]:
+    """入力キューの要素にfuncを適用して出力キューへ渡すワーカースレッドを起動
+    
+    funcがNoneを返すか例外を送出した要素はon_dropに渡して破棄する。
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+    
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _STAGE_END:
+                with lock:
+                    remaining[0] -= 1
+                    is_last = remaining[0] == 0
+                # 最後のワーカーだけが次のステージに終了を伝え、それ以外は同じステージの仲間に回す
+                if is_last:
+                    if out_queue is not None:
+                        out_queue.put(_STAGE_END)
+                else:
+                    in_queue.put(_STAGE_END)
+                return
+            
+            try:
+                # --profile指定時はステージ名で計測（取得ステージなどは内側の段階に分かれる）
+                with profile_code(item['code']), code_deadline(item.get('deadline')), \
+                        profile_stage(f"{name}ステージ"):
+                    result = func(item)
+            except Exception as e:
+                print(f"{item['code']}: {name}ステージでエラーが発生: {e}")
+                result = None
+            
+            if out_queue is None:
+                continue
+            if result is None:
+                if on_drop:
+                    on_drop(item)
+                continue
+            # 出力キューが満杯なら空くまで待つ（上流ステージへのバックプレッシャー）
+            out_queue.put(result)
+    
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_batch_pipeline(code_list: Iterable[Dict[str, str]], client: HttpClient,
+                       concurrency: int = DEFAULT_CONCURRENCY,
+                       queue_size: int = DEFAULT_QUEUE_SIZE,
+                       on_result: Optional[ResultCallback] = None,
+                       parse_workers: Optional[int] = None) -> int:
+    """取得→HTML解析→PDF解析→指標計算→書き出しの各ステージを上限付きキューでつないで処理
+    
+    結果の行は書き出しステージでon_resultに渡し、処理できた銘柄数を返す。
+    HTMLとPDFの解析はparse_workers個（既定はCPUコア数）のプロセスプールで実行し、取得処理を
+    止めないようにする。code_listはイテレータでもよく、取得ステージが空くたびに次の銘柄を読む。
+    """
+    cpu_workers = parse_workers or os.cpu_count() or 1
+    parse_pool = ProcessPoolExecutor(max_workers=cpu_workers, mp_context=get_context('spawn'))
+    download_pool = ThreadPoolExecutor(max_workers=concurrency)
+    
+    code_queue = queue.Queue(maxsize=queue_size)
+    html_queue = queue.Queue(maxsize=queue_size)
+    pdf_queue = queue.Queue(maxsize=queue_size)
+    metrics_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    
+    total_codes = len(code_list) if isinstance(code_list, list) else None
+    succeeded = 0
+    
+    def fetch_stage(item: Dict) -> Optional[Dict]:
+        code = item['code']
+        print(f"\n=== {code} ({item['name']}) の取得開始 ===")
+        # 処理期限は取得の開始から数え、以降のステージでも同じ期限を使う
+        item['deadline'] = start_code_deadline()
+        with code_deadline(item['deadline']):
+            if item.get('page') is None:
+                item['html'] = fetch_kabutan_page(code, client=client)
+                if not item['html']:
+                    print(f"{code}: ページの取得に失敗")
+                    return None
+            item['weekly_pages'] = fetch_weekly_stock_pages(code, client=client, pages=weekly_pages_to_fetch(code))
+        item['weekly_depth'] = max((page for page, _ in item['weekly_pages']), default=0)
+        return item
+    
+    def html_stage(item: Dict) -> Optional[Dict]:
+        page = item.pop('page', None)
+        if page is None:
+            future = parse_pool.submit(parse_stock_pages, item.pop('html'), item.pop('weekly_pages'))
+            fiscal_year_end_month, quarterly_data, weekly_data = future.result()
+        else:
+            # 増分モードの判定で解析済みの財務ページは週足ページだけを解析する
+            future = parse_pool.submit(parse_weekly_stock_pages, item.pop('weekly_pages'))
+            fiscal_year_end_month, quarterly_data, weekly_data = (page.fiscal_year_end_month, page.quarterly_rows,
+                                                                  future.result())
+        if not quarterly_data:
+            print(f"{item['code']}: 四半期データが見つかりません")
+            return None
+        print(f"{item['code']}: 決算月 = {fiscal_year_end_month}月")
+        item['fiscal_year_end_month'] = fiscal_year_end_month
+        item['quarterly_data'] = quarterly_data
+        # 週足株価ストアに追記（古い発表日が履歴より前なら深いページをここで取得）
+        item['weekly_data'] = update_weekly_prices(item['code'], weekly_data, item.pop('weekly_depth'),
+                                                   oldest_announcement_date(quarterly_data), client=client)
+        return item
+    
+    def pdf_stage(item: Dict) -> Dict:
+        attach_balance_sheet_data(item['quarterly_data'], client=client, parallel=True,
+                                  download_pool=download_pool, parse_pool=parse_pool,
+                                  code=item['code'])
+        return item
+    
+    def metrics_stage(item: Dict) -> Dict:
+        data_with_growth = calculate_qoq_growth_rate(item['quarterly_data'], item['fiscal_year_end_month'])
+        attach_stock_prices(data_with_growth, item['weekly_data'])
+        item['result'], latest_data = build_summary_row(item['code'], item['name'], data_with_growth)
+        record_quarterly_history(item['code'], data_with_growth)
+        print(f"{item['code']}: 最新データ取得完了 ({latest_data.get('決算期')} {latest_data.get('四半期')})")
+        return item
+    
+    def write_stage(item: Dict) -> None:
+        nonlocal succeeded
+        succeeded += 1
+        finish_code(item['code'], True)
+        progress = f"{succeeded}/{total_codes}" if total_codes is not None else succeeded
+        print(f"\n[{progress}] {item['code']} 処理終了")
+        if on_result:
+            on_result(item, item['result'])
+    
+    def drop(item: Dict) -> None:
+        finish_code(item['code'], False)
+        if on_result:
+            on_result(item, None)
+    
+    metrics = get_default_metrics()
+    if metrics:
+        for stage, stage_queue in [('取得', code_queue), ('HTML解析', html_queue), ('PDF解析', pdf_queue),
+                                   ('指標計算', metrics_queue), ('書き出し', write_queue)]:
+            metrics.set_callback('qq_queue_depth', stage_queue.qsize, {'stage': stage})
+    
+    threads = []
+    threads += _start_stage('取得', fetch_stage, code_queue, html_queue, concurrency, drop)
+    threads += _start_stage('HTML解析', html_stage, html_queue, pdf_queue, cpu_workers, drop)
+    threads += _start_stage('PDF解析', pdf_stage, pdf_queue, metrics_queue, concurrency, drop)
+    threads += _start_stage('指標計算', metrics_stage, metrics_queue, write_queue, 2, drop)
+    threads += _start_stage('書き出し', write_stage, write_queue, None, 1)
+    
+    try:
+        for index, stock_info in enumerate(code_list):
+            code_queue.put({'index': index, 'code': stock_info['code'], 'name': stock_info['name'],
+                            'page': stock_info.pop('page', None)})
+        code_queue.put(_STAGE_END)
+        for thread in threads:
+            thread.join()
+    finally:
+        download_pool.shutdown()
+        parse_pool.shutdown()
+    
+    return succeeded
+
+
+def load_previous_summary(output_file: str = DEFAULT_SUMMARY_PATH) -> Dict[str, Dict]:
+    """前回のbatch_summary.csvを証券コードごとの行として読み込み"""
+    if not os.path.exists(output_file):
+        return {}
+    try:
+        if output_file.endswith('.parquet'):
+            df = pd.read_parquet(output_file)
+        else:
+            df = pd.read_csv(output_file, encoding='utf-8-sig',
+                             dtype={'コード': str, '銘柄名': str, '株価日付': str, '発表日': str, '決算期': str, '四半期': str,
+                                    '部分結果': str})
+    except Exception as e:
+        print(f"前回のサマリー読み込みエラー: {e}")
+        return {}
+    df = df.astype(object).where(pd.notna(df), None)
+    return {row['コード']: row for row in df.to_dict('records')}
+
+
+def detect_changed_codes(code_list: List[Dict[str, str]], state: Dict[str, Dict],
+                         previous_rows: Dict[str, Dict], client: HttpClient,
+                         workers: int = 1) -> Tuple[List[Dict[str, str]], Dict[str, Dict], Dict[str, Dict]]:
+    """財務ページの開示一覧を前回と比較し、再計算が必要な銘柄を判定
+    
+    (再計算する銘柄, 前回の行を再利用する銘柄の行, 今回の開示情報) を返す。
+    再計算する銘柄には判定で解析した財務ページを'page'として付け、処理時に取得し直さない
+    （処理し直す場合は取得し直す）。
+    """
+    def check(stock_info: Dict[str, str]) -> Tuple[Dict[str, str], Optional[FinancePage]]:
+        html = fetch_kabutan_page(stock_info['code'], client=client)
+        if not html:
+            return stock_info, None
+        return stock_info, parse_finance_page(html)
+    
+    changed = []
+    reused = {}
+    signatures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for stock_info, page in pool.map(check, code_list):
+            code = stock_info['code']
+            signature = disclosure_signature(page.quarterly_rows) if page else None
+            previous_row = previous_rows.get(code)
+            if signature:
+                signatures[code] = signature
+            
+            # 開示に変化がなく、株価も取得済みで部分結果でない銘柄は前回の行をそのまま使う
+            if (signature and previous_row and state.get(code) == signature
+                    and previous_row.get('始値') is not None and not previous_row.get('部分結果')):
+                row = dict(previous_row)
+                row['銘柄名'] = stock_info['name']
+                reused[code] = row
+            else:
+                changed.append(dict(stock_info, page=page))
+    
+    return changed, reused, signatures
+
+
+def register_store_metrics(metrics) -> None:
+    """HTTPキャッシュとPDF抽出結果ストアの件数をメトリクスに登録（出力のたびに現在値を読む）"""
+    def cache_count(name: str) -> Callable[[], float]:
+        return lambda: getattr(get_default_cache(), name, 0)
+    
+    def cache_hit_ratio() -> float:
+        cache = get_default_cache()
+        if cache is None:
+            return float('nan')
+        total = cache.hits + cache.revalidated + cache.misses
+        return (cache.hits + cache.revalidated) / total if total else float('nan')
+    
+    def store_count(name: str) -> Callable[[], float]:
+        return lambda: getattr(get_default_pdf_store(), name, 0)
+    
+    for result, name in [('hit', 'hits'), ('revalidated', 'revalidated'), ('miss', 'misses')]:
+        metrics.set_callback('qq_cache_requests_total', cache_count(name), {'result': result})
+    metrics.set_callback('qq_cache_hit_ratio', cache_hit_ratio)
+    for result, name in [('hit', 'hits'), ('miss', 'misses')]:
+        metrics.set_callback('qq_pdf_store_requests_total', store_count(name), {'result': result})
+
+
+def parse_worker_count(args: argparse.Namespace) -> int:
+    """--pipeline時の解析プロセス数（まとめて起動したワーカーはCPUコアを等分する）"""
+    cpu_count = os.cpu_count() or 1
+    if args.queue_worker is not None and args.workers > 0:
+        return max(1, cpu_count // args.workers)
+    return cpu_count
+
+
+def run_batch_mode(code_list: Iterable[Dict[str, str]], client: HttpClient, args: argparse.Namespace,
+                   on_result: Optional[ResultCallback] = None) -> int:
+    """コマンドラインで指定されたモードで銘柄リストを1回処理し、処理できた銘柄数を返す
+    
+    --pipeline時は銘柄リストにイテレータも渡せる。
+    """
+    if args.pipeline:
+        parse_workers = parse_worker_count(args)
+        print(f"パイプラインモード: 同時{args.concurrency}銘柄取得, 解析プロセス{parse_workers}個 "
+              f"(kabutan.jp {args.kabutan_rate}件/秒, tdnet-pdf.kabutan.jp {args.tdnet_rate}件/秒)")
+        return run_batch_pipeline(code_list, client, args.concurrency, args.queue_size, on_result, parse_workers)
+    if args.async_mode:
+        print(f"並行処理モード: 同時{args.concurrency}銘柄 "
+              f"(kabutan.jp {args.kabutan_rate}件/秒, tdnet-pdf.kabutan.jp {args.tdnet_rate}件/秒)")
+        return asyncio.run(run_batch_async(code_list, client, args.concurrency, on_result))
+    return run_batch_serial(code_list, client, on_result)
+
+
+def run_batch(code_list: List[Dict[str, str]], client: HttpClient, args: argparse.Namespace,
+              on_result: Optional[ResultCallback] = None) -> int:
+    """銘柄リストを処理し、失敗した銘柄は全銘柄の後に--requeue-passes回まで処理し直す
+    
+    結果の行はon_resultに渡すだけで保持せず、処理できた銘柄数を返す。
+    処理し直す前の失敗はon_resultに渡さない（最後の回の失敗だけを記録する）。
+    """
+    succeeded = 0
+    targets = code_list
+    for attempt in range(args.requeue_passes + 1):
+        is_last = attempt == args.requeue_passes
+        failed = []
+        
+        def record(stock_info: Dict[str, str], result: Optional[Dict]) -> None:
+            if result is None and not is_last:
+                failed.append(stock_info['code'])
+                return
+            if on_result:
+                on_result(stock_info, result)
+        
+        succeeded += run_batch_mode(targets, client, args, on_result=record)
+        if not failed:
+            break
+        failed_codes = set(failed)
+        targets = [info for info in targets if info['code'] in failed_codes]
+        print(f"\n失敗した{len(targets)}銘柄を最後にもう一度処理します（{attempt + 1}/{args.requeue_passes}回目）")
+    
+    return succeeded
+
+
+def close_run_resources() -> None:
+    """実行の終わりに履歴の書き出し・計測結果の保存・メトリクスの停止を行う"""
+    history_store = get_default_history_store()
+    if history_store:
+        try:
+            history_store.flush()
+        except Exception as e:
+            print(f"警告: 履歴の書き出しに失敗しました: {e}")
+    profiler = get_default_profiler()
+    if profiler:
+        print("\n" + profiler.close())
+        print(f"段階ごとの計測を保存しました: {profiler.directory}")
+    stop_live_metrics()
+
+
+def run_queue_worker(work_queue: WorkQueue, client: HttpClient, args: argparse.Namespace,
+                     metrics=None) -> int:
+    """作業キューから銘柄を借りて処理し、結果をキューに書き込む（処理した銘柄数を返す）
+    
+    ホストごとのレート予算は生存中のワーカー数で等分する。他のワーカーが処理中の銘柄しか
+    残っていなければ、止まったワーカーの借用期限が切れたら引き継げるように待つ。
+    --pipeline時はパイプラインを1つだけ起動し、借りた銘柄を順に流し込む。
+    """
+    worker = worker_id()
+    processed = []
+    claimed_total = 0
+    finished = threading.Condition()
+    
+    def record(stock_info: Dict[str, str], result: Optional[Dict]) -> None:
+        code = stock_info['code']
+        with finished:
+            processed.append(code)
+            finished.notify_all()
+        if result:
+            work_queue.complete(code, result)
+        elif work_queue.fail(code, "処理に失敗") == 'pending':
+            print(f"{code}: 処理に失敗したため作業キューに戻しました")
+        if metrics:
+            metrics.code_finished(result is not None)
+    
+    def share_budget(active_workers: int) -> None:
+        client.rate_limiter.set_share(1.0 / active_workers)
+    
+    # 同じマシンでまとめて起動したワーカーは、最初から起動した数で予算を分ける
+    expected_workers = args.workers if args.queue_worker is not None else 1
+    keeper = LeaseKeeper(work_queue, worker, args.lease_seconds, share_budget, expected_workers)
+    # 借りたまま処理が終わっていない銘柄数の上限（--pipeline時はステージ間キューの深さ）
+    max_in_flight = args.claim_size or (args.queue_size if args.pipeline else DEFAULT_CLAIM_SIZE)
+    
+    def claim_batches() -> Iterator[List[Dict[str, str]]]:
+        nonlocal claimed_total
+        while True:
+            # 残りの銘柄（未処理と借用中）をワーカー数で等分した数までしか借りておかない
+            # （パイプラインが先読みで借り続けて、1つのワーカーが全部借りないように）
+            workers = max(expected_workers, work_queue.active_workers(args.lease_seconds))
+            limit = min(max_in_flight, work_queue.share(workers))
+            with finished:
+                finished.wait_for(lambda: claimed_total - len(processed) < limit)
+                in_flight = claimed_total - len(processed)
+            claimed = work_queue.claim(worker, limit - in_flight, args.lease_seconds, workers)
+            if not claimed:
+                if claimed_total > len(processed):
+                    # 処理中の銘柄が失敗して作業キューに戻るかもしれないため、終わるまで短い間隔で確認する
+                    time.sleep(1.0)
+                    continue
+                expiry = work_queue.next_lease_expiry()
+                if expiry is None:
+                    return
+                time.sleep(min(max(expiry - time.time(), 1.0), args.lease_seconds / 3))
+                continue
+            print(f"\n作業キューから{len(claimed)}銘柄を借用 ({worker})")
+            claimed_total += len(claimed)
+            yield claimed
+    
+    keeper.start()
+    try:
+        # 失敗した銘柄は作業キューに戻し、未処理の銘柄の後で借り直す
+        if args.pipeline:
+            run_batch_mode(itertools.chain.from_iterable(claim_batches()), client, args, on_result=record)
+        else:
+            for claimed in claim_batches():
+                run_batch_mode(claimed, client, args, on_result=record)
+    finally:
+        keeper.stop()
+    return len(processed)
+
+
+def merge_queue_results(work_queue: WorkQueue, args: argparse.Namespace) -> Optional[str]:
+    """作業キューの完了した結果を銘柄リストの順にサマリーとして書き出す"""
+    counts = work_queue.counts()
+    print(f"\n作業キュー: 完了{counts['done']}件 / 失敗{counts['failed']}件 / "
+          f"未処理{counts['pending']}件 / 処理中{counts['leased']}件")
+    
+    writer = SummaryWriter(summary_path(args.summary_format), args.summary_format)
+    preview = []
+    for row in work_queue.results():
+        writer.add(row)
+        if len(preview) < SUMMARY_PREVIEW_ROWS:
+            preview.append(row)
+    total = len(writer)
+    output_file = writer.close()
+    if not output_file:
+        print("\n処理できた銘柄がありませんでした")
+        return None
+    
+    print_summary_preview(preview, output_file, total)
+    if args.screen:
+        create_screening_report(work_queue.results(), args.filters, args.top)
+    return output_file
+
+
+def run_local_workers(workers: int) -> List[int]:
+    """同じ引数でこのスクリプトをワーカーとしてworkers個起動し、終了コードを返す"""
+    command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:]
+    processes = [subprocess.Popen(command + ['--queue-worker', str(index)]) for index in range(workers)]
+    return [process.wait() for process in processes]
+
+
 def main():
     """メイン処理"""
+    parser = argparse.ArgumentParser(description="codelist.csvの銘柄を一括処理")
+    parser.add_argument('--no-cache', action='store_true', help="HTTPキャッシュ・PDF抽出結果ストア・週足株価ストアを使用しない")
+    parser.add_argument('--keep-pdf', action='store_true', help="PDF本体も抽出結果ストアに保存する")
+    parser.add_argument('--http2', action='store_true', help="HTTP/2で接続する（httpx[http2]が必要）")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help="ホストごとの接続プールサイズ")
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help="複数銘柄を並行処理する（3秒待機の代わりにホスト別レート制限を使用）")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="取得・解析・計算をステージに分けて並行処理する（解析はプロセスプールで実行）")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="--async/--pipeline時の同時処理銘柄数")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="--pipeline時のステージ間キューの上限")
+    parser.add_argument('--incremental', action='store_true',
+                        help="前回から新しい開示がない銘柄は前回のサマリー行を再利用する")
+    parser.add_argument('--resume', action='store_true',
+                        help="ジャーナルから前回の実行を再開する（完了済みの銘柄を飛ばし、失敗した銘柄を再試行）")
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH, help="銘柄ごとの結果を記録するジャーナルファイル")
+    parser.add_argument('--kabutan-rate', type=float, default=DEFAULT_HOST_RATES['kabutan.jp'][0],
+                        help="kabutan.jpへの毎秒リクエスト数の上限")
+    parser.add_argument('--tdnet-rate', type=float, default=DEFAULT_HOST_RATES['tdnet-pdf.kabutan.jp'][0],
+                        help="tdnet-pdf.kabutan.jpへの毎秒リクエスト数の上限")
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help="通信エラーや一時的なエラー（429・503など）で1リクエストを再試行する回数")
+    parser.add_argument('--requeue-passes', type=int, default=1,
+                        help="失敗した銘柄を全銘柄の処理の後に処理し直す回数")
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                        help="接続の確立を待つ秒数")
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="応答の読み取りが止まってから打ち切るまでの秒数")
+    parser.add_argument('--total-timeout', type=float, default=DEFAULT_TOTAL_TIMEOUT,
+                        help="1リクエストの本文を受け取り終えるまでの上限秒数")
+    parser.add_argument('--code-deadline', type=float, default=DEFAULT_CODE_DEADLINE,
+                        help="1銘柄の財務ページ・週足・PDFの取得をまとめた持ち時間（秒、0で無制限）。"
+                             "過ぎた場合は取得できた分だけで部分結果として出力する")
+    parser.add_argument('--hedge-after', type=float,
+                        help="この秒数以内に応答がないリクエストを重ねて送り、先に届いた方を使う")
+    parser.add_argument('--history', action='store_true',
+                        help="全四半期の指標を決算期ごとのParquet履歴に追記する（pyarrowが必要）")
+    parser.add_argument('--screen', action='store_true',
+                        help="四半期成長率・経常益利回り・四半期割安率で銘柄を順位付けする")
+    parser.add_argument('--top', type=int, default=20, help="--screen時に表示する上位銘柄数")
+    parser.add_argument('--filter', dest='filters', action='append', default=[], type=parse_filter,
+                        help="--screen時の条件（例: 四半期成長率>=0.1、複数指定可）")
+    parser.add_argument('--profile', action='store_true',
+                        help="銘柄・処理段階ごとの時間・CPU時間・転送量・確保メモリを記録する")
+    parser.add_argument('--profile-slowest', type=int, default=0,
+                        help="--profile時に処理時間が長い上位N銘柄のcProfile・tracemallocの結果を保存する")
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR, help="--profile時の出力先ディレクトリ")
+    parser.add_argument('--metrics-file',
+                        help="処理状況のメトリクスをPrometheusのテキスト形式で定期的に書き出すファイル")
+    parser.add_argument('--metrics-port', type=int,
+                        help="処理状況のメトリクスを http://127.0.0.1:<port>/metrics で公開する")
+    parser.add_argument('--metrics-interval', type=float, default=DEFAULT_METRICS_INTERVAL,
+                        help="--metrics-fileの書き出し間隔（秒）")
+    parser.add_argument('--summary-format', choices=list(SUMMARY_FORMATS), default='csv',
+                        help="サマリーの出力形式（csv.gzはgzip圧縮、parquetはpyarrowが必要）")
+    parser.add_argument('--queue', nargs='?', const=DEFAULT_QUEUE_PATH,
+                        help="作業キュー（SQLite）から銘柄を借りて処理するワーカーとして実行する"
+                             "（ファイルを共有すれば複数マシンで分担できる。省略時のパスは " + DEFAULT_QUEUE_PATH + "）")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="作業キューを作り直してワーカーをN個起動し、全員の終了後にサマリーを作成する")
+    parser.add_argument('--merge', action='store_true',
+                        help="作業キューの完了した結果からサマリーを作成して終了する")
+    parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="作業キューの借用期限（秒）。止まったワーカーの銘柄はこの時間の後に引き継がれる")
+    parser.add_argument('--claim-size', type=int,
+                        help="作業キューから借りておく銘柄数の上限（1回に借りる数は残りの銘柄数をワーカー数で"
+                             f"割った数。既定は--pipeline時は--queue-size、それ以外は{DEFAULT_CLAIM_SIZE}）")
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="作業キューで1銘柄を再試行する回数の上限")
+    parser.add_argument('--queue-worker', type=int, help=argparse.SUPPRESS)
+    add_correlation_arguments(parser)
+    args = parser.parse_args()
+    try:
+        set_default_correlation_settings(correlation_settings_from_args(args))
+        check_filter_columns(args.filters)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    queue_path = args.queue or DEFAULT_QUEUE_PATH
+    queue_mode = args.queue is not None or args.workers > 0 or args.merge
+    if queue_mode and args.incremental:
+        parser.error("--incrementalは作業キュー（--queue/--workers/--merge）と併用できません")
+    if args.queue_worker is not None:
+        # 同じマシンで起動したワーカーごとに出力先を分ける
+        if args.metrics_port is not None:
+            args.metrics_port += args.queue_worker
+        if args.metrics_file:
+            args.metrics_file = f"{args.metrics_file}.{args.queue_worker}"
+        args.profile_dir = os.path.join(args.profile_dir, f"worker{args.queue_worker}")
+    elif args.merge:
+        work_queue = WorkQueue(queue_path)
+        merge_queue_results(work_queue, args)
+        work_queue.close()
+        return
+    elif args.workers > 0:
+        code_list = load_code_list()
+        if not code_list:
+            print("処理する証券コードがありません")
+            return
+        work_queue = WorkQueue(queue_path, max_attempts=args.max_attempts)
+        added = work_queue.enqueue(code_list, reset=not args.resume)
+        if args.resume:
+            print(f"作業キューを再開: 新規{added}件 / 失敗から再試行{work_queue.retry_failed()}件")
+        print(f"作業キュー {queue_path} に{len(code_list)}銘柄を登録し、ワーカーを{args.workers}個起動します")
+        exit_codes = run_local_workers(args.workers)
+        if any(exit_codes):
+            print(f"警告: 異常終了したワーカーがあります（終了コード: {exit_codes}）")
+        merge_queue_results(work_queue, args)
+        work_queue.close()
+        return
+    
+    # 全銘柄で1つのクライアント（接続プール）を共有
+    rate_limiter = None
+    pool_size = args.pool_size
+    if args.async_mode or args.pipeline or queue_mode:
+        rate_limiter = HostRateLimiter(host_rates(
+            kabutan=(args.kabutan_rate, max(1.0, args.kabutan_rate * 2)),
+            tdnet_pdf=(args.tdnet_rate, max(1.0, args.tdnet_rate * 2)),
+        ))
+        if args.async_mode or args.pipeline:
+            pool_size = max(pool_size, args.concurrency)
+    client = HttpClient(pool_size=pool_size, timeout=args.read_timeout, http2=args.http2,
+                        rate_limiter=rate_limiter, retry_policy=RetryPolicy(max_retries=args.max_retries),
+                        connect_timeout=args.connect_timeout, total_timeout=args.total_timeout,
+                        hedge_after=args.hedge_after)
+    set_default_code_deadline(args.code_deadline)
+    set_default_client(client)
+    
+    if args.no_cache:
+        set_default_cache(None)
+        set_default_pdf_store(None)
+        set_default_price_store(None)
+    elif args.keep_pdf:
+        get_default_pdf_store().keep_pdf_bytes = True
+    if args.history:
+        enable_history_store()
+    if args.profile:
+        enable_profiler(args.profile_dir, slowest=args.profile_slowest)
+    metrics = None
+    if args.metrics_file or args.metrics_port is not None:
+        metrics = enable_live_metrics(args.metrics_file, args.metrics_port, args.metrics_interval)
+        register_store_metrics(metrics)
+    
     print("株探バッチ処理ツール開始")
     print("codelist.csvの銘柄を一括処理し、最新データをまとめてCSV出力します")
     
@@ -170,33 +914,127 @@ def main():
         print("処理する証券コードがありません")
         return
     
-    print(f"処理対象: {code_list}")
-    
-    # 各銘柄を処理
-    results = []
+    print(f"処理対象: {len(code_list)}銘柄")
     total_codes = len(code_list)
     
-    for i, stock_info in enumerate(code_list, 1):
-        code = stock_info['code']
-        name = stock_info['name']
-        print(f"\n[{i}/{total_codes}] 処理中...")
-        
-        result = process_single_stock(code, name)
+    if queue_mode:
+        work_queue = WorkQueue(queue_path, max_attempts=args.max_attempts)
+        # 単独で起動したワーカーは銘柄を登録してから借りる（登録済みの銘柄はそのまま）
+        if args.queue_worker is None:
+            work_queue.enqueue(code_list)
+        if metrics:
+            counts = work_queue.counts()
+            metrics.set_target(counts['pending'] + counts['leased'])
+        try:
+            processed = run_queue_worker(work_queue, client, args, metrics)
+        except KeyboardInterrupt:
+            print("\n中断しました。借りていた銘柄は借用期限の後に他のワーカーが引き継ぎます")
+            return
+        finally:
+            close_run_resources()
+            work_queue.close()
+        print(f"\nワーカー終了: {processed}銘柄を処理しました")
+        if args.queue_worker is None:
+            print(f"全ワーカーの終了後に --queue {queue_path} --merge でサマリーを作成します")
+        return
+    output_file = summary_path(args.summary_format)
+    
+    # 再開時はジャーナルで完了済みの銘柄を飛ばし、失敗した銘柄と未処理の銘柄を処理する
+    if args.resume:
+        journal_results, journal_failed = load_journal(args.journal)
+        targets = [info for info in code_list if info['code'] not in journal_results]
+        retry_count = sum(1 for info in targets if info['code'] in journal_failed)
+        print(f"再開モード: 完了済み{len(code_list) - len(targets)}件をスキップ / "
+              f"失敗{retry_count}件を再試行 / 未処理{len(targets) - retry_count}件")
+    else:
+        targets = code_list
+    journal = BatchJournal(args.journal, reset=not args.resume)
+    
+    # 増分モードでは新しい開示があった銘柄だけを処理する
+    reused = {}
+    if args.incremental:
+        if client.rate_limiter is None:
+            client.rate_limiter = HostRateLimiter()
+        state = load_batch_state()
+        targets, reused, signatures = detect_changed_codes(
+            targets, state, load_previous_summary(output_file), client,
+            args.concurrency if (args.async_mode or args.pipeline) else 1
+        )
+        print(f"増分モード: 再計算{len(targets)}件 / 前回結果を再利用{len(reused)}件")
+    
+    # 完了した銘柄の行は途中経過ファイルに追記し、--screen時はスクリーニングエンジンにも1行ずつ渡す
+    # （全銘柄の行をメモリに保持しない）
+    writer = SummaryWriter(output_file, args.summary_format)
+    engine = ScreeningEngine(filters=args.filters) if args.screen else None
+    partial = 0
+    add_lock = threading.Lock()
+    
+    def add_row(row: Dict) -> None:
+        nonlocal partial
+        writer.add(row)
+        with add_lock:
+            if engine is not None:
+                engine.update(row)
+            if row.get('部分結果'):
+                partial += 1
+    
+    # 再開前の分と再利用した行を先に書く
+    if args.resume:
+        for row in journal_results.values():
+            add_row(row)
+        del journal_results
+    for row in reused.values():
+        add_row(row)
+    print(f"途中経過: {writer.partial_file}")
+    
+    # 各銘柄を処理（1銘柄ごとにジャーナルと途中経過ファイルへ記録）
+    def record(stock_info: Dict[str, str], result: Optional[Dict]) -> None:
+        journal.record(stock_info['code'], result)
         if result:
-            results.append(result)
-        
-        # サーバー負荷軽減のため待機（最後の銘柄以外）
-        if i < total_codes:
-            print("次の銘柄処理まで3秒待機...")
-            time.sleep(3)
+            add_row(result)
+            if args.incremental and result['コード'] in signatures:
+                state[result['コード']] = signatures[result['コード']]
+        if metrics:
+            metrics.code_finished(result is not None)
+    
+    if metrics:
+        metrics.set_target(len(targets))
+    
+    try:
+        if targets:
+            run_batch(targets, client, args, on_result=record)
+    except KeyboardInterrupt:
+        writer.abort()
+        print(f"\n中断しました。--resume で続きから再開できます（ジャーナル: {args.journal}、"
+              f"途中経過: {writer.partial_file}）")
+        return
+    finally:
+        journal.close()
+        close_run_resources()
+    
+    if args.incremental:
+        save_batch_state(state)
+    
+    cache = get_default_cache()
+    if cache:
+        print(f"\nHTTPキャッシュ: ヒット{cache.hits}件 / 再検証{cache.revalidated}件 / 取得{cache.misses}件")
+    pdf_store = get_default_pdf_store()
+    if pdf_store:
+        print(f"PDF抽出結果ストア: 再利用{pdf_store.hits}件 / 新規{pdf_store.misses}件")
+    print(format_extraction_stats())
     
-    # 結果をCSVに保存
-    if results:
-        create_batch_summary(results)
-        print(f"\n処理完了！ {len(results)}/{total_codes} 銘柄のデータを取得しました")
+    # 途中経過ファイルをcodelist.csvの並び順で出力先に確定し、プレビューは先頭の行だけを読み直す
+    output_file = writer.close([info['code'] for info in code_list])
+    if output_file:
+        print_summary_preview(read_summary_head(output_file, SUMMARY_PREVIEW_ROWS), output_file, len(writer))
+        if engine is not None:
+            write_screening_report(engine, args.top, order=[info['code'] for info in code_list])
+        if partial:
+            print(f"\n部分結果: {partial}銘柄（処理期限を過ぎたため一部の項目が空欄です）")
+        print(f"\n処理完了！ {len(writer)}/{total_codes} 銘柄のデータを取得しました")
     else:
         print("\n処理できた銘柄がありませんでした")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""batch_qq.pyをローカルの代替サーバーに向けて実行する負荷試験ハーネス
+
+合成した数千銘柄のcodelist.csvを一時ディレクトリに作り、standin_serverを起動して
+KABUTAN_BASE_URL / TDNET_PDF_BASE_URL をそのサーバーに向けたbatch_qq.pyを実行する。
+終了後に処理銘柄数/秒、銘柄ごとの処理時間のp50/p99、ピークRSSを表示する。
+
+銘柄ごとの処理時間は、サーバーがその銘柄の最初のリクエスト（財務ページ）を受けた時刻から
+ジャーナルに結果が記録された時刻まで（--workers / --queue の作業キューでは、キューの銘柄が
+完了・失敗になった時刻まで）。ピークRSSは子孫プロセスのうち最大のもの。
+
+使い方:
+    python -m benchmarks.load_test --codes 2000 --latency 0.05 --error-rate 0.01
+    python -m benchmarks.load_test --codes 500 --batch-args "--async --concurrency 16 --no-cache"
+    python -m benchmarks.load_test --codes 500 --batch-args "--workers 4 --pipeline --no-cache"
+"""
+
+import argparse
+import json
+import os
+import resource
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.standin_server import add_config_arguments, config_from_args, start_server
+from src.endpoints import KABUTAN_BASE_URL_ENV, TDNET_PDF_BASE_URL_ENV
+from src.journal import DEFAULT_JOURNAL_PATH
+from src.work_queue import DEFAULT_QUEUE_PATH
+
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "batch_qq.py")
+
+# batch_qq.pyに渡す既定のオプション（レート制限はサーバー側の--throttle-rpsで試す）
+DEFAULT_BATCH_ARGS = "--pipeline --concurrency 32 --no-cache --kabutan-rate 10000 --tdnet-rate 10000"
+
+# 合成する銘柄コードの開始番号
+FIRST_SYNTHETIC_CODE = 1000
+
+
+def write_code_list(directory: str, count: int) -> List[str]:
+    """合成した銘柄コードのcodelist.csvを作成（コードのリストを返す）"""
+    codes = [str(FIRST_SYNTHETIC_CODE + i) for i in range(count)]
+    with open(os.path.join(directory, "codelist.csv"), 'w', encoding='utf-8-sig') as f:
+        f.write("コード,銘柄名\n")
+        for code in codes:
+            f.write(f"{code},合成銘柄{code}\n")
+    return codes
+
+
+def read_completion_times(journal_path: str) -> Dict[str, Dict]:
+    """ジャーナルから銘柄ごとの最後の記録（状態と時刻）を読む"""
+    completions = {}
+    if not os.path.exists(journal_path):
+        return completions
+    with open(journal_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            completions[entry['code']] = {'status': entry.get('status'), 'ts': entry.get('ts')}
+    return completions
+
+
+def read_queue_completion_times(queue_path: str) -> Dict[str, Dict]:
+    """作業キューから完了・失敗した銘柄の状態と時刻を読む（ジャーナルと同じ形式）"""
+    completions = {}
+    if not os.path.exists(queue_path):
+        return completions
+    conn = sqlite3.connect(f"file:{queue_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT code, status, updated_at FROM codes WHERE status IN ('done', 'failed')"
+        ).fetchall()
+    finally:
+        conn.close()
+    for code, status, updated_at in rows:
+        completions[code] = {'status': 'ok' if status == 'done' else 'failed', 'ts': updated_at}
+    return completions
+
+
+def result_source(batch_args: List[str]) -> Dict[str, Optional[str]]:
+    """batch_qq.pyのオプションから結果の記録先を判定（作業キューならqueue、そうでなければjournal）
+
+    --mergeは銘柄を処理しないため負荷試験にならず、ValueErrorを送出する。
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--queue', nargs='?', const=DEFAULT_QUEUE_PATH)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--merge', action='store_true')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL_PATH)
+    options, _ = parser.parse_known_args(batch_args)
+    if options.merge:
+        raise ValueError("--mergeは銘柄を処理しないため、--batch-argsには指定できません")
+    if options.queue is not None or options.workers > 0:
+        return {'queue': options.queue or DEFAULT_QUEUE_PATH, 'journal': None}
+    return {'queue': None, 'journal': options.journal}
+
+
+def summarize(codes: List[str], completions: Dict[str, Dict], first_seen: Dict[str, float],
+              elapsed: float, peak_rss_kib: int) -> Dict:
+    """負荷試験の結果をまとめる"""
+    ok = [code for code in codes if completions.get(code, {}).get('status') == 'ok']
+    failed = [code for code in codes if completions.get(code, {}).get('status') == 'failed']
+    latencies = np.array([completions[code]['ts'] - first_seen[code]
+                          for code in ok + failed if code in first_seen and completions[code].get('ts')])
+
+    def percentile(q: float):
+        return float(np.percentile(latencies, q)) if len(latencies) else None
+
+    return {
+        '銘柄数': len(codes),
+        '成功': len(ok),
+        '失敗': len(failed),
+        '未完了': len(codes) - len(ok) - len(failed),
+        '経過秒': elapsed,
+        '銘柄/秒': len(ok) / elapsed if elapsed > 0 else 0.0,
+        '処理時間p50': percentile(50),
+        '処理時間p99': percentile(99),
+        '処理時間最大': float(latencies.max()) if len(latencies) else None,
+        'ピークRSS_MiB': peak_rss_kib / 1024,
+    }
+
+
+def format_summary(summary: Dict) -> str:
+    def seconds(value):
+        return f"{value:.3f}秒" if value is not None else "-"
+
+    return "\n".join([
+        f"銘柄: {summary['銘柄数']}件（成功{summary['成功']} / 失敗{summary['失敗']} / 未完了{summary['未完了']}）",
+        f"経過時間: {summary['経過秒']:.1f}秒 / スループット: {summary['銘柄/秒']:.2f}銘柄/秒",
+        f"銘柄ごとの処理時間: p50 {seconds(summary['処理時間p50'])} / p99 {seconds(summary['処理時間p99'])} "
+        f"/ 最大 {seconds(summary['処理時間最大'])}",
+        f"ピークRSS: {summary['ピークRSS_MiB']:.1f}MiB",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batch_qq.pyをローカルの代替サーバーに向けて負荷試験する")
+    parser.add_argument('--codes', type=int, default=2000, help="合成する銘柄数")
+    parser.add_argument('--batch-args', default=DEFAULT_BATCH_ARGS, help="batch_qq.pyに渡すオプション")
+    parser.add_argument('--workdir', help="batch_qq.pyを実行するディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument('--keep-workdir', action='store_true', help="終了後に一時ディレクトリを残す")
+    parser.add_argument('--output', help="結果をJSONで保存するファイル")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    batch_args = shlex.split(args.batch_args)
+    try:
+        source = result_source(batch_args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="qq_load_test_")
+    os.makedirs(workdir, exist_ok=True)
+    codes = write_code_list(workdir, args.codes)
+
+    server = start_server(config_from_args(args), fixtures_dir=args.fixtures)
+    env = dict(os.environ)
+    # 株探とPDFを別のホスト名にして、レートリミッタのホスト別の予算を再現する
+    env[KABUTAN_BASE_URL_ENV] = f"http://127.0.0.1:{server.port}"
+    env[TDNET_PDF_BASE_URL_ENV] = f"http://localhost:{server.port}"
+    env.setdefault('PYTHONIOENCODING', 'utf-8')
+
+    command = [sys.executable, BATCH_SCRIPT] + batch_args
+    log_path = os.path.join(workdir, "batch_qq.log")
+    print(f"代替サーバー: http://127.0.0.1:{server.port}")
+    print(f"実行: {' '.join(command)}（{len(codes)}銘柄, ログ: {log_path}）")
+
+    start = time.time()
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log:
+            returncode = subprocess.call(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        elapsed = time.time() - start
+        server.shutdown()
+        server.server_close()
+
+    # Linuxのru_maxrssはKiB単位（待機済みの子孫プロセスのうち最大のもの）
+    peak_rss_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if source['queue']:
+        completions = read_queue_completion_times(os.path.join(workdir, source['queue']))
+    else:
+        completions = read_completion_times(os.path.join(workdir, source['journal']))
+    summary = summarize(codes, completions, server.first_seen, elapsed, peak_rss_kib)
+    summary['終了コード'] = returncode
+
+    print(f"\nbatch_qq.pyの終了コード: {returncode}")
+    print(format_summary(summary))
+    print(server.format_stats())
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if args.workdir is None and not args.keep_workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
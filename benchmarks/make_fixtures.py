@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""ベンチマーク用の固定データ（株探の財務・週足ページとTDnetの決算短信PDF）を作成する
+
+株探のページ構造（通期テーブル・四半期テーブル・週足テーブル）と決算短信の財政状態の
+レイアウトを再現したデータを乱数の種を固定して作るため、何度作り直しても同じ内容になる。
+作成したファイルは benchmarks/fixtures/ に保存してリポジトリに含める。
+
+使い方:
+    python -m benchmarks.make_fixtures
+"""
+
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 財務ページを作る銘柄（コード, 決算月）
+FINANCE_PAGES = [
+    ("9984", 3),
+    ("7203", 3),
+    ("4385", 6),
+    ("3092", 9),
+    ("2702", 12),
+]
+
+# 四半期テーブルの行数（株探の財務ページは直近12四半期前後を表示する）
+QUARTERS_PER_PAGE = 12
+
+WEEKLY_CODE = "9984"
+WEEKLY_PAGES = [1, 2]
+WEEKS_PER_PAGE = 30
+WEEKLY_START = date(2025, 10, 13)
+
+_WEEKLY_HEADER = ("<tr><th>日付</th><th>始値</th><th>高値</th><th>安値</th><th>終値</th>"
+                  "<th>前週比</th><th>前週比％</th><th>売買高</th></tr>")
+
+
+def quarter_periods(fiscal_year_end_month: int, count: int, last_year: int = 2025) -> List[str]:
+    """決算月がlast_year年の決算期で終わる直近count四半期の決算期（例: 25.01-03、古い順）"""
+    periods = []
+    year, month = last_year, fiscal_year_end_month
+    for _ in range(count):
+        start_month, start_year = month - 2, year
+        if start_month <= 0:
+            start_month += 12
+            start_year -= 1
+        periods.append(f"{start_year % 100:02d}.{start_month:02d}-{month:02d}")
+        month -= 3
+        if month <= 0:
+            month += 12
+            year -= 1
+    return list(reversed(periods))
+
+
+def finance_html(code: str, fiscal_year_end_month: int, quarters: int = QUARTERS_PER_PAGE,
+                 seed: int = 0) -> str:
+    """株探の財務ページ（通期テーブルと四半期テーブル）"""
+    rng = random.Random(seed)
+    rows = []
+    for period in quarter_periods(fiscal_year_end_month, quarters):
+        start_year = 2000 + int(period[:2])
+        start_month = int(period[3:5])
+        end_month = int(period.split('-')[1])
+        end_year = start_year + (1 if end_month < start_month else 0)
+        announced = date(end_year, end_month, 28) + timedelta(days=40)
+        folder = announced.strftime('%Y%m%d')
+        file_id = f"1401{folder}{rng.randint(100000, 999999)}"
+        sales = rng.randint(1000, 50000)
+        ordinary_income = rng.randint(-500, 5000)
+        rows.append(
+            f"<tr><th>I　 {period}</th><td>{sales:,}</td><td>－</td><td>{ordinary_income:,}</td>"
+            f"<td>{int(ordinary_income * 0.7):,}</td><td>{rng.uniform(-50, 300):.1f}</td>"
+            f"<td>{rng.uniform(1, 20):.1f}</td>"
+            f"<td><a href=\"/disclosures/pdf/{folder}/{file_id}/\">{announced.strftime('%y/%m/%d')}</a></td></tr>"
+        )
+
+    annual = "".join(
+        f"<tr><th>連　{year}.{fiscal_year_end_month:02d}</th><td>1,000</td></tr>"
+        for year in range(2021, 2026)
+    )
+    return (
+        f"<html><head><meta charset=\"utf-8\"><title>{code}</title></head><body>\n"
+        f"<div><table class=\"fin_year\"><tr><th>決算期</th><th>売上高</th></tr>{annual}</table></div>\n"
+        "<div><table class=\"fin_quarter\"><tr><th>決算期</th><th>売上高</th><th>営業益</th>"
+        "<th>経常益</th><th>最終益</th><th>修正1株益</th><th>売上営業損益率</th><th>発表日</th></tr>\n"
+        f"{''.join(rows)}</table></div></body></html>\n"
+    )
+
+
+def weekly_html(code: str, page: int = 1, weeks: int = WEEKS_PER_PAGE,
+                start: date = WEEKLY_START, seed: int = 0) -> str:
+    """株探の週足ページ（1ページ目は今週の行を含む）"""
+    rng = random.Random(seed * 100 + page)
+    first = start - timedelta(weeks=(page - 1) * weeks)
+
+    current = ""
+    if page == 1:
+        current = (
+            f"<table class=\"stock_kabuka0\">{_WEEKLY_HEADER}"
+            f"<tr><th><time datetime=\"{first}\">{first.strftime('%y/%m/%d')}</time></th>"
+            f"<td>{rng.randint(500, 5000):,}</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>"
+            "</table>"
+        )
+
+    rows = []
+    for i in range(weeks):
+        day = first - timedelta(weeks=i + 1)
+        rows.append(
+            f"<tr><th>{day.strftime('%y/%m/%d')}</th><td>{rng.randint(500, 5000):,}</td>"
+            "<td>1</td><td>1</td><td>1</td><td>1</td><td>1</td><td>1</td></tr>"
+        )
+    return (
+        f"<html><head><meta charset=\"utf-8\"><title>{code}</title></head><body>{current}"
+        f"<table class=\"stock_kabuka_dwm\">{_WEEKLY_HEADER}{''.join(rows)}</table></body></html>\n"
+    )
+
+
+def _summary_page(total_assets: str, net_assets: str) -> List[str]:
+    """決算短信サマリーの財政状態の部分"""
+    return [
+        "2026年3月期 第1四半期決算短信〔日本基準〕(連結)",
+        "(2) 連結財政状態",
+        "総資産 純資産 自己資本比率",
+        "百万円 百万円 %",
+        f"2026年3月期第1四半期 {total_assets} {net_assets} 35.2",
+        "2025年3月期 1,200,000 440,000 34.1",
+        "2. 配当の状況",
+    ]
+
+
+def _filler_page(number: int) -> List[str]:
+    """財政状態を含まない本文ページ"""
+    return [f"{number}. 経営成績等の概況"] + [
+        "当第1四半期の売上高は前年同期比で増加しました。" for _ in range(30)
+    ]
+
+
+TANSHIN_PDFS: Dict[str, List[List[str]]] = {
+    # 1ページ目に財政状態がある一般的なサマリー
+    "tanshin_summary.pdf": [_summary_page("1,234,567", "456,789")],
+    # 本文ページの後ろに財政状態があるPDF（キーワードでページを探す）
+    "tanshin_multipage.pdf": [_filler_page(1), _filler_page(2), _summary_page("98,765", "43,210"),
+                              _filler_page(3)],
+    # 財政状態がないPDF（全段階を試して失敗する）
+    "tanshin_missing.pdf": [_filler_page(1), _filler_page(2)],
+}
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """テキスト行だけからなるPDFを作成（ToUnicodeのCMapで日本語を1バイトの文字コードに割り当てる）"""
+    chars = sorted({char for lines in pages for line in lines for char in line})
+    if len(chars) > 255:
+        raise ValueError(f"1つのPDFで使える文字は255種類までです: {len(chars)}")
+    codes = {char: i + 1 for i, char in enumerate(chars)}
+
+    cmap_lines = [
+        "/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+        "/CMapName /Custom def", "/CMapType 2 def",
+        "1 begincodespacerange <00> <FF> endcodespacerange",
+    ]
+    entries = [f"<{codes[char]:02X}> <{ord(char):04X}>" for char in chars]
+    for i in range(0, len(entries), 100):
+        chunk = entries[i:i + 100]
+        cmap_lines.append(f"{len(chunk)} beginbfchar")
+        cmap_lines += chunk
+        cmap_lines.append("endbfchar")
+    cmap_lines += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+    cmap = "\n".join(cmap_lines).encode()
+
+    # 1: カタログ、2: ページツリー、3: フォント、4: ToUnicode、5以降: 各ページの内容とページ
+    objects: List[bytes] = [b"", b"", b"", b""]
+    objects[3] = b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream"
+    widths = " ".join(["500"] * 256)
+    objects[2] = (f"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /FirstChar 0 /LastChar 255 "
+                  f"/Widths [{widths}] /ToUnicode 4 0 R >>").encode()
+
+    kids = []
+    for lines in pages:
+        operators = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            operators.append(f"<{''.join(f'{codes[char]:02X}' for char in line)}> Tj T*")
+        operators.append("ET")
+        content = "\n".join(operators).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R "
+                        f"/Resources << /Font << /F1 3 0 R >> >> >>").encode())
+        kids.append(len(objects))
+    objects[1] = (f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] "
+                  f"/Count {len(kids)} >>").encode()
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref}\n%%EOF\n").encode()
+    return bytes(output)
+
+
+def write_fixtures(directory: str = FIXTURES_DIR) -> List[str]:
+    """全ての固定データを作成して保存（保存したファイル名のリストを返す）"""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+
+    def write(name: str, content: bytes) -> None:
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(content)
+        written.append(name)
+
+    for seed, (code, fiscal_year_end_month) in enumerate(FINANCE_PAGES):
+        write(f"finance_{code}.html", finance_html(code, fiscal_year_end_month, seed=seed).encode('utf-8'))
+    for page in WEEKLY_PAGES:
+        write(f"weekly_{WEEKLY_CODE}_p{page}.html", weekly_html(WEEKLY_CODE, page).encode('utf-8'))
+    for name, pages in TANSHIN_PDFS.items():
+        write(name, make_pdf(pages))
+    return written
+
+
+def main():
+    for name in write_fixtures():
+        print(f"作成: {os.path.join(FIXTURES_DIR, name)}")
+
+
+if __name__ == "__main__":
+    main()
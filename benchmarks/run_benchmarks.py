@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""固定データを使ったオフラインのベンチマーク
+
+benchmarks/fixtures/ の株探ページと決算短信PDFを使い、ネットワークに接続せずに
+各処理の1回あたりの時間・スループット・ピークメモリを測定して、保存済みの基準値と比較する。
+PDFのダウンロードは固定データのPDFを返す関数に差し替え、HTTPキャッシュとPDF結果ストアは使わない。
+
+使い方:
+    python -m benchmarks.run_benchmarks                  # 測定して基準値と比較
+    python -m benchmarks.run_benchmarks --save-baseline  # 測定結果を基準値として保存
+    python -m benchmarks.run_benchmarks --only weekly    # 名前に「weekly」を含むものだけ測定
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import qq
+from src.correlation import CorrelationSettings, calculate_panel_correlations
+from src.http_cache import set_default_cache
+from src.pdf_analyzer import extract_balance_sheet_data
+from src.pdf_store import set_default_pdf_store
+from benchmarks.make_fixtures import FIXTURES_DIR
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 基準値よりこの割合以上遅くなったら遅化として報告する
+DEFAULT_TOLERANCE = 0.5
+
+# 1回の測定（number回の呼び出し）にかける最低時間（秒）
+MIN_MEASURE_SECONDS = 0.2
+
+
+@dataclass
+class BenchmarkResult:
+    """1つのベンチマークの測定結果"""
+    name: str
+    seconds_per_op: float
+    items_per_op: int
+    unit: str
+    peak_kib: float
+
+    @property
+    def throughput(self) -> float:
+        """1秒あたりの処理件数"""
+        return self.items_per_op / self.seconds_per_op if self.seconds_per_op > 0 else 0.0
+
+
+class Fixtures:
+    """固定データの読み込み"""
+
+    def __init__(self, directory: str = FIXTURES_DIR):
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"固定データがありません（python -m benchmarks.make_fixtures で作成）: {directory}")
+        self.directory = directory
+        self.finance_pages = self._read_texts("finance_")
+        self.weekly_pages = [(int(name.rsplit('_p', 1)[1].split('.')[0]), html)
+                             for name, html in sorted(self._read_texts("weekly_").items())]
+        self.pdfs = {name: self._read_bytes(name) for name in sorted(os.listdir(directory))
+                     if name.endswith('.pdf')}
+
+    def _read_texts(self, prefix: str) -> Dict[str, str]:
+        texts = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(prefix) and name.endswith('.html'):
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    texts[name] = f.read()
+        return texts
+
+    def _read_bytes(self, name: str) -> bytes:
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+
+# ベンチマーク名 → 準備関数（固定データから「測定する関数, 1回あたりの件数, 単位」を作る）
+BENCHMARKS: Dict[str, Callable[[Fixtures], Tuple[Callable[[], object], int, str]]] = {}
+
+
+def benchmark(name: str):
+    """準備関数をベンチマークとして登録するデコレータ"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@contextlib.contextmanager
+def _stubbed_pdf_download(fixtures: Fixtures):
+    """qq.download_pdfを固定データのPDFを順番に返す関数に差し替える"""
+    pdfs = [fixtures.pdfs[name] for name in ("tanshin_summary.pdf", "tanshin_multipage.pdf")]
+    calls = [0]
+
+    def download_pdf(url, client=None):
+        content = pdfs[calls[0] % len(pdfs)]
+        calls[0] += 1
+        return io.BytesIO(content)
+
+    original = qq.download_pdf
+    qq.download_pdf = download_pdf
+    try:
+        yield
+    finally:
+        qq.download_pdf = original
+
+
+def _prepared_quarters(fixtures: Fixtures) -> List[Tuple[List[Dict], int]]:
+    """各財務ページの四半期データ行と決算月（PDFの値は固定値）"""
+    prepared = []
+    for html in fixtures.finance_pages.values():
+        rows = qq.parse_quarterly_rows(html)
+        for row in rows:
+            row['資産合計'] = 1234567.0
+            row['資本合計'] = 456789.0
+        prepared.append((rows, qq.get_fiscal_year_end_month(html)))
+    return prepared
+
+
+@benchmark("get_fiscal_year_end_month")
+def _bench_fiscal_year_end_month(fixtures: Fixtures):
+    pages = list(fixtures.finance_pages.values())
+
+    def run():
+        for html in pages:
+            qq.get_fiscal_year_end_month(html)
+    return run, len(pages), "ページ"
+
+
+@benchmark("extract_quarterly_data")
+def _bench_extract_quarterly_data(fixtures: Fixtures):
+    html = fixtures.finance_pages["finance_9984.html"]
+    quarters = len(qq.parse_quarterly_rows(html))
+
+    def run():
+        with _stubbed_pdf_download(fixtures):
+            qq.extract_quarterly_data(html, parallel_pdf=False)
+    return run, quarters, "四半期"
+
+
+@benchmark("extract_balance_sheet_data[PyPDF2]")
+def _bench_balance_sheet_pypdf2(fixtures: Fixtures):
+    pdfs = [fixtures.pdfs["tanshin_summary.pdf"], fixtures.pdfs["tanshin_multipage.pdf"]]
+
+    def run():
+        for content in pdfs:
+            extract_balance_sheet_data(io.BytesIO(content))
+    return run, len(pdfs), "PDF"
+
+
+@benchmark("extract_balance_sheet_data[テンプレート]")
+def _bench_balance_sheet_template(fixtures: Fixtures):
+    pdfs = []
+    for name in ("tanshin_summary.pdf", "tanshin_multipage.pdf"):
+        content = fixtures.pdfs[name]
+        template = extract_balance_sheet_data(io.BytesIO(content))['テンプレート']
+        pdfs.append((content, template))
+
+    def run():
+        for content, template in pdfs:
+            extract_balance_sheet_data(io.BytesIO(content), template)
+    return run, len(pdfs), "PDF"
+
+
+@benchmark("extract_balance_sheet_data[失敗]")
+def _bench_balance_sheet_missing(fixtures: Fixtures):
+    content = fixtures.pdfs["tanshin_missing.pdf"]
+
+    def run():
+        extract_balance_sheet_data(io.BytesIO(content))
+    return run, 1, "PDF"
+
+
+@benchmark("parse_weekly_stock_html")
+def _bench_weekly_parser(fixtures: Fixtures):
+    pages = fixtures.weekly_pages
+    weeks = len(qq.merge_weekly_stock_data(
+        [row for page, html in pages for row in qq.parse_weekly_stock_html(html, page)]))
+
+    def run():
+        all_weekly_data = []
+        for page, html in pages:
+            all_weekly_data.extend(qq.parse_weekly_stock_html(html, page))
+        qq.merge_weekly_stock_data(all_weekly_data)
+    return run, weeks, "週"
+
+
+@benchmark("calculate_qoq_growth_rate")
+def _bench_growth_rate(fixtures: Fixtures):
+    prepared = _prepared_quarters(fixtures)
+
+    def run():
+        for rows, fiscal_year_end_month in prepared:
+            qq.calculate_qoq_growth_rate(rows, fiscal_year_end_month)
+    return run, sum(len(rows) for rows, _ in prepared), "四半期"
+
+
+@benchmark("calculate_stock_correlations")
+def _bench_stock_correlations(fixtures: Fixtures):
+    weekly_data = qq.merge_weekly_stock_data(
+        [row for page, html in fixtures.weekly_pages for row in qq.parse_weekly_stock_html(html, page)])
+    prepared = []
+    for rows, fiscal_year_end_month in _prepared_quarters(fixtures):
+        data_with_growth = qq.calculate_qoq_growth_rate(rows, fiscal_year_end_month)
+        qq.attach_prices_to_quarters(data_with_growth, weekly_data)
+        prepared.append(data_with_growth)
+
+    def run():
+        # 相関の列を書き込むため、元のデータを壊さないように行をコピーして渡す
+        for data_with_growth in prepared:
+            qq.calculate_stock_correlations([dict(item) for item in data_with_growth])
+    return run, len(prepared), "銘柄"
+
+
+# パネル相関のベンチマークで合成する銘柄数・四半期数（全銘柄×約10年分）
+PANEL_CODES = 3900
+PANEL_QUARTERS = 44
+
+
+@benchmark("calculate_panel_correlations")
+def _bench_panel_correlations(fixtures: Fixtures):
+    rng = np.random.default_rng(0)
+    rows = PANEL_CODES * PANEL_QUARTERS
+    periods = [f"{2014 + i // 4}.{(i % 4) * 3 + 3:02d}" for i in range(PANEL_QUARTERS)]
+    frame = pd.DataFrame({
+        'コード': np.repeat(np.arange(PANEL_CODES).astype(str), PANEL_QUARTERS),
+        '決算期': np.tile(periods, PANEL_CODES),
+        '四半期成長率': rng.normal(size=rows),
+        '経常益利回り': rng.normal(size=rows),
+        '始値': rng.lognormal(7, 1, size=rows),
+    })
+    settings = CorrelationSettings(window=12, method='spearman', rolling=True)
+
+    def run():
+        calculate_panel_correlations(frame, settings=settings)
+    return run, rows, "四半期"
+
+
+def measure(name: str, run: Callable[[], object], items: int, unit: str, repeat: int) -> BenchmarkResult:
+    """1回あたりの時間（repeat回の最小値）とピークメモリを測定"""
+    run()  # 初回の遅延importやキャッシュの影響を除く
+
+    timer = timeit.Timer(run)
+    number = 1
+    while timer.timeit(number) < MIN_MEASURE_SECONDS:
+        number *= 2
+    seconds_per_op = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    # tracemallocは処理を遅くするため時間の測定とは別に1回だけ実行する
+    tracemalloc.start()
+    try:
+        start_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name, seconds_per_op, items, unit, max(peak - start_current, 0) / 1024)
+
+
+def run_benchmarks(names: List[str], repeat: int, fixtures: Optional[Fixtures] = None) -> List[BenchmarkResult]:
+    """指定したベンチマークを順に実行（各処理の表示は捨てる）"""
+    fixtures = fixtures or Fixtures()
+    # キャッシュやストアの内容で結果が変わらないようにする
+    set_default_cache(None)
+    set_default_pdf_store(None)
+
+    results = []
+    for name in names:
+        print(f"測定中: {name}", file=sys.stderr)
+        with contextlib.redirect_stdout(_NullWriter()):
+            run, items, unit = BENCHMARKS[name](fixtures)
+        results.append(measure(name, _quiet(run), items, unit, repeat))
+    return results
+
+
+def _quiet(run: Callable[[], object]) -> Callable[[], object]:
+    """標準出力を捨てて実行する関数"""
+    def quiet_run():
+        with contextlib.redirect_stdout(_NullWriter()):
+            return run()
+    return quiet_run
+
+
+class _NullWriter(io.TextIOBase):
+    """書き込まれた文字列を捨てる出力先"""
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    """保存済みの基準値を読み込む（なければ空）"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('results', {})
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]) -> None:
+    """測定結果を基準値として保存（既存の他のベンチマークの基準値は残す）"""
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[result.name] = {
+            'seconds_per_op': result.seconds_per_op,
+            'items_per_op': result.items_per_op,
+            'unit': result.unit,
+            'peak_kib': round(result.peak_kib, 1),
+        }
+    document = {
+        'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': dict(sorted(baseline.items())),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def report(results: List[BenchmarkResult], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """結果の表を表示し、基準値より遅くなったベンチマーク名のリストを返す"""
+    regressions = []
+    print(f"{'ベンチマーク':<40} {'1回あたり':>12} {'スループット':>18} {'ピークメモリ':>12} {'基準値比':>9}")
+    for result in results:
+        throughput = f"{result.throughput:,.0f} {result.unit}/秒"
+        ratio_text = "-"
+        base = baseline.get(result.name)
+        if base and base.get('seconds_per_op'):
+            ratio = result.seconds_per_op / base['seconds_per_op']
+            ratio_text = f"{ratio:.2f}x"
+            if ratio > 1 + tolerance:
+                ratio_text += " 遅化"
+                regressions.append(result.name)
+        print(f"{result.name:<40} {result.seconds_per_op * 1000:>10.3f}ms {throughput:>18} "
+              f"{result.peak_kib:>9.1f}KiB {ratio_text:>9}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='固定データを使ったオフラインのベンチマーク')
+    parser.add_argument('--only', action='append', default=[],
+                        help='名前にこの文字列を含むベンチマークだけを実行（複数指定可）')
+    parser.add_argument('--repeat', type=int, default=5, help='測定の繰り返し回数（最小値を採用）')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='基準値のJSONファイル')
+    parser.add_argument('--save-baseline', action='store_true', help='測定結果を基準値として保存')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='基準値より遅いと判定する割合（0.5なら1.5倍より遅い場合）')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.only or any(part in name for part in args.only)]
+    if not names:
+        print(f"該当するベンチマークがありません: {', '.join(args.only)}")
+        sys.exit(2)
+
+    results = run_benchmarks(names, args.repeat)
+    regressions = report(results, load_baseline(args.baseline), args.tolerance)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\n基準値を保存しました: {args.baseline}")
+    elif regressions:
+        print(f"\n基準値より{args.tolerance:.0%}以上遅くなったベンチマーク: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
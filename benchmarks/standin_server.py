@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""株探とTDnet PDFの代わりに応答するローカルHTTPサーバー（負荷試験用）
+
+/stock/finance?code=XXXX、/stock/kabuka?code=XXXX&ashi=wek&page=N、/YYYYMMDD/ID.pdf に
+固定データのディレクトリのページ（finance_XXXX.html, weekly_XXXX_pN.html）があればそれを、
+なければ make_fixtures と同じ形式で銘柄コードから作ったページを返す。PDFは固定データの
+決算短信PDFから開示IDで選ぶ。応答の遅延・エラー率・429による流量制限・遅いボディ送信を設定できる。
+
+1つのサーバーで両方を受けるため、batch_qq.pyには株探を127.0.0.1、PDFをlocalhostとして渡すと
+ホストごとのレートリミッタが別々に効く:
+    KABUTAN_BASE_URL=http://127.0.0.1:8765 TDNET_PDF_BASE_URL=http://localhost:8765 python batch_qq.py
+
+使い方:
+    python -m benchmarks.standin_server --port 8765 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import functools
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.make_fixtures import FIXTURES_DIR, finance_html, weekly_html
+
+DEFAULT_PORT = 8765
+
+# 合成ページの決算月（銘柄コードから選ぶ。実際の分布に合わせて3月決算を多めにする）
+_SYNTHETIC_FISCAL_MONTHS = [3, 3, 3, 3, 6, 9, 12]
+
+# 遅いボディはこの回数に分けて送る
+_SLOW_BODY_CHUNKS = 8
+
+_PDF_PATH_PATTERN = re.compile(r'^/(\d{8})/(\d+)\.pdf$')
+_DISCLOSURE_ID_PATTERN = re.compile(r'/disclosures/pdf/\d{8}/(\d+)/')
+
+
+@dataclass
+class StandinConfig:
+    """応答の振る舞いの設定"""
+    latency: float = 0.0            # 応答までの平均遅延（秒）
+    jitter: float = 0.0             # 遅延のばらつき（正規分布の標準偏差、秒）
+    error_rate: float = 0.0         # 500を返す割合
+    throttle_rps: float = 0.0       # サーバー全体の毎秒リクエスト数の上限（超えたら429、0で無制限）
+    retry_after: int = 1            # 429のRetry-After（秒）
+    slow_body_rate: float = 0.0     # ボディを分割してゆっくり送る割合
+    slow_body_seconds: float = 1.0  # 遅いボディを送り終えるまでの秒数
+    seed: int = 0
+
+
+def _code_seed(code: str) -> int:
+    """銘柄コードから合成ページの乱数の種を作る（英字を含むコードにも対応）"""
+    return zlib.crc32(code.encode('utf-8'))
+
+
+class StandinServer(ThreadingHTTPServer):
+    """設定と統計を持つスレッド型HTTPサーバー"""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address: Tuple[str, int], config: StandinConfig,
+                 fixtures_dir: Optional[str] = FIXTURES_DIR):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.fixtures_dir = fixtures_dir
+        self.pdfs = self._load_pdfs()
+
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._tokens = config.throttle_rps
+        self._tokens_updated = time.monotonic()
+
+        # 統計（応答の種類・ステータスごとの件数、銘柄ごとの最初のリクエスト時刻）
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.bytes_sent = 0
+        self.first_seen: Dict[str, float] = {}
+        self.last_seen: Dict[str, float] = {}
+        # 開示ID → 銘柄コード（PDFのリクエストを銘柄に紐付けるため）
+        self._disclosure_codes: Dict[str, str] = {}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def _load_pdfs(self) -> List[bytes]:
+        if not self.fixtures_dir or not os.path.isdir(self.fixtures_dir):
+            raise FileNotFoundError(f"決算短信PDFの固定データがありません: {self.fixtures_dir}")
+        pdfs = []
+        for name in sorted(os.listdir(self.fixtures_dir)):
+            if name.endswith('.pdf'):
+                with open(os.path.join(self.fixtures_dir, name), 'rb') as f:
+                    pdfs.append(f.read())
+        if not pdfs:
+            raise FileNotFoundError(f"決算短信PDFの固定データがありません: {self.fixtures_dir}")
+        return pdfs
+
+    def _read_fixture(self, name: str) -> Optional[bytes]:
+        if not self.fixtures_dir:
+            return None
+        path = os.path.join(self.fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    @functools.lru_cache(maxsize=8192)
+    def finance_page(self, code: str) -> bytes:
+        """財務ページ（固定データがなければ合成）"""
+        content = self._read_fixture(f"finance_{code}.html")
+        if content is None:
+            seed = _code_seed(code)
+            fiscal_year_end_month = _SYNTHETIC_FISCAL_MONTHS[seed % len(_SYNTHETIC_FISCAL_MONTHS)]
+            content = finance_html(code, fiscal_year_end_month, seed=seed).encode('utf-8')
+        with self._lock:
+            for file_id in _DISCLOSURE_ID_PATTERN.findall(content.decode('utf-8', 'replace')):
+                self._disclosure_codes[file_id] = code
+        return content
+
+    @functools.lru_cache(maxsize=8192)
+    def weekly_page(self, code: str, page: int) -> bytes:
+        """週足ページ（固定データがなければ合成）"""
+        content = self._read_fixture(f"weekly_{code}_p{page}.html")
+        if content is None:
+            content = weekly_html(code, page, seed=_code_seed(code)).encode('utf-8')
+        return content
+
+    def pdf(self, file_id: str) -> bytes:
+        """開示IDに対応する決算短信PDF"""
+        return self.pdfs[int(file_id) % len(self.pdfs)]
+
+    def code_for_disclosure(self, file_id: str) -> Optional[str]:
+        with self._lock:
+            return self._disclosure_codes.get(file_id)
+
+    def random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def delay(self) -> float:
+        """今回の応答の遅延（秒）"""
+        if self.config.latency <= 0 and self.config.jitter <= 0:
+            return 0.0
+        with self._lock:
+            return max(0.0, self._rng.gauss(self.config.latency, self.config.jitter))
+
+    def throttled(self) -> bool:
+        """流量の上限を超えたか（超えていなければ1リクエスト分の予算を消費）"""
+        rate = self.config.throttle_rps
+        if rate <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(rate, self._tokens + (now - self._tokens_updated) * rate)
+            self._tokens_updated = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+    def record(self, kind: str, status: int, size: int, code: Optional[str]) -> None:
+        """リクエストの統計を記録"""
+        now = time.time()
+        with self._lock:
+            self.requests[kind] += 1
+            self.statuses[status] += 1
+            self.bytes_sent += size
+            if code:
+                self.first_seen.setdefault(code, now)
+                self.last_seen[code] = now
+
+    def format_stats(self) -> str:
+        """統計を表示用の文字列にする"""
+        with self._lock:
+            requests = ", ".join(f"{kind} {count}件" for kind, count in sorted(self.requests.items()))
+            statuses = ", ".join(f"{status}: {count}件" for status, count in sorted(self.statuses.items()))
+            return (f"リクエスト: {requests or 'なし'}\n"
+                    f"ステータス: {statuses or 'なし'}\n"
+                    f"送信量: {self.bytes_sent / 1024 / 1024:.1f}MiB / 銘柄数: {len(self.first_seen)}")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """株探・TDnet PDFのパスに応答するハンドラ"""
+
+    protocol_version = 'HTTP/1.1'
+    server: StandinServer
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        code = query.get('code', [''])[0]
+
+        kind, content_type, body = self._route(parsed.path, query, code)
+        if kind == 'pdf':
+            code = self.server.code_for_disclosure(_PDF_PATH_PATTERN.match(parsed.path).group(2)) or ''
+
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+
+        if body is None:
+            self._send_simple(404, kind, code, b"not found")
+        elif self.server.throttled():
+            self._send_simple(429, kind, code, b"too many requests",
+                              {'Retry-After': str(self.server.config.retry_after)})
+        elif self.server.random() < self.server.config.error_rate:
+            self._send_simple(500, kind, code, b"internal server error")
+        else:
+            slow = self.server.random() < self.server.config.slow_body_rate
+            self._send_body(kind, code, content_type, body, slow)
+
+    def _route(self, path: str, query: Dict[str, List[str]], code: str) -> Tuple[str, str, Optional[bytes]]:
+        """パスから応答の種類・Content-Type・ボディを決める（該当なしはボディNone）"""
+        html = 'text/html; charset=utf-8'
+        if path == '/stock/finance' and code:
+            return 'finance', html, self.server.finance_page(code)
+        if path == '/stock/kabuka' and code:
+            try:
+                page = int(query.get('page', ['1'])[0])
+            except ValueError:
+                return 'weekly', html, None
+            return 'weekly', html, self.server.weekly_page(code, page)
+        match = _PDF_PATH_PATTERN.match(path)
+        if match:
+            return 'pdf', 'application/pdf', self.server.pdf(match.group(2))
+        return 'other', html, None
+
+    def _send_simple(self, status: int, kind: str, code: str, body: bytes,
+                     headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(kind, status, len(body), code)
+
+    def _send_body(self, kind: str, code: str, content_type: str, body: bytes, slow: bool) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if slow:
+            # ボディを分割し、間隔を空けて送る
+            chunk_size = max(1, -(-len(body) // _SLOW_BODY_CHUNKS))
+            interval = self.server.config.slow_body_seconds / _SLOW_BODY_CHUNKS
+            for start in range(0, len(body), chunk_size):
+                self.wfile.write(body[start:start + chunk_size])
+                self.wfile.flush()
+                time.sleep(interval)
+        else:
+            self.wfile.write(body)
+        self.server.record(kind, 200, len(body), code)
+
+    def log_message(self, format, *args):
+        # 1リクエストごとのアクセスログは表示しない
+        pass
+
+
+def start_server(config: StandinConfig, port: int = 0, host: str = '127.0.0.1',
+                 fixtures_dir: Optional[str] = FIXTURES_DIR) -> StandinServer:
+    """サーバーをバックグラウンドのスレッドで起動（port=0なら空いているポート）"""
+    server = StandinServer((host, port), config, fixtures_dir)
+    thread = threading.Thread(target=server.serve_forever, name='standin-server', daemon=True)
+    thread.start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """応答の振る舞いのオプションを追加（負荷試験ハーネスと共通）"""
+    parser.add_argument('--latency', type=float, default=0.0, help="応答までの平均遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="遅延のばらつき（標準偏差、秒）")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="500を返す割合（0〜1）")
+    parser.add_argument('--throttle-rps', type=float, default=0.0,
+                        help="毎秒リクエスト数の上限（超えたら429、0で無制限）")
+    parser.add_argument('--retry-after', type=int, default=1, help="429のRetry-After（秒）")
+    parser.add_argument('--slow-body-rate', type=float, default=0.0, help="ボディをゆっくり送る割合（0〜1）")
+    parser.add_argument('--slow-body-seconds', type=float, default=1.0, help="遅いボディを送り終えるまでの秒数")
+    parser.add_argument('--seed', type=int, default=0, help="エラー・遅延の乱数の種")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help="固定データのディレクトリ（該当するページがあれば合成せずにそれを返す）")
+
+
+def config_from_args(args: argparse.Namespace) -> StandinConfig:
+    return StandinConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rps=args.throttle_rps,
+        retry_after=args.retry_after,
+        slow_body_rate=args.slow_body_rate,
+        slow_body_seconds=args.slow_body_seconds,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="株探・TDnet PDFの代わりに応答するローカルHTTPサーバー")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    parser.add_argument('--host', default='127.0.0.1', help="待ち受けるアドレス")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = StandinServer((args.host, args.port), config_from_args(args), args.fixtures)
+    print(f"待ち受け中: http://{args.host}:{server.port}")
+    print(f"  KABUTAN_BASE_URL=http://127.0.0.1:{server.port} "
+          f"TDNET_PDF_BASE_URL=http://localhost:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止しました")
+    finally:
+        server.server_close()
+        print(server.format_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""増分バッチ用に銘柄ごとの最終発表日と開示IDを保存する状態ファイル"""
+
+import json
+import os
+from typing import Dict, List
+
+from src.pdf_store import extract_tdnet_file_id
+
+
+DEFAULT_STATE_PATH = "data/output/batch_state.json"
+
+
+def disclosure_signature(quarterly_data: List[Dict]) -> Dict:
+    """四半期データから最新の決算期・発表日と開示IDの一覧を作成（変化の検出用）"""
+    if not quarterly_data:
+        return {}
+    latest = max(quarterly_data, key=lambda x: x['決算期'])
+    disclosure_ids = sorted(
+        file_id for file_id in (extract_tdnet_file_id(item.get('PDF_URL')) for item in quarterly_data)
+        if file_id
+    )
+    return {
+        '決算期': latest['決算期'],
+        '発表日': latest.get('発表日'),
+        'disclosure_ids': disclosure_ids,
+    }
+
+
+def load_batch_state(path: str = DEFAULT_STATE_PATH) -> Dict[str, Dict]:
+    """状態ファイルを読み込み（存在しなければ空）"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"状態ファイルの読み込みに失敗（全銘柄を再計算します）: {e}")
+        return {}
+
+
+def save_batch_state(state: Dict[str, Dict], path: str = DEFAULT_STATE_PATH) -> None:
+    """状態ファイルを書き込み（一時ファイル経由で置き換え）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
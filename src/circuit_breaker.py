@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""ホストごとのサーキットブレーカー（エラーが急増したホストへの送信を一時的に止める）"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from src.deadline import DeadlineExceeded, current_deadline
+from src.live_metrics import observe_circuit_open
+
+
+# 失敗の割合を判定する直近のリクエスト数と、判定に必要な最小件数
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_REQUESTS = 10
+
+# 直近のリクエストのうちこの割合以上が失敗したら開く
+DEFAULT_FAILURE_RATIO = 0.5
+
+# 開いてから試しに1件送るまでの秒数（試しが失敗するたびに倍にし、上限まで延ばす）
+DEFAULT_COOLDOWN = 15.0
+DEFAULT_MAX_COOLDOWN = 120.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """1ホストのサーキットブレーカー
+
+    閉じている間は通常どおり送信し、直近window件のうち失敗がfailure_ratio以上になると開いて
+    cooldown秒の間は送信を待たせる。その後は1件だけ試しに送り（半開）、成功すれば閉じ、
+    失敗すれば待ち時間をmax_cooldownまで倍にして再び開く。待たせるのはスレッドに設定された
+    銘柄の処理期限までで、期限を過ぎたリクエストはDeadlineExceededで失敗させる。
+    Retry-Afterを受けた場合はhold()で同じホストへの送信を指定の秒数だけ止める（開閉の状態は変えない）。
+    """
+
+    def __init__(self, host: str = '', window: int = DEFAULT_WINDOW,
+                 min_requests: int = DEFAULT_MIN_REQUESTS, failure_ratio: float = DEFAULT_FAILURE_RATIO,
+                 cooldown: float = DEFAULT_COOLDOWN, max_cooldown: float = DEFAULT_MAX_COOLDOWN):
+        self.host = host
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = CLOSED
+        self.opened = 0
+        self._cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._paused_until = 0.0
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def before_request(self) -> float:
+        """送信してよくなるまで待ち、待った秒数を返す（半開なら試しの1件だけを通す）
+
+        銘柄の処理期限までに送信できなければDeadlineExceededを送出する。
+        """
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._wait(self._paused_until - now)
+                    continue
+                if self.state == OPEN:
+                    if now < self._open_until:
+                        self._wait(self._open_until - now)
+                        continue
+                    self.state = HALF_OPEN
+                    self._probing = False
+                if self.state == HALF_OPEN:
+                    if self._probing:
+                        # 試しの結果が出るまで待つ（結果が記録されなかった場合に備えて上限を付ける）
+                        self._wait(self._cooldown)
+                        continue
+                    self._probing = True
+                break
+        return time.monotonic() - started
+
+    def record(self, ok: bool) -> None:
+        """送信の結果を記録（okは一時的な失敗でなかったか）"""
+        with self._condition:
+            now = time.monotonic()
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                if ok:
+                    print(f"{self.host}: 送信を再開します")
+                    self.state = CLOSED
+                    self._cooldown = self.base_cooldown
+                    self._outcomes.clear()
+                else:
+                    self._open(now, min(self.max_cooldown, self._cooldown * 2))
+                self._condition.notify_all()
+                return
+            if self.state != CLOSED:
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_requests
+                    and failures >= self.failure_ratio * len(self._outcomes)):
+                self._open(now, self._cooldown)
+
+    def cancel(self) -> None:
+        """before_requestで許可を得たが送信しなかった（半開なら試しの1件を他のリクエストに譲る）"""
+        with self._condition:
+            if self.state == HALF_OPEN and self._probing:
+                self._probing = False
+                self._condition.notify_all()
+
+    def hold(self, seconds: float) -> None:
+        """seconds秒の間このホストへの送信を止める（Retry-After）"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait(self, seconds: float) -> None:
+        """最大seconds秒待つ（処理期限の残り時間まで、期限を過ぎていればDeadlineExceeded）"""
+        deadline = current_deadline()
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{self.host}への送信を再開する前に銘柄の処理期限を過ぎました")
+            seconds = min(seconds, remaining)
+        self._condition.wait(seconds)
+
+    def _open(self, now: float, cooldown: float) -> None:
+        self.state = OPEN
+        self.opened += 1
+        self._cooldown = cooldown
+        self._open_until = now + cooldown
+        self._outcomes.clear()
+        print(f"警告: {self.host}でエラーが続いたため{cooldown:.0f}秒間送信を止めます")
+        observe_circuit_open(self.host)
+
+
+class HostCircuitBreaker:
+    """URLのホスト名ごとに別々のサーキットブレーカーを持つ"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> Optional[CircuitBreaker]:
+        """URLのホストのブレーカー（初めてのホストなら作成）"""
+        host = urlparse(url).hostname
+        if not host:
+            return None
+        with self._lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(host, **self.settings)
+            return breaker
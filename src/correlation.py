@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""四半期指標と株価の相関を、窓の長さを指定して全四半期・全銘柄まとめて計算するエンジン
+
+各四半期について「その四半期を含む直近window四半期」の指標と株価（発表日翌日以降の始値）の
+相関係数を求める。PearsonとSpearman（同順位は平均順位）に対応し、複数銘柄を縦に並べた
+パネルでも、銘柄・四半期ごとのPythonのループを使わずに窓の添字を並べた2次元配列で一括計算する。
+
+既定（窓3四半期・Pearson・最新四半期のみ）はqq.calculate_stock_correlationsの従来の結果と同じ。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.growth_metrics import remaining_in_group
+
+
+# 株価と相関を取る指標列 → 結果の列
+CORRELATION_COLUMNS = {
+    '四半期成長率': '四半期成長率株価相関',
+    '経常益利回り': '経常益利回り株価相関',
+}
+
+PRICE_COLUMN = '始値'
+
+CORRELATION_METHODS = ('pearson', 'spearman')
+
+DEFAULT_WINDOW = 3
+
+# Spearmanの順位計算で一度に扱う窓の数（窓×窓長×窓長の比較配列の大きさを抑える）
+_RANK_CHUNK_ROWS = 65536
+
+
+@dataclass(frozen=True)
+class CorrelationSettings:
+    """相関の計算方法
+
+    window: 相関を取る四半期数（その四半期を含む直近window四半期）
+    method: 'pearson' または 'spearman'
+    rolling: Trueなら全四半期に値を設定、Falseなら最新四半期だけ
+    min_periods: 窓内で指標と株価が揃っている四半期の最小数（Noneならwindowと同じ＝全て必要）
+    """
+    window: int = DEFAULT_WINDOW
+    method: str = 'pearson'
+    rolling: bool = False
+    min_periods: Optional[int] = None
+
+    def __post_init__(self):
+        if self.window < 2:
+            raise ValueError(f"相関の窓は2四半期以上を指定してください: {self.window}")
+        if self.method not in CORRELATION_METHODS:
+            raise ValueError(f"相関の方式は {', '.join(CORRELATION_METHODS)} のいずれかです: {self.method}")
+        if self.min_periods is not None and not 2 <= self.min_periods <= self.window:
+            raise ValueError(f"min_periodsは2以上window以下を指定してください: {self.min_periods}")
+
+    @property
+    def required(self) -> int:
+        return self.min_periods if self.min_periods is not None else self.window
+
+
+def rolling_correlation(x: np.ndarray, y: np.ndarray, mask: np.ndarray, remaining: np.ndarray,
+                        settings: CorrelationSettings,
+                        starts: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """新しい順に並んだ配列の各行について、自身と後ろ（古い側）window-1行との相関を計算
+
+    maskは指標と株価が両方ある行、remainingは同じ銘柄内で後ろに続く行数（自身を含む）。
+    startsを指定するとその行の窓だけを計算する（最新四半期だけが必要な場合）。
+    (相関係数, 値があるか) を返す。窓内の値が揃っていてもばらつきがなければNaNになる。
+    """
+    if starts is None:
+        starts = np.arange(len(x))
+    if len(starts) == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+
+    # 各窓の位置を (窓の数, window) の添字配列にまとめ、銘柄をまたぐ位置と値がない位置は除く
+    offsets = np.arange(settings.window)
+    positions = np.minimum(starts[:, None] + offsets, len(x) - 1)
+    valid = (offsets < remaining[starts][:, None]) & mask[positions]
+    counts = valid.sum(axis=1)
+    available = counts >= settings.required
+
+    x_windows = x[positions]
+    y_windows = y[positions]
+    if settings.method == 'spearman':
+        x_windows = _window_ranks(x_windows, valid)
+        y_windows = _window_ranks(y_windows, valid)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = _pearson(x_windows, y_windows, valid, counts)
+    return result, available
+
+
+def _pearson(x: np.ndarray, y: np.ndarray, valid: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """窓ごとのPearsonの相関係数（np.corrcoefと同じく共分散を各標準偏差で順に割り、±1に収める）"""
+    safe_counts = np.maximum(counts, 1)
+    x_centered = np.where(valid, x - (np.where(valid, x, 0.0).sum(axis=1) / safe_counts)[:, None], 0.0)
+    y_centered = np.where(valid, y - (np.where(valid, y, 0.0).sum(axis=1) / safe_counts)[:, None], 0.0)
+    factor = np.maximum(counts - 1, 1)
+    covariance = (x_centered * y_centered).sum(axis=1) / factor
+    x_std = np.sqrt((x_centered * x_centered).sum(axis=1) / factor)
+    y_std = np.sqrt((y_centered * y_centered).sum(axis=1) / factor)
+    return np.clip(covariance / x_std / y_std, -1.0, 1.0)
+
+
+def _window_ranks(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """窓ごとの順位（1始まり、同値は平均順位、値がない位置は比較から除く）"""
+    ranks = np.zeros(values.shape, dtype=np.float64)
+    for start in range(0, len(values), _RANK_CHUNK_ROWS):
+        chunk = values[start:start + _RANK_CHUNK_ROWS]
+        chunk_valid = valid[start:start + _RANK_CHUNK_ROWS]
+        other = chunk[:, None, :]
+        other_valid = chunk_valid[:, None, :]
+        less = ((other < chunk[:, :, None]) & other_valid).sum(axis=2)
+        equal = ((other == chunk[:, :, None]) & other_valid).sum(axis=2)
+        ranks[start:start + _RANK_CHUNK_ROWS] = less + (equal + 1) / 2
+    return ranks
+
+
+def _latest_rows(groups: np.ndarray) -> np.ndarray:
+    """新しい順に並べた配列で各銘柄の先頭（最新四半期）の行か"""
+    latest = np.ones(len(groups), dtype=bool)
+    latest[1:] = groups[1:] != groups[:-1]
+    return latest
+
+
+def _to_float_array(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """値のリストを (float配列, 値があるか) に変換（Noneや数値でない値は値なし）"""
+    try:
+        # NoneはNaNになる
+        array = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        array = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+    return array, ~np.isnan(array)
+
+
+def calculate_correlations(data: List[Dict], settings: Optional[CorrelationSettings] = None) -> None:
+    """1銘柄の四半期データ（辞書のリスト）に株価相関の列を設定"""
+    settings = settings or get_default_correlation_settings()
+    for item in data:
+        for column in CORRELATION_COLUMNS.values():
+            item[column] = None
+    if not data:
+        return
+
+    # 決算期の新しい順（同じ決算期は元の順序のまま）
+    order = sorted(range(len(data)), key=lambda i: data[i]['決算期'], reverse=True)
+    ordered = [data[i] for i in order]
+    # 2つの指標列を別々の銘柄のように縦に並べ、1回の配列演算でまとめて計算する
+    n = len(ordered)
+    columns = list(CORRELATION_COLUMNS.items())
+    price, price_mask = _to_float_array([item.get(PRICE_COLUMN) for item in ordered] * len(columns))
+    values, mask = _to_float_array([item.get(source) for source, _ in columns for item in ordered])
+    remaining = np.tile(n - np.arange(n), len(columns))
+    starts = np.arange(n) if settings.rolling else np.zeros(1, dtype=np.int64)
+    all_starts = (starts[None, :] + n * np.arange(len(columns))[:, None]).ravel()
+    correlation, available = rolling_correlation(values, price, mask & price_mask, remaining, settings, all_starts)
+    for start, value in zip(all_starts[available].tolist(), correlation[available].tolist()):
+        ordered[start % n][columns[start // n][1]] = round(value, 3)
+
+
+def calculate_panel_correlations(frame: pd.DataFrame, group_column: str = 'コード',
+                                 settings: Optional[CorrelationSettings] = None) -> pd.DataFrame:
+    """複数銘柄の四半期データを縦に並べたフレームに株価相関の列を追加したコピーを返す
+
+    group_columnの値ごとに決算期の新しい順に並べ、全銘柄の窓をまとめて計算する。
+    """
+    settings = settings or get_default_correlation_settings()
+    result = frame.copy()
+    if frame.empty:
+        for column in CORRELATION_COLUMNS.values():
+            result[column] = pd.Series(dtype=object)
+        return result
+
+    groups, _ = pd.factorize(frame[group_column], sort=False)
+    _, period_codes = np.unique(frame['決算期'].astype(str).to_numpy(), return_inverse=True)
+    descending = np.lexsort((-period_codes.reshape(-1), groups))
+    sorted_groups = groups[descending].astype(np.int64)
+    remaining = remaining_in_group(sorted_groups)
+    starts = np.arange(len(frame)) if settings.rolling else np.flatnonzero(_latest_rows(sorted_groups))
+
+    price, price_mask = _to_float_array(frame[PRICE_COLUMN].to_numpy()[descending])
+    for source, target in CORRELATION_COLUMNS.items():
+        values, mask = _to_float_array(frame[source].to_numpy()[descending])
+        correlation, available = rolling_correlation(values, price, mask & price_mask, remaining, settings, starts)
+        column = np.full(len(frame), None, dtype=object)
+        column[descending[starts[available]]] = [round(value, 3) for value in correlation[available].tolist()]
+        result[target] = pd.Series(column, index=frame.index, dtype=object)
+    return result
+
+
+_default_settings = CorrelationSettings()
+
+
+def get_default_correlation_settings() -> CorrelationSettings:
+    """共有の相関の計算方法を取得"""
+    return _default_settings
+
+
+def set_default_correlation_settings(settings: CorrelationSettings) -> None:
+    """共有の相関の計算方法を設定（コマンドラインの指定を全銘柄の処理に反映するため）"""
+    global _default_settings
+    _default_settings = settings
+
+
+def add_correlation_arguments(parser) -> None:
+    """相関の計算方法を指定するコマンドラインオプションを追加"""
+    parser.add_argument('--corr-window', type=int, default=DEFAULT_WINDOW,
+                        help="株価相関を計算する四半期数（その四半期を含む直近N四半期）")
+    parser.add_argument('--corr-method', choices=CORRELATION_METHODS, default='pearson',
+                        help="株価相関の方式（spearmanは順位相関）")
+    parser.add_argument('--corr-rolling', action='store_true',
+                        help="株価相関を最新四半期だけでなく全四半期について計算する")
+
+
+def settings_from_args(args) -> CorrelationSettings:
+    """コマンドラインオプションから相関の計算方法を作成"""
+    return CorrelationSettings(window=args.corr_window, method=args.corr_method, rolling=args.corr_rolling)
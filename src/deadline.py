@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""銘柄ごとの処理期限（財務ページ・週足・PDFの取得をまとめた持ち時間）
+
+process_single_stockやパイプラインの各ステージはcode_deadline()で銘柄の期限をスレッドに設定し、
+HttpClientはその残り時間をタイムアウトの上限にする。期限を過ぎた後のリクエストは送らずに
+DeadlineExceededで失敗させ、取得を諦めた項目をDeadline.skippedに記録して部分結果とする。
+"""
+
+import contextlib
+import threading
+import time
+from typing import Callable, List, Optional
+
+import requests
+
+
+# 1銘柄の処理期限（秒）
+DEFAULT_CODE_DEADLINE = 300.0
+
+
+class DeadlineExceeded(requests.RequestException):
+    """銘柄の処理期限を過ぎたためリクエストを送らなかった"""
+
+
+class Deadline:
+    """1銘柄の処理期限と、期限切れで取得を諦めた項目"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.skipped: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """残り秒数（期限を過ぎていれば0）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def skip(self, part: str) -> None:
+        """期限切れで取得を諦めた項目を記録"""
+        with self._lock:
+            if part not in self.skipped:
+                self.skipped.append(part)
+
+
+_local = threading.local()
+_default_seconds: Optional[float] = DEFAULT_CODE_DEADLINE
+
+
+def get_default_code_deadline() -> Optional[float]:
+    """銘柄ごとの処理期限の秒数（Noneなら期限なし）"""
+    return _default_seconds
+
+
+def set_default_code_deadline(seconds: Optional[float]) -> None:
+    """銘柄ごとの処理期限の秒数を設定（Noneか0以下で期限なし）"""
+    global _default_seconds
+    _default_seconds = seconds if seconds and seconds > 0 else None
+
+
+def start_code_deadline() -> Optional[Deadline]:
+    """既定の秒数で1銘柄の処理期限を開始（期限なしの設定ならNone）"""
+    return Deadline(_default_seconds) if _default_seconds else None
+
+
+@contextlib.contextmanager
+def code_deadline(deadline: Optional[Deadline]):
+    """このスレッドで以降に送るリクエストにdeadlineを適用するコンテキスト"""
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline() -> Optional[Deadline]:
+    """このスレッドに設定されている処理期限（なければNone）"""
+    return getattr(_local, 'deadline', None)
+
+
+def bind_deadline(func: Callable) -> Callable:
+    """呼び出し元のスレッドの処理期限を、別のスレッドで実行するfuncにも適用する"""
+    deadline = current_deadline()
+
+    def run(*args, **kwargs):
+        with code_deadline(deadline):
+            return func(*args, **kwargs)
+    return run
+
+
+def note_deadline_skip(part: str) -> bool:
+    """処理期限を過ぎていればpartを取得を諦めた項目として記録し、Trueを返す"""
+    deadline = current_deadline()
+    if deadline is None or not deadline.expired:
+        return False
+    deadline.skip(part)
+    return True
+
+
+def partial_result_label() -> Optional[str]:
+    """期限切れで取得を諦めた項目（サマリーの部分結果列の値、なければNone）"""
+    deadline = current_deadline()
+    if deadline is None or not deadline.skipped:
+        return None
+    return ','.join(deadline.skipped)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""株探・TDnet PDFの接続先URL（環境変数で負荷試験用のサーバーなどに差し替え可能）
+
+KABUTAN_BASE_URL と TDNET_PDF_BASE_URL を設定すると、財務・週足ページとPDFの取得先が
+そのURLに変わる。例: KABUTAN_BASE_URL=http://127.0.0.1:8765
+"""
+
+import os
+from urllib.parse import urlparse
+
+
+DEFAULT_KABUTAN_BASE_URL = "https://kabutan.jp"
+DEFAULT_TDNET_PDF_BASE_URL = "https://tdnet-pdf.kabutan.jp"
+
+KABUTAN_BASE_URL_ENV = "KABUTAN_BASE_URL"
+TDNET_PDF_BASE_URL_ENV = "TDNET_PDF_BASE_URL"
+
+
+def kabutan_base_url() -> str:
+    """株探の接続先（末尾の/なし）"""
+    return os.environ.get(KABUTAN_BASE_URL_ENV, DEFAULT_KABUTAN_BASE_URL).rstrip('/')
+
+
+def tdnet_pdf_base_url() -> str:
+    """TDnet PDFの接続先（末尾の/なし）"""
+    return os.environ.get(TDNET_PDF_BASE_URL_ENV, DEFAULT_TDNET_PDF_BASE_URL).rstrip('/')
+
+
+def kabutan_host() -> str:
+    """株探の接続先のホスト名（レートリミッタの予算の単位）"""
+    return urlparse(kabutan_base_url()).hostname or ''
+
+
+def tdnet_pdf_host() -> str:
+    """TDnet PDFの接続先のホスト名"""
+    return urlparse(tdnet_pdf_base_url()).hostname or ''
+
+
+def finance_url(code: str) -> str:
+    """財務ページのURL"""
+    return f"{kabutan_base_url()}/stock/finance?code={code}"
+
+
+def weekly_url(code: str, page: int) -> str:
+    """週足ページのURL"""
+    return f"{kabutan_base_url()}/stock/kabuka?code={code}&ashi=wek&page={page}"
+
+
+def tdnet_pdf_url(date: str, file_id: str) -> str:
+    """TDnetの開示PDFのURL（dateはYYYYMMDD）"""
+    return f"{tdnet_pdf_base_url()}/{date}/{file_id}.pdf"
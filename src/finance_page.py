@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""株探の財務ページ（/stock/finance）をlxmlで1回だけ解析して必要な情報をまとめて取り出す"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional
+
+import lxml.html
+from lxml import etree
+
+from src.endpoints import kabutan_base_url, tdnet_pdf_url
+
+
+# 決算月の検出パターン（上から順に試す）
+# パターン1: YYYY.MM形式（通期テーブルの標準形式）、最新年度の決算月を使うため最後の一致を採用
+_YEAR_MONTH_PATTERN = re.compile(r'(\d{4})\.(\d{2})')
+# パターン2: 連 YYYY.MM形式
+_CONSOLIDATED_PATTERN = re.compile(r'連.*?(\d{4})\.(\d{2})')
+# パターン3: 単体 YYYY.MM形式
+_NON_CONSOLIDATED_PATTERN = re.compile(r'単体.*?(\d{4})\.(\d{2})')
+# パターン4: 四半期の期間（XX.XX-XX）の終了月
+_QUARTER_END_PATTERN = re.compile(r'\d{2}\.\d{2}-(\d{2})')
+
+# 四半期データ行の識別：XX.XX-XX形式を含む行
+_PERIOD_PATTERN = re.compile(r'\d{2}\.\d{2}-\d{2}')
+_PERIOD_CAPTURE_PATTERN = re.compile(r'(\d{2}\.\d{2}-\d{2})')
+_DISCLOSURE_PDF_PATTERN = re.compile(r'/disclosures/pdf/(\d{8})/(\d+)/')
+
+_TABLE_XPATH = etree.XPath('//table')
+_ROW_XPATH = etree.XPath('.//tr')
+_CELL_XPATH = etree.XPath('.//td | .//th')
+_LINK_XPATH = etree.XPath('.//a')
+
+# 行の先頭セルの数字を0に置き換えた形で四半期・通期のテーブルを絞り込む
+# （XPath内で判定し、関係のないテーブル・行をPythonで走査しない）
+_FIRST_CELL_DIGITS = 'translate((.//td | .//th)[1], "123456789", "000000000")'
+_QUARTERLY_ROW = f'.//tr[contains({_FIRST_CELL_DIGITS}, "00.00-00")]'
+_ANNUAL_ROW = f'.//tr[contains({_FIRST_CELL_DIGITS}, "0000.00")]'
+# 四半期データ（XX.XX-XX）の行を含むテーブルと、その行
+_QUARTERLY_TABLE_XPATH = etree.XPath(f'//table[{_QUARTERLY_ROW}]')
+_QUARTERLY_ROW_XPATH = etree.XPath(_QUARTERLY_ROW)
+# 通期テーブル：先頭セルが「決算期」の見出し行と、YYYY.MM形式の決算期の行を含む最初のテーブル
+_ANNUAL_TABLE_XPATH = etree.XPath(
+    f'(//table[.//tr[normalize-space((.//td | .//th)[1]) = "決算期"]][{_ANNUAL_ROW}])[1]'
+)
+_ANNUAL_ROW_XPATH = etree.XPath(_ANNUAL_ROW)
+
+# 四半期データがこの行数以上あるテーブルを使用（最も完全なデータ）
+MIN_QUARTERLY_ROWS = 8
+
+
+@dataclass
+class FinancePage:
+    """財務ページの解析結果"""
+    fiscal_year_end_month: int
+    quarterly_rows: List[Dict] = field(default_factory=list)
+    disclosure_links: List[str] = field(default_factory=list)
+
+
+def parse_finance_page(html: str) -> FinancePage:
+    """財務ページを解析し、決算月・四半期データ行・開示PDFのリンクを返す"""
+    root = parse_document(html)
+    quarterly_rows = extract_quarterly_rows(root)
+    return FinancePage(
+        fiscal_year_end_month=find_fiscal_year_end_month(html, root),
+        quarterly_rows=quarterly_rows,
+        disclosure_links=[row['PDF_URL'] for row in quarterly_rows if row.get('PDF_URL')],
+    )
+
+
+def parse_document(html: str) -> Optional[etree._Element]:
+    """HTMLをlxmlのツリーに変換（空のページはNone）"""
+    if not html or not html.strip():
+        return None
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # XML宣言付きの文字列はlxmlが受け付けないためバイト列で渡す
+        return lxml.html.document_fromstring(html.encode('utf-8'))
+
+
+def _cell_text(cell: etree._Element) -> str:
+    """セルのテキストを前後の空白を除いて取得"""
+    return cell.text_content().strip()
+
+
+def find_fiscal_year_end_month(html: str, root: Optional[etree._Element] = None) -> int:
+    """通期データから決算月を取得（例：3月決算なら3を返す）
+
+    通期テーブルの決算期の列から取得する。通期テーブルが見つからない場合だけ、
+    ページ全体を正規表現で1回ずつ走査する。
+    """
+    html = html or ''
+    if root is None:
+        root = parse_document(html)
+
+    month = _annual_table_month(root)
+    if month is not None:
+        return month
+
+    matches = _YEAR_MONTH_PATTERN.findall(html)
+    if matches:
+        # 複数年度のデータがある場合、最新年度の決算月を取得
+        return int(matches[-1][1])
+
+    match = _CONSOLIDATED_PATTERN.search(html)
+    if match:
+        return int(match.group(2))
+
+    match = _NON_CONSOLIDATED_PATTERN.search(html)
+    if match:
+        return int(match.group(2))
+
+    # 四半期データから推定（全月対応）
+    end_months = [int(m) for m in _QUARTER_END_PATTERN.findall(html) if 1 <= int(m) <= 12]
+    if end_months:
+        # 最も頻繁に現れる決算月候補を返す
+        return Counter(end_months).most_common(1)[0][0]
+
+    print("デバッグ: 決算月検出に失敗、HTMLの内容を確認します...")
+    # デバッグ用：HTMLの一部を表示
+    all_text = root.text_content() if root is not None else ''
+    relevant_lines = [line.strip() for line in all_text.split('\n')
+                      if (re.search(r'\d{4}\.\d{2}', line) or _PERIOD_PATTERN.search(line))
+                      and line.strip()]
+    for line in relevant_lines[:10]:  # 最初の10行を表示
+        print(f"  {line}")
+
+    # デフォルトは3月決算
+    return 3
+
+
+def _annual_table_month(root: Optional[etree._Element]) -> Optional[int]:
+    """通期テーブルの決算期の列から最新年度の決算月を取得（通期テーブルがなければNone）"""
+    tables = _ANNUAL_TABLE_XPATH(root) if root is not None else []
+    if not tables:
+        return None
+    # 複数年度のデータがある場合、最新年度（最後の行）の決算月を使う
+    last_period = _cell_text(_CELL_XPATH(_ANNUAL_ROW_XPATH(tables[0])[-1])[0])
+    return int(_YEAR_MONTH_PATTERN.findall(last_period)[-1][1])
+
+
+def extract_quarterly_rows(root: Optional[etree._Element]) -> List[Dict]:
+    """四半期データのテーブルから各行を抽出（決算期の古い順）"""
+    tables = _QUARTERLY_TABLE_XPATH(root) if root is not None else []
+    quarterly_data = []
+    for table in tables:
+        # このテーブルで決算期（XX.XX-XX）から始まる行
+        quarterly_rows = [_CELL_XPATH(row) for row in _QUARTERLY_ROW_XPATH(table)]
+
+        # デバッグ情報：このテーブルで見つかった四半期データ行数
+        if quarterly_rows:
+            print(f"テーブル内で四半期データを{len(quarterly_rows)}行発見")
+            for i, cells in enumerate(quarterly_rows[:3]):  # 最初の3行を表示
+                print(f"  行{i+1}: {_cell_text(cells[0])}")
+
+        if len(quarterly_rows) >= MIN_QUARTERLY_ROWS:
+            print(f"四半期データテーブルを発見: {len(quarterly_rows)}行")
+            for cells in quarterly_rows:
+                data = _parse_quarterly_cells(cells)
+                if data:
+                    quarterly_data.append(data)
+            break  # 最初に見つかった完全なテーブルを使用
+
+    if not quarterly_data:
+        _print_missing_quarterly_debug(_TABLE_XPATH(root) if root is not None else [])
+
+    # 決算期でソート（古い順）
+    quarterly_data.sort(key=lambda x: x['決算期'])
+    return quarterly_data
+
+
+def _parse_quarterly_cells(cells: List[etree._Element]) -> Optional[Dict]:
+    """四半期データ行のセルから1期分のデータを作成（列が足りない行はNone）"""
+    if len(cells) < 8:
+        return None
+
+    # 決算期 (例: I   　 24.07-09)
+    period_match = _PERIOD_CAPTURE_PATTERN.search(_cell_text(cells[0]))
+    if not period_match:
+        return None
+
+    data = {'決算期': period_match.group(1)}
+    data['売上高'] = parse_number(_cell_text(cells[1]))
+    data['営業益'] = parse_number(_cell_text(cells[2]))
+    data['経常益'] = parse_number(_cell_text(cells[3]))
+    data['最終益'] = parse_number(_cell_text(cells[4]))
+    data['修正1株益'] = parse_number(_cell_text(cells[5]))
+
+    # 発表日とPDFリンク
+    announcement_cell = cells[7]
+    data['発表日'] = _cell_text(announcement_cell)
+    links = _LINK_XPATH(announcement_cell)
+    href = links[0].get('href') if links else None
+    data['PDF_URL'] = normalize_disclosure_url(href) if href else None
+    return data
+
+
+def normalize_disclosure_url(href: str) -> str:
+    """株探の開示リンクをPDFのURLに変換
+
+    例: /disclosures/pdf/20250807/140120250805531214/
+    → https://tdnet-pdf.kabutan.jp/20250807/140120250805531214.pdf
+    """
+    if '/disclosures/pdf/' in href:
+        match = _DISCLOSURE_PDF_PATTERN.search(href)
+        if match:
+            return tdnet_pdf_url(match.group(1), match.group(2))
+    return f"{kabutan_base_url()}{href}" if href.startswith('/') else href
+
+
+def _print_missing_quarterly_debug(tables: List[etree._Element]) -> None:
+    """四半期データが全く見つからない場合の詳細情報を表示"""
+    print("\nデバッグ: 四半期データが見つからない詳細情報")
+    print(f"全テーブル数: {len(tables)}")
+
+    # 「I」で始まる行をすべて表示
+    all_i_rows = []
+    for table in tables:
+        for row in _ROW_XPATH(table):
+            cells = _CELL_XPATH(row)
+            if cells:
+                first_cell = _cell_text(cells[0])
+                if first_cell.startswith('I'):
+                    all_i_rows.append(first_cell)
+
+    print(f"「I」で始まる行の数: {len(all_i_rows)}")
+    for i, row_text in enumerate(all_i_rows[:10]):  # 最初の10行を表示
+        print(f"  I行{i+1}: {row_text}")
+        # パターンマッチの確認
+        has_length = len(row_text) > 8
+        has_pattern = bool(_PERIOD_PATTERN.search(row_text))
+        print(f"    長さ>8: {has_length}, パターンマッチ: {has_pattern}")
+
+
+def parse_number(text: str) -> Optional[float]:
+    """数値文字列をパース"""
+    if not text or text == '-' or text == '－':
+        return None
+
+    # カンマを除去し、マイナス記号を正規化
+    text = text.replace(',', '').replace('－', '-')
+
+    try:
+        return float(text)
+    except ValueError:
+        return None
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""四半期成長率・経常益利回り・四半期割安率を配列演算でまとめて計算するエンジン
+
+qq.calculate_qoq_growth_rateと同じ結果（浮動小数点の演算順序とround(x, 2)まで一致）を返す。
+複数銘柄を縦に並べたパネルでも銘柄ごとに区切って一括計算できる。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# 計算結果として追加する列
+GROWTH_METRIC_COLUMNS = [
+    '四半期',
+    '経常益利回り',
+    '四半期成長率',
+    '売上高成長率',
+    '四半期割安率_四半期平均',
+    '四半期割安率_前年同期ベース',
+    '四半期割安率_前四半期',
+]
+
+# 経常益利回りの年換算係数（1Q〜4Q）。1Qは累計ではなく当該四半期の経常益に掛ける
+_ANNUALIZATION_FACTORS = (4, 2, 1.33, 1)
+
+# 年度キーを作る際の年度の桁（年度は2桁の年+1まで）
+_FISCAL_YEAR_SPAN = 1000
+
+
+def determine_quarter(period: str, fiscal_year_end_month: int) -> str:
+    """決算期から四半期（1Q〜4Q）を判定（決算月を基準に動的計算）"""
+    # 期間から終了月を取得（例: "24.07-09" -> 9）
+    if '-' in period:
+        end_month = int(period.split('-')[1])
+    else:
+        return None
+
+    # 決算月を基準に各四半期の終了月を計算
+    # 4Q: 決算月
+    # 3Q: 決算月-3 (1月未満の場合は+12して前年)
+    # 2Q: 決算月+6 (13月以上の場合は-12して翌年)
+    # 1Q: 決算月+3 (13月以上の場合は-12して翌年)
+
+    q4_end = fiscal_year_end_month
+    q3_end = (fiscal_year_end_month - 3) if fiscal_year_end_month > 3 else (fiscal_year_end_month - 3 + 12)
+    q2_end = (fiscal_year_end_month + 6) if fiscal_year_end_month <= 6 else (fiscal_year_end_month + 6 - 12)
+    q1_end = (fiscal_year_end_month + 3) if fiscal_year_end_month <= 9 else (fiscal_year_end_month + 3 - 12)
+
+    if end_month == q1_end:
+        return "1Q"
+    elif end_month == q2_end:
+        return "2Q"
+    elif end_month == q3_end:
+        return "3Q"
+    elif end_month == q4_end:
+        return "4Q"
+
+    return None
+
+
+def determine_fiscal_year(period: str, fiscal_year_end_month: int) -> int:
+    """決算期の属する年度（2桁の年）を判定（終了月が決算月より後なら翌年度）"""
+    base_year = int(period[:2])
+    end_month = int(period.split('-')[1]) if '-' in period else None
+    if end_month and end_month > fiscal_year_end_month:
+        return base_year + 1
+    return base_year
+
+
+def calculate_growth_metrics(data: List[Dict], fiscal_year_end_month: int = 3) -> List[Dict]:
+    """四半期データ（1銘柄分の辞書のリスト）に成長率などの指標を追加して返す"""
+    if not data:
+        return data
+
+    columns = {
+        name: _column_from_records(data, name) for name in ('経常益', '売上高', '資本合計')
+    }
+    metrics = _compute_metrics(
+        [item['決算期'] for item in data],
+        np.zeros(len(data), dtype=np.int64),
+        np.full(len(data), fiscal_year_end_month, dtype=np.int64),
+        columns,
+    )
+    for name in GROWTH_METRIC_COLUMNS:
+        for item, value in zip(data, metrics[name]):
+            item[name] = value
+    return data
+
+
+def calculate_panel_growth_metrics(frame: pd.DataFrame, group_column: str = 'コード',
+                                   fiscal_year_end_month: int = 3,
+                                   fiscal_month_column: Optional[str] = None) -> pd.DataFrame:
+    """複数銘柄の四半期データを縦に並べたフレームに指標列を追加したコピーを返す
+
+    group_columnの値ごとに区切って計算する。銘柄ごとに決算月が違う場合は
+    fiscal_month_columnに決算月の列を指定する。欠損値（NaN/None）は値なしとして扱う。
+    """
+    result = frame.copy()
+    if frame.empty:
+        for name in GROWTH_METRIC_COLUMNS:
+            result[name] = pd.Series(dtype=object)
+        return result
+
+    groups, _ = pd.factorize(frame[group_column], sort=False)
+    if fiscal_month_column:
+        fiscal_months = frame[fiscal_month_column].to_numpy(dtype=np.int64)
+    else:
+        fiscal_months = np.full(len(frame), fiscal_year_end_month, dtype=np.int64)
+
+    columns = {}
+    for name in ('経常益', '売上高', '資本合計'):
+        values = pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=np.float64)
+        mask = ~np.isnan(values)
+        columns[name] = (np.where(mask, values, 0.0), mask)
+
+    metrics = _compute_metrics(frame['決算期'].tolist(), groups.astype(np.int64), fiscal_months, columns)
+    for name in GROWTH_METRIC_COLUMNS:
+        result[name] = pd.Series(metrics[name], index=frame.index, dtype=object)
+    return result
+
+
+def _column_from_records(data: List[Dict], name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """辞書のリストから (値の配列, 値があるかのマスク) を作成（Noneは0.0で埋める）"""
+    mask = np.array([item.get(name) is not None for item in data], dtype=bool)
+    values = np.array([item.get(name) if item.get(name) is not None else 0.0 for item in data],
+                      dtype=np.float64)
+    return values, mask
+
+
+def _compute_metrics(periods: Sequence[str], groups: np.ndarray, fiscal_months: np.ndarray,
+                     columns: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> Dict[str, List]:
+    """指標を計算し、入力行の順に並んだ値のリスト（値なしはNone）を列ごとに返す"""
+    n = len(periods)
+
+    # 決算期・決算月の組ごとに四半期と年度を1回だけ判定
+    labels = {}
+    quarters = []
+    fiscal_years = np.empty(n, dtype=np.int64)
+    for i, key in enumerate(zip(periods, fiscal_months.tolist())):
+        if key not in labels:
+            labels[key] = (determine_quarter(*key), determine_fiscal_year(*key))
+        quarter, fiscal_years[i] = labels[key]
+        quarters.append(quarter)
+    quarter_numbers = np.array([int(q[0]) if q else 0 for q in quarters], dtype=np.int64)
+
+    # 決算期の文字列順を整数に置き換え（同じ決算期の行は元の順序を保つ安定ソートで並べる）
+    _, period_codes = np.unique(np.asarray(periods, dtype=str), return_inverse=True)
+    period_codes = period_codes.reshape(-1)
+    ascending = np.lexsort((period_codes, groups))
+    descending = np.lexsort((-period_codes, groups))
+
+    yields, yield_mask = _compute_ordinary_income_yield(
+        ascending, groups, fiscal_years, quarter_numbers, columns['経常益'], columns['資本合計'])
+
+    ordinary_income = columns['経常益']
+    sales = columns['売上高']
+    metrics = {
+        '四半期': quarters,
+        '経常益利回り': _to_list(yields, yield_mask, round_values=False),
+    }
+
+    # 成長率系は新しい順に並べ、同じ銘柄内でk期前の値を参照する
+    remaining = remaining_in_group(groups[descending])
+    growth_inputs = {
+        '四半期成長率': (ordinary_income[0][descending], ordinary_income[1][descending]),
+        '売上高成長率': (sales[0][descending], sales[1][descending]),
+        '四半期割安率_四半期平均': (yields[descending], yield_mask[descending]),
+    }
+    for name, (values, mask) in growth_inputs.items():
+        out, out_mask = _four_quarter_growth(values, mask, remaining)
+        metrics[name] = _to_list(out, out_mask, descending)
+
+    values, mask = yields[descending], yield_mask[descending]
+    for name, lag in (('四半期割安率_前年同期ベース', 4), ('四半期割安率_前四半期', 1)):
+        lagged, lagged_mask = _lag(values, mask, remaining, lag)
+        metrics[name] = _to_list(values - lagged, mask & lagged_mask, descending)
+
+    return metrics
+
+
+def _compute_ordinary_income_yield(ascending: np.ndarray, groups: np.ndarray, fiscal_years: np.ndarray,
+                                   quarter_numbers: np.ndarray,
+                                   ordinary_income: Tuple[np.ndarray, np.ndarray],
+                                   capital: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """年度内の累計経常益を年換算して資本合計で割った利回り（%、round済み）を計算"""
+    n = len(groups)
+    yields = np.zeros(n, dtype=np.float64)
+    yield_mask = np.zeros(n, dtype=bool)
+
+    # 同じ銘柄・年度・四半期の行が複数ある場合は古い順で後の行だけを使う
+    candidates = ascending[quarter_numbers[ascending] > 0]
+    if len(candidates) == 0:
+        return yields, yield_mask
+    segment_keys = groups[candidates] * _FISCAL_YEAR_SPAN + fiscal_years[candidates]
+    row_keys = segment_keys * 4 + quarter_numbers[candidates] - 1
+    _, last_positions = np.unique(row_keys[::-1], return_index=True)
+    rows = candidates[::-1][last_positions]
+    segments, segment_index = np.unique(segment_keys[::-1][last_positions], return_inverse=True)
+    segment_index = segment_index.reshape(-1)
+    quarter_index = quarter_numbers[rows] - 1
+
+    # 1Q〜4Qの順に累計（値のない四半期は0.0を足すので累計は変わらない）
+    income_values, income_mask = ordinary_income
+    has_income = income_mask[rows]
+    matrix = np.zeros((len(segments), 4), dtype=np.float64)
+    matrix[segment_index[has_income], quarter_index[has_income]] = income_values[rows[has_income]]
+    cumulative = np.empty_like(matrix)
+    running = np.zeros(len(segments), dtype=np.float64)
+    for q in range(4):
+        running = running + matrix[:, q]
+        cumulative[:, q] = running
+
+    capital_values, capital_mask = capital
+    cap = capital_values[rows]
+    valid = has_income & capital_mask[rows] & (cap != 0)
+    base = np.where(quarter_index == 0, income_values[rows], cumulative[segment_index, quarter_index])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = np.select(
+            [quarter_index == q for q in range(4)],
+            [(base * factor / cap) * 100 if factor != 1 else (base / cap) * 100
+             for factor in _ANNUALIZATION_FACTORS],
+        )
+
+    # 後続の割安率は丸めた利回りから計算するため、ここでround(x, 2)を適用する
+    yields[rows[valid]] = [round(value, 2) for value in raw[valid].tolist()]
+    yield_mask[rows[valid]] = True
+    return yields, yield_mask
+
+
+def remaining_in_group(groups: np.ndarray) -> np.ndarray:
+    """並べ替え済みの各行について、同じ銘柄内で後ろに続く行数（自身を含む）を返す"""
+    n = len(groups)
+    boundaries = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    ends = np.append(boundaries, n)
+    sizes = np.diff(np.append(0, ends))
+    return np.repeat(ends, sizes) - np.arange(n)
+
+
+def _lag(values: np.ndarray, mask: np.ndarray, remaining: np.ndarray,
+         lag: int) -> Tuple[np.ndarray, np.ndarray]:
+    """新しい順の配列でlag期前（後ろの行）の値とマスクを取得（銘柄をまたぐ場合は値なし）"""
+    lagged = np.zeros_like(values)
+    lagged_mask = np.zeros_like(mask)
+    if lag < len(values):
+        lagged[:-lag] = values[lag:]
+        lagged_mask[:-lag] = mask[lag:]
+    return lagged, lagged_mask & (remaining > lag)
+
+
+def _four_quarter_growth(values: np.ndarray, mask: np.ndarray,
+                         remaining: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(現四半期 - 4期前) / (現四半期〜3期前の絶対値の合計) * 100 を計算
+
+    分母は現四半期から順に1つずつ足す（組み込みのsumと同じ順序）。
+    """
+    lags = [_lag(values, mask, remaining, lag) for lag in range(1, 5)]
+    valid = mask.copy()
+    for _, lag_mask in lags:
+        valid &= lag_mask
+
+    denominator = np.abs(values)
+    for lag_values, _ in lags[:3]:
+        denominator = denominator + np.abs(lag_values)
+    valid &= denominator != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = ((values - lags[3][0]) / denominator) * 100
+    return growth, valid
+
+
+def _to_list(values: np.ndarray, mask: np.ndarray, order: Optional[np.ndarray] = None,
+             round_values: bool = True) -> List[Optional[float]]:
+    """値をround(x, 2)したPythonのfloat（マスク外はNone）のリストにし、入力行の順に戻す"""
+    out: List[Optional[float]] = [None] * len(values)
+    positions = order if order is not None else np.arange(len(values))
+    for position, value, ok in zip(positions.tolist(), values.tolist(), mask.tolist()):
+        if ok:
+            out[position] = round(value, 2) if round_values else value
+    return out
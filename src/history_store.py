@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""四半期指標の履歴を決算期ごとのParquetファイルに蓄積するストア（pyarrowが必要）
+
+data/history/quarterly/決算期=25.04-06/part.parquet のように決算期でパーティションを分け、
+(コード, 決算期) 単位で上書き追加する。特定の決算期の全銘柄は1ファイルを読むだけで取得できる。
+作業キューの複数ワーカーが同じパーティションを書き換えても壊れないよう、書き換えは
+パーティションごとのロックファイルで直列化する。
+"""
+
+import contextlib
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+DEFAULT_HISTORY_PATH = "data/history/quarterly"
+
+_PARTITION_PREFIX = "決算期="
+_PARTITION_FILE = "part.parquet"
+_LOCK_FILE = ".lock"
+
+# 金額（百万円）と株価はfloat32では桁が足りないためfloat64で保持
+AMOUNT_COLUMNS = ['売上高', '営業益', '経常益', '最終益', '修正1株益', '資産合計', '資本合計', '始値']
+
+# 比率・相関はfloat32で保持
+METRIC_COLUMNS = [
+    '売上高成長率', '四半期成長率', '経常益利回り',
+    '四半期割安率_四半期平均', '四半期割安率_前年同期ベース', '四半期割安率_前四半期',
+    '四半期成長率株価相関', '経常益利回り株価相関',
+]
+
+DATE_COLUMNS = ['発表日', '株価日付']
+
+QUARTER_LABELS = ['1Q', '2Q', '3Q', '4Q']
+
+# 1銘柄分の追加をまとめて書き出すまでに貯める銘柄数
+DEFAULT_FLUSH_EVERY = 200
+
+
+def _history_schema():
+    """履歴ファイルのスキーマ（列の型）"""
+    import pyarrow as pa
+    fields = [
+        pa.field('コード', pa.string()),
+        pa.field('決算期', pa.string()),
+        pa.field('四半期', pa.dictionary(pa.int8(), pa.string())),
+    ]
+    fields += [pa.field(name, pa.float64()) for name in AMOUNT_COLUMNS]
+    fields += [pa.field(name, pa.float32()) for name in METRIC_COLUMNS]
+    fields += [pa.field(name, pa.date32()) for name in DATE_COLUMNS]
+    fields += [
+        pa.field('PDF_URL', pa.string()),
+        pa.field('実行日時', pa.timestamp('s')),
+    ]
+    return pa.schema(fields)
+
+
+@contextlib.contextmanager
+def _partition_lock(directory: str):
+    """パーティションの書き換えを他のプロセス・スレッドと直列化するロック"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, _LOCK_FILE), 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _parse_date_column(values: pd.Series) -> pd.Series:
+    """「24/11/10」「2024/12/27」形式の日付文字列を日付に変換（不正な値はNaT）"""
+    text = values.astype('string')
+    short = pd.to_datetime(text, format='%y/%m/%d', errors='coerce')
+    full = pd.to_datetime(text, format='%Y/%m/%d', errors='coerce')
+    return short.fillna(full).dt.date
+
+
+class QuarterlyHistoryStore:
+    """全銘柄・全四半期の指標を実行日時つきで保持する履歴ストア
+
+    add()で銘柄ごとの四半期データを貯め、flush()で決算期ごとのファイルを1回ずつ書き換える。
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, flush_every: int = DEFAULT_FLUSH_EVERY):
+        import pyarrow  # noqa: F401  pyarrowがなければここでImportError
+
+        self.path = path
+        self.flush_every = flush_every
+        # 同じ実行で追加した行には同じ実行日時を記録する
+        self.run_at = datetime.now()
+        self.schema = _history_schema()
+        self._pending: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def partition_path(self, period: str) -> str:
+        """決算期のパーティションファイルのパス"""
+        return os.path.join(self.path, f"{_PARTITION_PREFIX}{period}", _PARTITION_FILE)
+
+    def add(self, code: str, quarterly_data: List[Dict], run_at: Optional[datetime] = None) -> None:
+        """1銘柄の四半期データを追加（flush_every銘柄ごとにまとめて書き出す）"""
+        run_at = run_at or self.run_at
+        rows = []
+        for item in quarterly_data:
+            if not item.get('決算期'):
+                continue
+            row = {name: item.get(name) for name in self.schema.names}
+            row['コード'] = code
+            row['実行日時'] = run_at
+            rows.append(row)
+
+        with self._lock:
+            self._pending[code] = rows
+            should_flush = len(self._pending) >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def upsert(self, code: str, quarterly_data: List[Dict], run_at: Optional[datetime] = None) -> None:
+        """1銘柄の四半期データをすぐに書き込む"""
+        self.add(code, quarterly_data, run_at)
+        self.flush()
+
+    def flush(self) -> None:
+        """貯めた行を決算期ごとにまとめ、既存の同じ銘柄の行を置き換えて書き出す
+
+        書き出しに失敗した場合は貯めた行を戻してから例外を送出する（次のflushで書き直す）。
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            rows = [row for code_rows in pending.values() for row in code_rows]
+            if not rows:
+                return
+
+            try:
+                frame = pd.DataFrame(rows, columns=self.schema.names)
+                for period, new_rows in frame.groupby('決算期', sort=False):
+                    self._write_partition(period, new_rows)
+            except Exception:
+                # 書き出し済みの決算期は同じ行で置き換わるだけなので、全銘柄分を戻してよい
+                for code, code_rows in pending.items():
+                    self._pending.setdefault(code, code_rows)
+                raise
+
+    def _write_partition(self, period: str, new_rows: pd.DataFrame) -> None:
+        """1つの決算期のファイルを書き換え（ロックを取って読み込み、一時ファイル経由で置き換え）"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        new_table = pa.Table.from_pandas(self._coerce(new_rows), schema=self.schema, preserve_index=False)
+        path = self.partition_path(period)
+        with _partition_lock(os.path.dirname(path)):
+            if os.path.exists(path):
+                existing = pq.read_table(path, schema=self.schema)
+                codes = pa.array(new_rows['コード'].unique(), type=pa.string())
+                keep = pc.invert(pc.is_in(existing['コード'], value_set=codes))
+                new_table = pa.concat_tables([existing.filter(keep), new_table])
+
+            # 一時ファイルは書き込みごとに別名にし、失敗しても他の書き込みと混ざらないようにする
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                pq.write_table(new_table.unify_dictionaries(), tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _coerce(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """pandasの列をスキーマの型に合わせて変換"""
+        frame = frame.copy()
+        for name in AMOUNT_COLUMNS:
+            frame[name] = pd.to_numeric(frame[name], errors='coerce').astype('float64')
+        for name in METRIC_COLUMNS:
+            frame[name] = pd.to_numeric(frame[name], errors='coerce').astype('float32')
+        for name in DATE_COLUMNS:
+            frame[name] = _parse_date_column(frame[name])
+        frame['四半期'] = pd.Categorical(frame['四半期'], categories=QUARTER_LABELS)
+        frame['実行日時'] = pd.to_datetime(frame['実行日時']).dt.floor('s')
+        return frame
+
+    def periods(self) -> List[str]:
+        """保存されている決算期の一覧（古い順）"""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name[len(_PARTITION_PREFIX):] for name in os.listdir(self.path)
+            if name.startswith(_PARTITION_PREFIX)
+            and os.path.exists(os.path.join(self.path, name, _PARTITION_FILE))
+        )
+
+    def read_period(self, period: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """1つの決算期の全銘柄の行を読む（そのパーティションのファイルだけを読む）"""
+        import pyarrow.parquet as pq
+
+        path = self.partition_path(period)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=columns or self.schema.names)
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    def read_code(self, code: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """1銘柄の全決算期の行を読む（決算期の古い順）"""
+        import pyarrow.dataset as ds
+
+        periods = self.periods()
+        if not periods:
+            return pd.DataFrame(columns=columns or self.schema.names)
+        dataset = ds.dataset([self.partition_path(period) for period in periods],
+                             schema=self.schema, format='parquet')
+        table = dataset.to_table(columns=columns, filter=ds.field('コード') == code)
+        frame = table.to_pandas()
+        if '決算期' in frame.columns:
+            frame = frame.sort_values('決算期', kind='stable').reset_index(drop=True)
+        return frame
+
+
+_default_store: Optional[QuarterlyHistoryStore] = None
+
+
+def get_default_history_store() -> Optional[QuarterlyHistoryStore]:
+    """共有の履歴ストアを取得（有効化されていなければNone）"""
+    return _default_store
+
+
+def set_default_history_store(store: Optional[QuarterlyHistoryStore]) -> None:
+    """共有の履歴ストアを設定（Noneで履歴の保存を止める）"""
+    global _default_store
+    _default_store = store
+
+
+def enable_history_store(path: str = DEFAULT_HISTORY_PATH) -> Optional[QuarterlyHistoryStore]:
+    """履歴ストアを作成して共有に設定（pyarrowがなければ警告を表示してNone）"""
+    try:
+        store = QuarterlyHistoryStore(path)
+    except ImportError:
+        print("警告: pyarrowがインストールされていないため履歴を保存しません")
+        return None
+    set_default_history_store(store)
+    return store
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""株探ページの永続HTTPレスポンスキャッシュ（SQLite）"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from src.http_client import HttpClient, get_default_client
+
+
+DEFAULT_CACHE_PATH = "data/cache/http_cache.sqlite3"
+
+# キャッシュ全体の上限サイズ（超えたら最終アクセスが古い順に削除）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# URL種別ごとの有効期限（秒）
+# 財務ページは決算発表時以外ほぼ変化しない、週足ページは毎日変化する
+DEFAULT_TTLS = {
+    'finance': 12 * 60 * 60,
+    'weekly': 4 * 60 * 60,
+    'default': 60 * 60,
+}
+
+
+def classify_url(url: str) -> str:
+    """URLからキャッシュ種別を判定"""
+    if '/stock/finance' in url:
+        return 'finance'
+    if '/stock/kabuka' in url:
+        return 'weekly'
+    return 'default'
+
+
+@dataclass
+class CacheEntry:
+    """キャッシュされたレスポンス"""
+    url: str
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    fresh: bool
+
+
+class HttpCache:
+    """URL単位のレスポンスキャッシュ（TTL・条件付きGET・LRU削除）"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        self._conn.commit()
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """キャッシュを検索（期限切れでも条件付きGET用に返す）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+
+        body, etag, last_modified, fetched_at = row
+        ttl = self.ttls.get(classify_url(url), self.ttls['default'])
+        return CacheEntry(url, body, etag, last_modified, fetched_at, now - fetched_at < ttl)
+
+    def store(self, url: str, body: str, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """レスポンスを保存し、上限を超えた分を削除"""
+        now = time.time()
+        size = len(body.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses
+                   (url, body, etag, last_modified, fetched_at, last_access, size)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (url, body, etag, last_modified, now, now, size)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url: str) -> None:
+        """304応答時に取得時刻を更新（有効期限を延長）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, last_access = ? WHERE url = ?",
+                (now, now, url)
+            )
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """合計サイズが上限以下になるまで最終アクセスが古いものから削除"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT url, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[HttpCache] = None
+_cache_disabled = False
+
+
+def get_default_cache() -> Optional[HttpCache]:
+    """共有キャッシュを取得（無効化されている場合はNone）"""
+    global _default_cache
+    if _cache_disabled:
+        return None
+    if _default_cache is None:
+        _default_cache = HttpCache()
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[HttpCache]) -> None:
+    """共有キャッシュを差し替え（Noneでキャッシュを無効化）"""
+    global _default_cache, _cache_disabled
+    _default_cache = cache
+    _cache_disabled = cache is None
+
+
+def cached_get(url: str, headers: Optional[Dict[str, str]] = None,
+               cache: Optional[HttpCache] = None, client: Optional[HttpClient] = None) -> str:
+    """キャッシュ経由でGETしてレスポンス本文を返す（失敗時はrequests.RequestException）"""
+    if cache is None:
+        cache = get_default_cache()
+    if client is None:
+        client = get_default_client()
+
+    request_headers = dict(headers or {})
+    entry = cache.lookup(url) if cache else None
+    if entry and entry.fresh:
+        cache.hits += 1
+        return entry.body
+
+    # 期限切れのエントリがあれば条件付きGETで再検証
+    if entry:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    response = client.get(url, headers=request_headers)
+    if response.status_code == 304 and entry:
+        cache.revalidated += 1
+        cache.touch(url)
+        return entry.body
+
+    response.raise_for_status()
+    if cache:
+        cache.misses += 1
+        cache.store(url, response.text, response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'))
+    return response.text
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""qq.pyとpdf_analyzer.pyで共有するHTTPクライアント（接続プール・keep-alive）"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+
+from src.circuit_breaker import CircuitBreaker, HostCircuitBreaker
+from src.deadline import DeadlineExceeded, bind_deadline, current_deadline
+from src.live_metrics import observe_http_hedge, observe_http_request, observe_http_retry
+from src.profiling import record_transfer
+from src.rate_limiter import HostRateLimiter
+from src.retry import RetryPolicy, parse_retry_after
+
+
+DEFAULT_USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+
+# 接続の確立を待つ上限（秒）
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+# 応答の各読み取りを待つ上限（秒）
+DEFAULT_TIMEOUT = 30
+
+# 1回のリクエストで本文を受け取り終えるまでの上限（秒、少しずつ届き続ける応答も打ち切る）
+DEFAULT_TOTAL_TIMEOUT = 120.0
+
+# ホストごとに保持する接続数
+DEFAULT_POOL_SIZE = 10
+
+# 本文を読み取る単位（バイト）
+_CHUNK_SIZE = 65536
+
+
+class HttpClient:
+    """ホスト単位の接続プールを持つHTTPクライアント
+
+    gzip/deflate（brotliがあればbr）をネゴシエートし、http2=Trueかつhttpxが
+    インストールされている場合はHTTP/2で多重化する。rate_limiterを渡すと
+    各リクエストの前にホストごとの予算を消費する。
+    通信エラーと一時的なステータス（429・503など）はretry_policyに従って送り直し、
+    エラーが急増したホストへの送信はcircuit_breakerで一時的に止める。
+    タイムアウトは接続・読み取り・本文全体の3つで、スレッドに銘柄の処理期限が設定されていれば
+    その残り時間までに縮める。hedge_afterを指定すると、その秒数以内に応答がないリクエストを
+    もう1つ送って先に届いた方を使う。
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT,
+                 http2: bool = False, headers: Optional[Dict[str, str]] = None,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[HostCircuitBreaker] = None,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 total_timeout: float = DEFAULT_TOTAL_TIMEOUT,
+                 hedge_after: Optional[float] = None):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.total_timeout = total_timeout
+        self.hedge_after = hedge_after
+        self._hedge_pool = None
+        if hedge_after:
+            # 重ねて送ったリクエストの分も含めて同時に送れるようにする
+            self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix='hedge')
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or HostCircuitBreaker()
+        self.headers = {
+            'User-Agent': DEFAULT_USER_AGENT,
+            'Accept-Encoding': DEFAULT_ACCEPT_ENCODING,
+        }
+        if headers:
+            self.headers.update(headers)
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._http2_client = None
+        if http2:
+            try:
+                import httpx
+                self._http2_client = httpx.Client(
+                    http2=True,
+                    headers=self.headers,
+                    timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                    limits=httpx.Limits(max_keepalive_connections=pool_size),
+                    follow_redirects=True,
+                )
+            except ImportError:
+                print("警告: httpx[http2]がインストールされていないためHTTP/1.1で接続します")
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None,
+            timeout: Optional[float] = None) -> requests.Response:
+        """GETリクエストを送信（失敗時はrequests.RequestException）
+
+        再試行しても一時的なステータスが続いた場合は最後の応答を返し、通信エラーが
+        続いた場合は最後の例外を送出する。処理期限までに待ち終わらない再試行はしない。
+        """
+        if timeout is None:
+            timeout = self.timeout
+        policy = self.retry_policy
+        breaker = self.circuit_breaker.for_url(url)
+        send = self._send_hedged if self._hedge_pool is not None else self._send
+        attempt = 0
+        while True:
+            try:
+                response = send(url, headers, timeout, breaker)
+            except requests.RequestException as e:
+                reason = policy.retry_reason(error=e)
+                if reason is None or attempt >= policy.max_retries:
+                    raise
+                delay = policy.delay(attempt)
+                if not _can_wait(delay):
+                    raise
+            else:
+                reason = policy.retry_reason(response=response)
+                if reason is None or attempt >= policy.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                delay = policy.delay(attempt, retry_after)
+                if not _can_wait(delay):
+                    return response
+                if retry_after is not None and breaker is not None:
+                    # サーバーが指定した間は同じホストへの他のリクエストも止める
+                    breaker.hold(min(retry_after, policy.max_delay))
+            attempt += 1
+            print(f"{reason}のため{delay:.1f}秒後に再試行します（{attempt}/{policy.max_retries}回目）: {url}")
+            observe_http_retry(url, reason)
+            time.sleep(delay)
+
+    def _timeouts(self, read_timeout: float) -> Tuple[float, float, float]:
+        """(接続, 読み取り, 本文全体) のタイムアウト（処理期限の残り時間まで縮める）"""
+        connect, read, total = self.connect_timeout, read_timeout, self.total_timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"銘柄の処理期限（{deadline.seconds:.0f}秒）を過ぎました")
+            connect, read, total = min(connect, remaining), min(read, remaining), min(total, remaining)
+        return connect, read, total
+
+    def _send(self, url: str, headers: Optional[Dict[str, str]], timeout: float,
+              breaker: Optional[CircuitBreaker]) -> requests.Response:
+        """ブレーカーとレートリミッタの許可を待ってから1回送信"""
+        wait = breaker.before_request() if breaker is not None else 0.0
+        try:
+            if self.rate_limiter is not None:
+                wait += self.rate_limiter.acquire(url)
+            connect, read, total = self._timeouts(timeout)
+        except requests.RequestException:
+            if breaker is not None:
+                breaker.cancel()
+            raise
+        started = time.perf_counter()
+        try:
+            if self._http2_client is not None:
+                response = self._get_http2(url, headers, connect, read, started + total)
+            else:
+                response = self.session.get(url, headers=headers, timeout=(connect, read),
+                                            allow_redirects=True, stream=True)
+                try:
+                    response._content = _read_body(response.iter_content(_CHUNK_SIZE), started + total, url)
+                finally:
+                    response.close()
+        except requests.RequestException as e:
+            observe_http_request(url, 'error', time.perf_counter() - started, wait)
+            if breaker is not None:
+                breaker.record(self.retry_policy.retry_reason(error=e) is None)
+            raise
+        if breaker is not None:
+            breaker.record(self.retry_policy.retry_reason(response=response) is None)
+        observe_http_request(url, response.status_code, time.perf_counter() - started, wait)
+        record_transfer(len(response.content))
+        return response
+
+    def _send_hedged(self, url: str, headers: Optional[Dict[str, str]], timeout: float,
+                     breaker: Optional[CircuitBreaker]) -> requests.Response:
+        """hedge_after秒以内に応答がなければ同じリクエストをもう1つ送り、先に届いた方を返す
+
+        遅れた方のリクエストは取り消せないため、届いた応答は捨てる。
+        """
+        send = bind_deadline(self._send)
+        first = self._hedge_pool.submit(send, url, headers, timeout, breaker)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        print(f"{self.hedge_after:.1f}秒以内に応答がないため同じリクエストを重ねて送信: {url}")
+        observe_http_hedge(url)
+        pending = {first, self._hedge_pool.submit(send, url, headers, timeout, breaker)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except requests.RequestException as e:
+                    error = error or e
+        raise error
+
+    def _get_http2(self, url: str, headers: Optional[Dict[str, str]], connect: float, read: float,
+                   limit: float) -> requests.Response:
+        """httpxで取得し、呼び出し側が扱えるようrequests.Responseに変換"""
+        import httpx
+        try:
+            with self._http2_client.stream('GET', url, headers=headers,
+                                           timeout=httpx.Timeout(read, connect=connect)) as r:
+                content = _read_body(r.iter_bytes(), limit, url)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.ConnectionError(str(e))
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers)
+        response._content = content
+        response.encoding = r.encoding
+        response.url = str(r.url)
+        response.reason = r.reason_phrase
+        return response
+
+    def close(self) -> None:
+        """接続プールを解放"""
+        self.session.close()
+        if self._http2_client is not None:
+            self._http2_client.close()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+
+
+def _read_body(chunks: Iterable[bytes], limit: float, url: str) -> bytes:
+    """本文を読み取り、time.perf_counter()がlimitを過ぎたら打ち切ってrequests.Timeoutを送出"""
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if time.perf_counter() > limit:
+            raise requests.Timeout(f"本文の受信が時間内に終わりませんでした: {url}")
+    return bytes(body)
+
+
+def _can_wait(delay: float) -> bool:
+    """処理期限までにdelay秒待ってから送り直せるか"""
+    deadline = current_deadline()
+    return deadline is None or delay < deadline.remaining()
+
+
+_default_client: Optional[HttpClient] = None
+
+
+def get_default_client() -> HttpClient:
+    """共有クライアントを取得（未設定なら既定設定で作成）"""
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
+
+
+def set_default_client(client: HttpClient) -> None:
+    """共有クライアントを差し替え（バッチ実行で1つのクライアントを共有するため）"""
+    global _default_client
+    _default_client = client
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""バッチ処理の銘柄ごとの結果を逐次追記するジャーナル（中断からの再開用）"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+
+DEFAULT_JOURNAL_PATH = "data/output/batch_journal.jsonl"
+
+
+class BatchJournal:
+    """1銘柄の処理が終わるたびに結果か失敗を1行のJSONで追記"""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, reset: bool = False):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 新規実行では前回のジャーナルを退避してから書き始める
+        if reset and os.path.exists(path):
+            os.replace(path, f"{path}.prev")
+
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, code: str, result: Optional[Dict], error: str = "") -> None:
+        """処理結果を追記（resultがNoneなら失敗として記録）"""
+        entry = {'code': code, 'status': 'ok' if result else 'failed', 'ts': time.time()}
+        if result:
+            entry['result'] = result
+        elif error:
+            entry['error'] = error
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        """ファイルを閉じる"""
+        with self._lock:
+            self._file.close()
+
+
+def load_journal(path: str = DEFAULT_JOURNAL_PATH) -> Tuple[Dict[str, Dict], Set[str]]:
+    """ジャーナルを読み込み、(完了した銘柄の結果, 失敗した銘柄) を返す
+
+    同じ銘柄の記録が複数ある場合は後のものを優先する。
+    """
+    completed = {}
+    failed = set()
+    if not os.path.exists(path):
+        return completed, failed
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 書き込み途中で中断された最終行は無視
+                continue
+            code = entry.get('code')
+            if entry.get('status') == 'ok' and entry.get('result'):
+                completed[code] = entry['result']
+                failed.discard(code)
+            else:
+                completed.pop(code, None)
+                failed.add(code)
+
+    return completed, failed
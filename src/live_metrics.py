@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""長時間のバッチ実行を外から監視するためのライブメトリクス（Prometheusのテキスト形式）
+
+処理した銘柄数・残り・ETA、ホストごとのリクエスト数と応答時間、レートリミッタの待ち時間、
+PDF解析時間、キャッシュのヒット率、パイプラインのキューの長さを集計し、
+一定間隔でテキストファイルに書き出すか（node_exporterのtextfileコレクタ向け）、
+ローカルのHTTPエンドポイント（/metrics）で返す。
+
+無効時（共有のメトリクスが未設定）の observe_* は何もしない。
+"""
+
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+
+DEFAULT_METRICS_INTERVAL = 10.0
+
+# 応答時間・解析時間のヒストグラムの区切り（秒）
+HTTP_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PDF_PARSE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# メトリクス名 → (種類, 説明)
+_METRICS = {
+    'qq_codes_target': ('gauge', '今回処理する銘柄数'),
+    'qq_codes_processed_total': ('counter', '処理が終わった銘柄数（status=ok|failed）'),
+    'qq_codes_remaining': ('gauge', '未処理の銘柄数'),
+    'qq_codes_per_second': ('gauge', '開始からの平均処理銘柄数/秒'),
+    'qq_eta_seconds': ('gauge', '残りの銘柄を処理し終えるまでの推定秒数'),
+    'qq_elapsed_seconds': ('gauge', '開始からの経過秒数'),
+    'qq_http_requests_total': ('counter', 'ホスト・ステータスごとのリクエスト数（通信エラーはstatus=error）'),
+    'qq_http_request_seconds': ('histogram', 'ホストごとの応答時間（レートリミッタの待ちを除く）'),
+    'qq_rate_limit_wait_seconds_total': ('counter', 'ホストごとのレートリミッタの待ち時間の合計'),
+    'qq_http_retries_total': ('counter', 'ホスト・理由（ステータスコード|timeout|connection）ごとの再試行数'),
+    'qq_circuit_open_total': ('counter', 'ホストごとにサーキットブレーカーが開いた回数'),
+    'qq_http_hedged_total': ('counter', 'ホストごとに応答が遅いリクエストを重ねて送った回数'),
+    'qq_pdf_parse_seconds': ('histogram', '抽出方式ごとのPDF解析時間'),
+    'qq_cache_requests_total': ('counter', 'HTTPキャッシュの結果ごとの件数（hit|revalidated|miss）'),
+    'qq_cache_hit_ratio': ('gauge', 'HTTPキャッシュのヒット率（再検証を含む）'),
+    'qq_pdf_store_requests_total': ('counter', 'PDF抽出結果ストアの結果ごとの件数（hit|miss）'),
+    'qq_queue_depth': ('gauge', 'パイプラインのステージ間キューに溜まっている件数'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in items]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    """累積バケット・合計・件数を持つヒストグラム"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class LiveMetrics:
+    """カウンタ・ゲージ・ヒストグラムを保持し、Prometheusのテキスト形式で出力する"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._callbacks: Dict[str, Dict[Labels, Callable[[], float]]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._buckets = {
+            'qq_http_request_seconds': HTTP_LATENCY_BUCKETS,
+            'qq_pdf_parse_seconds': PDF_PARSE_BUCKETS,
+        }
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        """カウンタを増やす"""
+        key = _labels(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """ゲージの値を設定"""
+        with self._lock:
+            self._values.setdefault(name, {})[_labels(labels)] = value
+
+    def set_callback(self, name: str, func: Callable[[], float],
+                     labels: Optional[Dict[str, str]] = None) -> None:
+        """出力のたびにfuncを呼んで値を取るメトリクスを登録（キャッシュの件数やキューの長さなど）"""
+        with self._lock:
+            self._callbacks.setdefault(name, {})[_labels(labels)] = func
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """ヒストグラムに値を追加"""
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def value(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """カウンタ・ゲージの現在の値（未記録なら0）"""
+        with self._lock:
+            return self._values.get(name, {}).get(_labels(labels), 0.0)
+
+    def set_target(self, total: int) -> None:
+        """今回処理する銘柄数を設定（残り・ETAの計算に使う）"""
+        self.set('qq_codes_target', total)
+
+    def code_finished(self, ok: bool) -> None:
+        """1銘柄の処理終了を記録"""
+        self.inc('qq_codes_processed_total', labels={'status': 'ok' if ok else 'failed'})
+
+    def _update_progress(self) -> None:
+        """残り銘柄数・処理速度・ETAを計算"""
+        elapsed = time.monotonic() - self.started_at
+        processed = (self.value('qq_codes_processed_total', {'status': 'ok'})
+                     + self.value('qq_codes_processed_total', {'status': 'failed'}))
+        remaining = max(self.value('qq_codes_target') - processed, 0)
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        self.set('qq_elapsed_seconds', elapsed)
+        self.set('qq_codes_remaining', remaining)
+        self.set('qq_codes_per_second', rate)
+        self.set('qq_eta_seconds', remaining / rate if rate > 0 else math.nan)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で全メトリクスを出力"""
+        self._update_progress()
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            callbacks = {name: dict(series) for name, series in self._callbacks.items()}
+            histograms = {name: {key: (list(h.buckets), list(h.counts), h.count, h.sum)
+                                 for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+
+        # コールバックの値は登録済みの値を上書きする
+        for name, series in callbacks.items():
+            for key, func in series.items():
+                try:
+                    values.setdefault(name, {})[key] = float(func())
+                except Exception:
+                    continue
+
+        lines: List[str] = []
+        for name, (kind, description) in _METRICS.items():
+            if name not in values and name not in histograms:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for key, (buckets, counts, count, total) in sorted(histograms.get(name, {}).items()):
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_value(bound))])} "
+                                     f"{bucket_count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+            else:
+                for key, value in sorted(values[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsFileWriter:
+    """一定間隔でメトリクスをファイルに書き出すスレッド（一時ファイル経由で置き換え）"""
+
+    def __init__(self, metrics: LiveMetrics, path: str, interval: float):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def write(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"警告: メトリクスファイルの書き込みに失敗: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """/metricsでPrometheusのテキスト形式を返すハンドラ"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MetricsServer:
+    """ローカルのHTTPエンドポイントを別スレッドで動かす"""
+
+    def __init__(self, metrics: LiveMetrics, port: int, host: str = '127.0.0.1'):
+        self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self._thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_default_metrics: Optional[LiveMetrics] = None
+_exporters: List = []
+
+
+def get_default_metrics() -> Optional[LiveMetrics]:
+    """共有のメトリクスを取得（有効化されていなければNone）"""
+    return _default_metrics
+
+
+def set_default_metrics(metrics: Optional[LiveMetrics]) -> None:
+    """共有のメトリクスを設定（Noneで集計を止める）"""
+    global _default_metrics
+    _default_metrics = metrics
+
+
+def enable_live_metrics(path: Optional[str] = None, port: Optional[int] = None,
+                        interval: float = DEFAULT_METRICS_INTERVAL) -> LiveMetrics:
+    """メトリクスを作成して共有に設定し、ファイル出力・HTTPエンドポイントを開始"""
+    metrics = LiveMetrics()
+    set_default_metrics(metrics)
+    if path:
+        _exporters.append(_MetricsFileWriter(metrics, path, interval))
+        print(f"メトリクスを{interval:g}秒ごとに書き出します: {path}")
+    if port is not None:
+        server = _MetricsServer(metrics, port)
+        _exporters.append(server)
+        print(f"メトリクスを公開しています: {server.url}")
+    return metrics
+
+
+def stop_live_metrics() -> None:
+    """ファイルに最終値を書き出し、HTTPエンドポイントを止める"""
+    while _exporters:
+        _exporters.pop().stop()
+
+
+def observe_http_request(url: str, status, seconds: float, wait: float = 0.0) -> None:
+    """1リクエストの結果を記録（statusはステータスコードか'error'）"""
+    metrics = _default_metrics
+    if metrics is None:
+        return
+    host = urlparse(url).hostname or ''
+    metrics.inc('qq_http_requests_total', labels={'host': host, 'status': str(status)})
+    metrics.observe('qq_http_request_seconds', seconds, labels={'host': host})
+    if wait > 0:
+        metrics.inc('qq_rate_limit_wait_seconds_total', wait, labels={'host': host})
+
+
+def observe_http_retry(url: str, reason: str) -> None:
+    """再試行を1件記録"""
+    metrics = _default_metrics
+    if metrics is None:
+        return
+    metrics.inc('qq_http_retries_total', labels={'host': urlparse(url).hostname or '', 'reason': reason})
+
+
+def observe_http_hedge(url: str) -> None:
+    """応答が遅いリクエストを重ねて送ったことを記録"""
+    metrics = _default_metrics
+    if metrics is None:
+        return
+    metrics.inc('qq_http_hedged_total', labels={'host': urlparse(url).hostname or ''})
+
+
+def observe_circuit_open(host: str) -> None:
+    """サーキットブレーカーが開いたことを記録"""
+    metrics = _default_metrics
+    if metrics is None:
+        return
+    metrics.inc('qq_circuit_open_total', labels={'host': host})
+
+
+def observe_pdf_parse(method: Optional[str], seconds: Optional[float]) -> None:
+    """PDF1件の解析時間を記録"""
+    metrics = _default_metrics
+    if metrics is None or seconds is None:
+        return
+    metrics.observe('qq_pdf_parse_seconds', seconds, labels={'method': method or '不明'})
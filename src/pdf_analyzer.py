@@ -1,32 +1,61 @@
 #!/usr/bin/env python3
 """PDF決算資料から財政状態データを抽出"""
 
-import requests
 import pdfplumber
 import re
+from collections import Counter
+from PyPDF2 import PdfReader
 from io import BytesIO
 from typing import Optional, Tuple, Dict
 import time
+from src.http_client import HttpClient, get_default_client
+from src.endpoints import kabutan_base_url
+from src.live_metrics import observe_pdf_parse
 
 
-def download_pdf(url: str) -> Optional[BytesIO]:
+# 抽出ロジックを変更したら上げる（PDF抽出結果ストアのキャッシュを無効化するため）
+EXTRACTOR_VERSION = 3
+
+# 財政状態の値として採用する下限（百万円単位、資産合計は1億円・資本合計は5000万円を超えること）
+MIN_TOTAL_ASSETS = 100
+MIN_TOTAL_EQUITY = 50
+
+# 財政状態が載っているページの判定に使うキーワード
+BALANCE_SHEET_KEYWORDS = ('財政状態', '貸借対照表', '資産合計', '資本合計', '総資産', '純資産')
+
+# どの抽出方式で取れたかの集計（テンプレート / PyPDF2 / pdfplumber / 失敗）
+EXTRACTION_STATS = Counter()
+
+
+def record_extraction_method(method: Optional[str], seconds: Optional[float] = None) -> None:
+    """抽出方式を集計に加える（解析時間はライブメトリクスにも記録）"""
+    if method:
+        EXTRACTION_STATS[method] += 1
+    observe_pdf_parse(method, seconds)
+
+
+def format_extraction_stats() -> str:
+    """抽出方式の集計を表示用の文字列にする"""
+    return (f"PDF抽出方式: テンプレート {EXTRACTION_STATS['テンプレート']}件 / "
+            f"PyPDF2 {EXTRACTION_STATS['PyPDF2']}件 / "
+            f"pdfplumber {EXTRACTION_STATS['pdfplumber']}件 / 失敗 {EXTRACTION_STATS['失敗']}件")
+
+
+def download_pdf(url: str, client: Optional[HttpClient] = None) -> Optional[BytesIO]:
     """PDFをダウンロード"""
     try:
         headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'application/pdf,*/*',
             'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8',
-            'Referer': 'https://kabutan.jp/'
+            'Referer': f"{kabutan_base_url()}/"
         }
         
         print(f"PDFをダウンロード中: {url}")
         
-        # セッションを使用してクッキーを保持
-        session = requests.Session()
-        session.headers.update(headers)
-        
-        # まずページにアクセスしてリダイレクトを確認
-        response = session.get(url, allow_redirects=True)
+        # 共有クライアントの接続プールを再利用（クッキーも保持される）
+        if client is None:
+            client = get_default_client()
+        response = client.get(url, headers=headers)
         response.raise_for_status()
         
         print(f"Content-Type: {response.headers.get('content-type', 'Unknown')}")
@@ -39,8 +68,9 @@ def download_pdf(url: str) -> Optional[BytesIO]:
             print(f"レスポンス内容（最初の500文字）: {response.text[:500]}")
             return None
         
-        # 少し待機してサーバーに負荷をかけないようにする
-        time.sleep(1)
+        # 少し待機してサーバーに負荷をかけないようにする（レートリミッタ使用時は不要）
+        if client.rate_limiter is None:
+            time.sleep(1)
         
         return BytesIO(response.content)
     except Exception as e:
@@ -48,8 +78,142 @@ def download_pdf(url: str) -> Optional[BytesIO]:
         return None
 
 
-def extract_balance_sheet_data(pdf_content: BytesIO) -> Dict[str, Optional[float]]:
-    """PDFから資産合計と資本合計を抽出"""
+def extract_balance_sheet_data(pdf_content: BytesIO,
+                               template: Optional[Dict] = None) -> Dict[str, Optional[float]]:
+    """PDFから資産合計と資本合計を抽出
+
+    templateに同じ銘柄の過去の抽出位置が渡された場合はそのページ・行だけを読む。
+    一致しなければPyPDF2でキーワードを含むページのテキストを解析し、妥当な値が取れなければ
+    pdfplumberでテキストと表を詳しく解析する。どちらで取れたかを'抽出方式'に設定し、
+    テキストから抽出できた場合は次回用の抽出位置を'テンプレート'に設定する。
+    解析にかかった秒数は'解析秒'に設定する（プロセスプールで解析した場合も親で集計できるように）。
+    """
+    started = time.perf_counter()
+    result = _extract_balance_sheet_data(pdf_content, template)
+    result['解析秒'] = time.perf_counter() - started
+    return result
+
+
+def _extract_balance_sheet_data(pdf_content: BytesIO, template: Optional[Dict]) -> Dict[str, Optional[float]]:
+    """テンプレート→PyPDF2→pdfplumberの順に抽出を試す"""
+    if template:
+        result = _extract_with_template(pdf_content, template)
+        if _is_valid_balance_sheet(result):
+            result['抽出方式'] = 'テンプレート'
+            return result
+        print("テンプレートの位置で財政状態データが見つからないため、全ページを探索します")
+        pdf_content.seek(0)
+    
+    result = _extract_with_pypdf2(pdf_content)
+    if _is_valid_balance_sheet(result):
+        result['抽出方式'] = 'PyPDF2'
+        return result
+    
+    print("高速抽出で財政状態データが取れないため、pdfplumberで詳細解析します")
+    pdf_content.seek(0)
+    result = _extract_with_pdfplumber(pdf_content)
+    result['抽出方式'] = 'pdfplumber' if result['資産合計'] or result['資本合計'] else '失敗'
+    return result
+
+
+def _is_valid_balance_sheet(result: Dict[str, Optional[float]]) -> bool:
+    """資産合計と資本合計が両方とも下限を超え、資産合計の方が大きいか
+
+    テンプレートは列位置だけで値を読むため、PyPDF2・pdfplumberの解析と同じ下限をここで確かめる。
+    """
+    asset, equity = result['資産合計'], result['資本合計']
+    return bool(asset and equity and asset > MIN_TOTAL_ASSETS and equity > MIN_TOTAL_EQUITY
+                and asset > equity)
+
+
+def _is_section_anchor(line: str) -> bool:
+    """財政状態セクションの見出し行か（_analyze_page_textのセクション開始条件と同じ）"""
+    return '連結財政状態' in line or ('資産合計' in line and '資本合計' in line)
+
+
+def _extract_with_template(pdf_content: BytesIO, template: Dict) -> Dict[str, Optional[float]]:
+    """テンプレートのページで見出し行の直後のデータ行から指定列の数値を読む"""
+    result = {
+        '資産合計': None,
+        '資本合計': None
+    }
+    
+    try:
+        reader = PdfReader(pdf_content)
+        page_index = template['page_index']
+        if page_index >= len(reader.pages):
+            return result
+        text = reader.pages[page_index].extract_text() or ''
+        lines = [line.strip() for line in text.split('\n')]
+        if template['anchor'] not in lines:
+            return result
+        
+        # 見出し行以降で最初に列数が足りる数値行を最新期のデータ行とみなす
+        for line in lines[lines.index(template['anchor']) + 1:]:
+            numbers = re.findall(r'[\d,，]{6,}', line)
+            if len(numbers) > max(template['asset_column'], template['equity_column']):
+                result['資産合計'] = parse_balance_number(numbers[template['asset_column']])
+                result['資本合計'] = parse_balance_number(numbers[template['equity_column']])
+                print(f"テンプレート(Page {page_index + 1})から抽出: "
+                      f"資産合計={result['資産合計']}, 資本合計={result['資本合計']}")
+                break
+    except Exception as e:
+        print(f"テンプレートでの解析エラー: {e}")
+    
+    return result
+
+
+def _learn_template(text: str, page_num: int, result: Dict[str, Optional[float]]) -> Optional[Dict]:
+    """抽出できたページのテキストから見出し行と数値の列位置を記録"""
+    anchor = None
+    for line in (line.strip() for line in text.split('\n')):
+        if _is_section_anchor(line):
+            anchor = line
+            continue
+        if anchor is None:
+            continue
+        numbers = [parse_balance_number(n) for n in re.findall(r'[\d,，]{6,}', line)]
+        if result['資産合計'] in numbers and result['資本合計'] in numbers:
+            return {
+                'page_index': page_num,
+                'anchor': anchor,
+                'asset_column': numbers.index(result['資産合計']),
+                'equity_column': numbers.index(result['資本合計']),
+            }
+        if numbers:
+            # 見出し直後の数値行が一致しなければ位置を特定できない
+            return None
+    return None
+
+
+def _extract_with_pypdf2(pdf_content: BytesIO) -> Dict[str, Optional[float]]:
+    """PyPDF2でテキストのみを抽出して解析（財政状態のキーワードを含むページだけ）"""
+    result = {
+        '資産合計': None,
+        '資本合計': None
+    }
+    
+    try:
+        reader = PdfReader(pdf_content)
+        for page_num in range(min(3, len(reader.pages))):
+            text = reader.pages[page_num].extract_text()
+            if not text or not any(keyword in text for keyword in BALANCE_SHEET_KEYWORDS):
+                continue
+            
+            _analyze_page_text(text, page_num, result)
+            if _is_valid_balance_sheet(result):
+                template = _learn_template(text, page_num, result)
+                if template:
+                    result['テンプレート'] = template
+                break
+    except Exception as e:
+        print(f"PyPDF2での解析エラー: {e}")
+    
+    return result
+
+
+def _extract_with_pdfplumber(pdf_content: BytesIO) -> Dict[str, Optional[float]]:
+    """pdfplumberでテキストと表を解析"""
     result = {
         '資産合計': None,
         '資本合計': None
@@ -63,157 +227,11 @@ def extract_balance_sheet_data(pdf_content: BytesIO) -> Dict[str, Optional[float
                 text = page.extract_text()
                 
                 if text:
-                    print(f"Page {page_num + 1} テキストを解析中...")
+                    _analyze_page_text(text, page_num, result)
                     
-                    # デバッグ用：最初の1000文字を表示
-                    if page_num == 0:
-                        print(f"1ページ目の内容（最初の1000文字）:\n{text[:1000]}")
-                    
-                    # 財政状態、貸借対照表関連のキーワードをチェック
-                    if ('財政状態' in text or '貸借対照表' in text or 
-                        '資産合計' in text or '資本合計' in text or
-                        '総資産' in text or '純資産' in text):
-                        
-                        # 「連結財政状態」部分からデータを抽出
-                        # 行単位で分析
-                        lines = text.split('\n')
-                        
-                        # 財政状態セクションを見つけて数値を抽出
-                        in_financial_position = False
-                        
-                        for i, line in enumerate(lines):
-                            line = line.strip()
-                            
-                            # 財政状態セクションの開始を検出
-                            if '連結財政状態' in line or ('資産合計' in line and '資本合計' in line):
-                                in_financial_position = True
-                                print(f"財政状態セクション開始: {line}")
-                                continue
-                            
-                            # 財政状態セクション内で最新四半期のデータ行を探す
-                            if in_financial_position:
-                                # パターン1: 年度を含む行（例：2026年３月期第１四半期）
-                                # パターン2: テーブルのデータ行（数値のみが複数並ぶ行）
-                                # 全角・半角カンマ両方に対応
-                                large_numbers = re.findall(r'[\d,，]{6,}', line)  # 全角カンマも対応
-                                print(f"財政状態セクション内の行: {repr(line.strip())}")  # 文字の詳細確認
-                                print(f"  抽出された数値: {large_numbers}")
-                                
-                                # 数値パターンをさらに詳しくテスト
-                                test_patterns = [
-                                    r'[\d,]{6,}',     # 半角カンマ
-                                    r'[\d,，]{6,}',   # 全角・半角カンマ
-                                    r'\d{6,}',        # カンマなし6桁以上
-                                    r'[\d,，\s]{6,}'  # スペースも含む
-                                ]
-                                for i, pattern in enumerate(test_patterns):
-                                    test_result = re.findall(pattern, line)
-                                    if test_result:
-                                        print(f"    パターン{i+1} ({pattern}): {test_result}")
-                                
-                                if ((('年' in line or '四半期' in line or '期' in line) and large_numbers) or
-                                    (len(large_numbers) >= 2)):
-                                    
-                                    print(f"財政状態データ行: {line}")
-                                    
-                                    # 大きな数値を順番に抽出（通常、資産合計が最初、資本合計が2番目）
-                                    numbers = large_numbers  # 既に上で取得済み
-                                    print(f"抽出された大きな数値: {numbers}")
-                                    
-                                    if len(numbers) >= 2:
-                                        # 最初の数値を資産合計として試す
-                                        print(f"パース前の数値1: {repr(numbers[0])}")
-                                        asset_candidate = parse_balance_number(numbers[0])
-                                        print(f"パース後の資産合計候補: {asset_candidate}")
-                                        
-                                        # 2番目の数値を資本合計として試す  
-                                        print(f"パース前の数値2: {repr(numbers[1])}")
-                                        equity_candidate = parse_balance_number(numbers[1])
-                                        print(f"パース後の資本合計候補: {equity_candidate}")
-                                        
-                                        # 妥当性チェック（資産合計 > 資本合計）
-                                        print(f"妥当性チェック: asset={asset_candidate}, equity={equity_candidate}")
-                                        print(f"  条件1 (両方存在): {bool(asset_candidate and equity_candidate)}")
-                                        print(f"  条件2 (asset > equity): {asset_candidate > equity_candidate if (asset_candidate and equity_candidate) else 'N/A'}")
-                                        print(f"  条件3 (asset > 100M): {asset_candidate > 100 if asset_candidate else 'N/A'}")
-                                        print(f"  条件4 (equity > 50M): {equity_candidate > 50 if equity_candidate else 'N/A'}")
-                                        
-                                        if (asset_candidate and equity_candidate and 
-                                            asset_candidate > equity_candidate and
-                                            asset_candidate > 100 and   # 1億円以上（百万円単位）
-                                            equity_candidate > 50):      # 5000万円以上（百万円単位）
-                                            
-                                            result['資産合計'] = asset_candidate
-                                            result['資本合計'] = equity_candidate
-                                            print(f"資産合計を発見: {asset_candidate:,.0f}")
-                                            print(f"資本合計を発見: {equity_candidate:,.0f}")
-                                            break
-                                    
-                                # セクション終了の判定（次のセクションの開始）
-                                elif ('配当' in line or '株式' in line or line == ''):
-                                    in_financial_position = False
-                            
-                            # 既に両方見つかったら終了
-                            if result['資産合計'] and result['資本合計']:
-                                break
-                            
-                            # 個別に探す場合のパターン
-                            if not result['資産合計'] and ('資産合計' in line or '総資産' in line):
-                                numbers = re.findall(r'[\d,]+', line)
-                                for num in numbers:
-                                    value = parse_balance_number(num)
-                                    if value and value > 100:  # 1億円以上（百万円単位）
-                                        result['資産合計'] = value
-                                        print(f"資産合計を発見: {value:,.0f}")
-                                        break
-                            
-                            if not result['資本合計'] and ('資本合計' in line or '純資産' in line):
-                                numbers = re.findall(r'[\d,]+', line)
-                                for num in numbers:
-                                    value = parse_balance_number(num)
-                                    if value and value > 50:  # 5000万円以上（百万円単位）
-                                        result['資本合計'] = value
-                                        print(f"資本合計を発見: {value:,.0f}")
-                                        break
-                        
-                        # 従来のパターンマッチングもバックアップとして実行
-                        if not result['資産合計'] or not result['資本合計']:
-                            asset_patterns = [
-                                r'資産合計[^\d]*?([\d,]+)',
-                                r'総資産[^\d]*?([\d,]+)'
-                            ]
-                            
-                            equity_patterns = [
-                                r'資本合計[^\d]*?([\d,]+)',
-                                r'純資産合計[^\d]*?([\d,]+)',
-                                r'純資産[^\d]*?([\d,]+)'
-                            ]
-                            
-                            for pattern in asset_patterns:
-                                if result['資産合計']:
-                                    break
-                                matches = re.findall(pattern, text)
-                                for match in matches:
-                                    value = parse_balance_number(match)
-                                    if value and value > 100:  # 1億円以上（百万円単位）
-                                        result['資産合計'] = value
-                                        print(f"パターンマッチで資産合計を発見: {value:,.0f}")
-                                        break
-                            
-                            for pattern in equity_patterns:
-                                if result['資本合計']:
-                                    break
-                                matches = re.findall(pattern, text)
-                                for match in matches:
-                                    value = parse_balance_number(match)
-                                    if value and value > 50:  # 5000万円以上（百万円単位）
-                                        result['資本合計'] = value
-                                        print(f"パターンマッチで資本合計を発見: {value:,.0f}")
-                                        break
-                        
-                        # 両方見つかったら終了
-                        if result['資産合計'] and result['資本合計']:
-                            break
+                    # 両方見つかったら終了
+                    if result['資産合計'] and result['資本合計']:
+                        break
                 
                 # テーブルからも探してみる
                 try:
@@ -256,6 +274,161 @@ def extract_balance_sheet_data(pdf_content: BytesIO) -> Dict[str, Optional[float
     return result
 
 
+def _analyze_page_text(text: str, page_num: int, result: Dict[str, Optional[float]]) -> None:
+    """ページのテキストから財政状態セクションを探して資産合計と資本合計をresultに設定"""
+    print(f"Page {page_num + 1} テキストを解析中...")
+    
+    # デバッグ用：最初の1000文字を表示
+    if page_num == 0:
+        print(f"1ページ目の内容（最初の1000文字）:\n{text[:1000]}")
+    
+    # 財政状態、貸借対照表関連のキーワードをチェック
+    if ('財政状態' in text or '貸借対照表' in text or 
+        '資産合計' in text or '資本合計' in text or
+        '総資産' in text or '純資産' in text):
+        
+        # 「連結財政状態」部分からデータを抽出
+        # 行単位で分析
+        lines = text.split('\n')
+        
+        # 財政状態セクションを見つけて数値を抽出
+        in_financial_position = False
+        
+        for i, line in enumerate(lines):
+            line = line.strip()
+            
+            # 財政状態セクションの開始を検出
+            if '連結財政状態' in line or ('資産合計' in line and '資本合計' in line):
+                in_financial_position = True
+                print(f"財政状態セクション開始: {line}")
+                continue
+            
+            # 財政状態セクション内で最新四半期のデータ行を探す
+            if in_financial_position:
+                # パターン1: 年度を含む行（例：2026年３月期第１四半期）
+                # パターン2: テーブルのデータ行（数値のみが複数並ぶ行）
+                # 全角・半角カンマ両方に対応
+                large_numbers = re.findall(r'[\d,，]{6,}', line)  # 全角カンマも対応
+                print(f"財政状態セクション内の行: {repr(line.strip())}")  # 文字の詳細確認
+                print(f"  抽出された数値: {large_numbers}")
+                
+                # 数値パターンをさらに詳しくテスト
+                test_patterns = [
+                    r'[\d,]{6,}',     # 半角カンマ
+                    r'[\d,，]{6,}',   # 全角・半角カンマ
+                    r'\d{6,}',        # カンマなし6桁以上
+                    r'[\d,，\s]{6,}'  # スペースも含む
+                ]
+                for i, pattern in enumerate(test_patterns):
+                    test_result = re.findall(pattern, line)
+                    if test_result:
+                        print(f"    パターン{i+1} ({pattern}): {test_result}")
+                
+                if ((('年' in line or '四半期' in line or '期' in line) and large_numbers) or
+                    (len(large_numbers) >= 2)):
+                    
+                    print(f"財政状態データ行: {line}")
+                    
+                    # 大きな数値を順番に抽出（通常、資産合計が最初、資本合計が2番目）
+                    numbers = large_numbers  # 既に上で取得済み
+                    print(f"抽出された大きな数値: {numbers}")
+                    
+                    if len(numbers) >= 2:
+                        # 最初の数値を資産合計として試す
+                        print(f"パース前の数値1: {repr(numbers[0])}")
+                        asset_candidate = parse_balance_number(numbers[0])
+                        print(f"パース後の資産合計候補: {asset_candidate}")
+                        
+                        # 2番目の数値を資本合計として試す  
+                        print(f"パース前の数値2: {repr(numbers[1])}")
+                        equity_candidate = parse_balance_number(numbers[1])
+                        print(f"パース後の資本合計候補: {equity_candidate}")
+                        
+                        # 妥当性チェック（資産合計 > 資本合計）
+                        print(f"妥当性チェック: asset={asset_candidate}, equity={equity_candidate}")
+                        print(f"  条件1 (両方存在): {bool(asset_candidate and equity_candidate)}")
+                        print(f"  条件2 (asset > equity): {asset_candidate > equity_candidate if (asset_candidate and equity_candidate) else 'N/A'}")
+                        print(f"  条件3 (asset > 100M): {asset_candidate > 100 if asset_candidate else 'N/A'}")
+                        print(f"  条件4 (equity > 50M): {equity_candidate > 50 if equity_candidate else 'N/A'}")
+                        
+                        if (asset_candidate and equity_candidate and 
+                            asset_candidate > equity_candidate and
+                            asset_candidate > 100 and   # 1億円以上（百万円単位）
+                            equity_candidate > 50):      # 5000万円以上（百万円単位）
+                            
+                            result['資産合計'] = asset_candidate
+                            result['資本合計'] = equity_candidate
+                            print(f"資産合計を発見: {asset_candidate:,.0f}")
+                            print(f"資本合計を発見: {equity_candidate:,.0f}")
+                            break
+                    
+                # セクション終了の判定（次のセクションの開始）
+                elif ('配当' in line or '株式' in line or line == ''):
+                    in_financial_position = False
+            
+            # 既に両方見つかったら終了
+            if result['資産合計'] and result['資本合計']:
+                break
+            
+            # 個別に探す場合のパターン
+            if not result['資産合計'] and ('資産合計' in line or '総資産' in line):
+                numbers = re.findall(r'[\d,]+', line)
+                for num in numbers:
+                    value = parse_balance_number(num)
+                    if value and value > 100:  # 1億円以上（百万円単位）
+                        result['資産合計'] = value
+                        print(f"資産合計を発見: {value:,.0f}")
+                        break
+            
+            if not result['資本合計'] and ('資本合計' in line or '純資産' in line):
+                numbers = re.findall(r'[\d,]+', line)
+                for num in numbers:
+                    value = parse_balance_number(num)
+                    if value and value > 50:  # 5000万円以上（百万円単位）
+                        result['資本合計'] = value
+                        print(f"資本合計を発見: {value:,.0f}")
+                        break
+        
+        # 従来のパターンマッチングもバックアップとして実行
+        if not result['資産合計'] or not result['資本合計']:
+            asset_patterns = [
+                r'資産合計[^\d]*?([\d,]+)',
+                r'総資産[^\d]*?([\d,]+)'
+            ]
+            
+            equity_patterns = [
+                r'資本合計[^\d]*?([\d,]+)',
+                r'純資産合計[^\d]*?([\d,]+)',
+                r'純資産[^\d]*?([\d,]+)'
+            ]
+            
+            for pattern in asset_patterns:
+                if result['資産合計']:
+                    break
+                matches = re.findall(pattern, text)
+                for match in matches:
+                    value = parse_balance_number(match)
+                    if value and value > 100:  # 1億円以上（百万円単位）
+                        result['資産合計'] = value
+                        print(f"パターンマッチで資産合計を発見: {value:,.0f}")
+                        break
+            
+            for pattern in equity_patterns:
+                if result['資本合計']:
+                    break
+                matches = re.findall(pattern, text)
+                for match in matches:
+                    value = parse_balance_number(match)
+                    if value and value > 50:  # 5000万円以上（百万円単位）
+                        result['資本合計'] = value
+                        print(f"パターンマッチで資本合計を発見: {value:,.0f}")
+                        break
+        
+        # 両方見つかったら終了
+        if result['資産合計'] and result['資本合計']:
+            return
+
+
 def parse_balance_number(text: str) -> Optional[float]:
     """財政状態の数値をパース（百万円単位）"""
     if not text:
@@ -288,7 +461,9 @@ def test_pdf_extraction(pdf_url: str):
     balance_data = extract_balance_sheet_data(pdf_content)
     
     print("\n=== 抽出結果 ===")
-    for key, value in balance_data.items():
+    print(f"抽出方式: {balance_data.get('抽出方式')}")
+    for key in ['資産合計', '資本合計']:
+        value = balance_data.get(key)
         if value:
             print(f"{key}: {value:,.0f} 百万円")
         else:
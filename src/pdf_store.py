@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""TDnet決算PDFの抽出結果を開示ID単位で永続化するストア（SQLite）"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+DEFAULT_STORE_PATH = "data/cache/pdf_results.sqlite3"
+
+
+def extract_tdnet_file_id(url: str) -> Optional[str]:
+    """PDFのURLからTDnetのファイルIDを取得"""
+    if not url:
+        return None
+    # 例: https://tdnet-pdf.kabutan.jp/20250807/140120250805531214.pdf
+    # （接続先を差し替えた場合もパスの形式は同じ）
+    match = re.search(r'/\d{8}/(\d+)\.pdf', url)
+    if match:
+        return match.group(1)
+    # 例: /disclosures/pdf/20250807/140120250805531214/
+    match = re.search(r'/disclosures/pdf/\d{8}/(\d+)', url)
+    if match:
+        return match.group(1)
+    return None
+
+
+class PdfResultStore:
+    """開示IDをキーに資産合計・資本合計と抽出器バージョン（任意でPDF本体）を保存
+
+    銘柄コードごとの抽出位置（テンプレート）も保持する。
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, keep_pdf_bytes: bool = False):
+        self.path = path
+        self.keep_pdf_bytes = keep_pdf_bytes
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS balance_sheets (
+                file_id TEXT PRIMARY KEY,
+                url TEXT,
+                total_assets REAL,
+                total_equity REAL,
+                extractor_version INTEGER NOT NULL,
+                extracted_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pdf_documents (
+                file_id TEXT PRIMARY KEY,
+                content BLOB NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS extraction_templates (
+                code TEXT PRIMARY KEY,
+                page_index INTEGER NOT NULL,
+                anchor TEXT NOT NULL,
+                asset_column INTEGER NOT NULL,
+                equity_column INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, file_id: str, extractor_version: int) -> Optional[Dict[str, Optional[float]]]:
+        """同じ抽出器バージョンで抽出済みの結果を取得"""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT total_assets, total_equity FROM balance_sheets
+                   WHERE file_id = ? AND extractor_version = ?""",
+                (file_id, extractor_version)
+            ).fetchone()
+            # 複数スレッドから呼ばれるため件数もロック内で数える
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        return {'資産合計': row[0], '資本合計': row[1]}
+
+    def get_pdf_bytes(self, file_id: str) -> Optional[bytes]:
+        """保存済みのPDF本体を取得"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM pdf_documents WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, file_id: str, url: str, balance_data: Dict[str, Optional[float]],
+            extractor_version: int, pdf_bytes: Optional[bytes] = None) -> None:
+        """抽出結果を保存（keep_pdf_bytesが有効ならPDF本体も保存）"""
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO balance_sheets
+                   (file_id, url, total_assets, total_equity, extractor_version, extracted_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (file_id, url, balance_data.get('資産合計'), balance_data.get('資本合計'),
+                 extractor_version, time.time())
+            )
+            if self.keep_pdf_bytes and pdf_bytes:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pdf_documents (file_id, content) VALUES (?, ?)",
+                    (file_id, pdf_bytes)
+                )
+            self._conn.commit()
+
+    def get_template(self, code: str) -> Optional[Dict]:
+        """銘柄の決算短信で財政状態が載っている位置（ページ・見出し行・列）を取得"""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT page_index, anchor, asset_column, equity_column
+                   FROM extraction_templates WHERE code = ?""",
+                (code,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'page_index': row[0], 'anchor': row[1], 'asset_column': row[2], 'equity_column': row[3]}
+
+    def put_template(self, code: str, template: Dict) -> None:
+        """銘柄の抽出位置を保存（既存の位置は上書き）"""
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO extraction_templates
+                   (code, page_index, anchor, asset_column, equity_column, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (code, template['page_index'], template['anchor'], template['asset_column'],
+                 template['equity_column'], time.time())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[PdfResultStore] = None
+_store_disabled = False
+
+
+def get_default_pdf_store() -> Optional[PdfResultStore]:
+    """共有ストアを取得（無効化されている場合はNone）"""
+    global _default_store
+    if _store_disabled:
+        return None
+    if _default_store is None:
+        _default_store = PdfResultStore()
+    return _default_store
+
+
+def set_default_pdf_store(store: Optional[PdfResultStore]) -> None:
+    """共有ストアを差し替え（Noneでストアを無効化）"""
+    global _default_store, _store_disabled
+    _default_store = store
+    _store_disabled = store is None
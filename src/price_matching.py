@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""決算発表日と週足株価の突き合わせ（日付の昇順インデックスと二分探索・merge_asof）
+
+「発表日の翌日以降で最初の株価、なければ発表日当日の株価」を求める。
+1銘柄はPriceIndexで日付の配列を1回だけ作って二分探索し、全銘柄のパネルは
+match_prices_panelでmerge_asofを1回実行して突き合わせる。
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class TradingCalendar:
+    """取引日の一覧（発表日の翌日ではなく翌営業日から株価を探す場合に使う）"""
+
+    def __init__(self, sessions: Iterable):
+        self.sessions = np.unique(np.array(list(sessions), dtype='datetime64[D]'))
+
+    @classmethod
+    def jpx(cls, start: str, end: str) -> Optional['TradingCalendar']:
+        """東証（XTKS）の営業日カレンダーを作成（exchange_calendarsが必要、なければNone）"""
+        try:
+            import exchange_calendars
+        except ImportError:
+            print("警告: exchange_calendarsがインストールされていないため暦日で株価を探します")
+            return None
+        calendar = exchange_calendars.get_calendar('XTKS')
+        return cls(calendar.sessions_in_range(start, end).date)
+
+    def next_session(self, date: datetime) -> Optional[datetime]:
+        """dateより後の最初の営業日（カレンダーの範囲外ならNone）"""
+        position = np.searchsorted(self.sessions, np.datetime64(date.date(), 'D'), side='right')
+        if position >= len(self.sessions):
+            return None
+        return datetime.combine(self.sessions[position].item(), datetime.min.time())
+
+    def next_sessions(self, dates: pd.Series) -> pd.Series:
+        """各日付より後の最初の営業日（範囲外はNaT）"""
+        days = dates.to_numpy(dtype='datetime64[D]')
+        positions = np.searchsorted(self.sessions, days, side='right')
+        in_range = positions < len(self.sessions)
+        result = np.full(len(days), np.datetime64('NaT'), dtype='datetime64[ns]')
+        result[in_range] = self.sessions[positions[in_range]]
+        return pd.Series(result, index=dates.index)
+
+
+def parse_announcement_date(announcement_date: str) -> Optional[datetime]:
+    """発表日をパース（例: "2024/12/27" または "24/11/10" 形式、数値が不正ならValueError）"""
+    if '/' not in announcement_date:
+        return None
+    date_parts = announcement_date.split('/')
+    if len(date_parts) != 3:
+        return None
+    year = int(date_parts[0])
+    month = int(date_parts[1])
+    day = int(date_parts[2])
+
+    # 2桁年の場合は2000年代として統一
+    if year < 100:
+        year += 2000
+    return datetime(year, month, day)
+
+
+class PriceIndex:
+    """1銘柄の週足データを日付の昇順に並べたインデックス
+
+    同じ日付が複数ある場合は元のリストで先に出てくる行を使う。
+    """
+
+    def __init__(self, weekly_data: List[Dict], calendar: Optional[TradingCalendar] = None):
+        self.calendar = calendar
+        first_rows = {}
+        for row in weekly_data:
+            first_rows.setdefault(row['日付'], row)
+        self.dates = sorted(first_rows)
+        self.rows = [first_rows[date] for date in self.dates]
+        self._keys = np.array(self.dates, dtype='datetime64[us]')
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def find_row(self, announcement_datetime: datetime) -> Optional[Dict]:
+        """発表日の翌日（カレンダーがあれば翌営業日）以降で最初の行、なければ発表日当日の行"""
+        target_date = announcement_datetime + timedelta(days=1)
+        if self.calendar is not None:
+            target_date = self.calendar.next_session(announcement_datetime) or target_date
+
+        position = np.searchsorted(self._keys, np.datetime64(target_date, 'us'), side='left')
+        if position < len(self.rows):
+            return self.rows[position]
+
+        # 翌日以降にデータがない場合、発表日当日のデータを探す
+        if self.rows and self.dates[-1] == announcement_datetime:
+            return self.rows[-1]
+        return None
+
+    def lookup(self, announcement_date: str) -> Dict[str, Optional[float]]:
+        """発表日の文字列から株価日付と始値を取得"""
+        result = {
+            '株価日付': None,
+            '始値': None
+        }
+        if not announcement_date or not self.rows:
+            return result
+
+        try:
+            announcement_datetime = parse_announcement_date(announcement_date)
+            if announcement_datetime is None:
+                return result
+            best_match = self.find_row(announcement_datetime)
+            if best_match:
+                result['株価日付'] = best_match['日付'].strftime('%Y/%m/%d')
+                result['始値'] = best_match['始値']
+        except (ValueError, IndexError, KeyError) as e:
+            print(f"株価データマッチングエラー: {e}")
+
+        return result
+
+
+def match_prices_panel(announcements: pd.DataFrame, prices: pd.DataFrame,
+                       calendar: Optional[TradingCalendar] = None) -> pd.DataFrame:
+    """全銘柄の発表日と週足株価をまとめて突き合わせる
+
+    announcementsは「コード」「発表日」列、pricesは「コード」「日付」「始値」列を持つフレーム。
+    announcementsと同じ行順・インデックスで「株価日付」「始値」列を返す。
+    """
+    result = pd.DataFrame({'株価日付': None, '始値': None}, index=announcements.index, dtype=object)
+    if announcements.empty or prices.empty:
+        return result
+
+    # 同じ銘柄・日付の株価は元の並びで先に出てくる行を使う
+    right = (prices[['コード', '日付', '始値']]
+             .drop_duplicates(['コード', '日付'], keep='first')
+             .assign(日付=lambda df: pd.to_datetime(df['日付']).astype('datetime64[ns]'))
+             .sort_values('日付', kind='stable'))
+
+    left = pd.DataFrame({
+        'コード': announcements['コード'],
+        '発表日': pd.to_datetime(announcements['発表日'].map(_parse_or_none)).astype('datetime64[ns]'),
+        '行': np.arange(len(announcements)),
+    })
+    left = left[left['発表日'].notna()]
+    if left.empty:
+        return result
+    left['基準日'] = left['発表日'] + pd.Timedelta(days=1)
+    if calendar is not None:
+        sessions = calendar.next_sessions(left['発表日'])
+        left['基準日'] = sessions.fillna(left['基準日']).astype('datetime64[ns]')
+    left = left.sort_values('基準日', kind='stable')
+
+    after = pd.merge_asof(left, right, left_on='基準日', right_on='日付', by='コード',
+                          direction='forward')
+    # 翌日以降にデータがない場合は発表日当日の株価を使う
+    same_day = pd.merge_asof(left.sort_values('発表日', kind='stable'), right,
+                             left_on='発表日', right_on='日付', by='コード', direction='backward')
+    same_day = same_day[same_day['日付'] == same_day['発表日']].set_index('行')
+
+    matched = after.set_index('行')
+    missing = matched['日付'].isna()
+    matched.loc[missing, ['日付', '始値']] = same_day.reindex(matched.index[missing])[['日付', '始値']]
+    matched = matched[matched['日付'].notna()]
+
+    positions = matched.index.to_numpy()
+    result.iloc[positions, 0] = matched['日付'].dt.strftime('%Y/%m/%d').to_numpy()
+    result.iloc[positions, 1] = matched['始値'].to_numpy()
+    return result
+
+
+def _parse_or_none(announcement_date) -> Optional[datetime]:
+    """パネル用：発表日をパースし、形式や値が不正ならNone"""
+    if not isinstance(announcement_date, str) or not announcement_date:
+        return None
+    try:
+        return parse_announcement_date(announcement_date)
+    except ValueError:
+        return None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""銘柄ごとの週足株価（日付と始値）を追記していくストア
+
+銘柄ごとのディレクトリに日付（1970-01-01からの日数、int64）と始値（float64）を
+それぞれ固定長のバイナリ配列として日付の昇順で保存する。
+新しく取得した週足は、保存済みの同じ期間（今週の足など）を置き換えて末尾に追記する。
+読み込んだ配列はファイルと切り離したコピーで、書き込みは常に一時ファイルを作って
+os.replaceで置き換えるため、読み込み済みの履歴が書き込みの影響を受けることはない。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+DEFAULT_PRICE_STORE_PATH = "data/cache/weekly_prices"
+
+_DATES_FILE = "dates.i8"
+_OPEN_FILE = "open.f8"
+_META_FILE = "meta.json"
+
+
+class WeeklyPriceHistory:
+    """1銘柄の保存済み週足（日付の昇順）
+
+    depthはこれまでに取得した週足ページの最大の深さ。週足ページは常に最新の週から
+    数えるため、同じ深さのページを後で取り直しても、これより古い週は得られない。
+    """
+
+    def __init__(self, dates: np.ndarray, opens: np.ndarray, depth: int = 0):
+        self.dates = dates
+        self.opens = opens
+        self.depth = depth
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def start(self) -> Optional[datetime]:
+        """最も古い週の日付（履歴がなければNone）"""
+        return _to_datetime(self.dates[0]) if len(self.dates) else None
+
+    @property
+    def end(self) -> Optional[datetime]:
+        """最も新しい週の日付（履歴がなければNone）"""
+        return _to_datetime(self.dates[-1]) if len(self.dates) else None
+
+    def to_weekly_data(self) -> List[Dict]:
+        """週足データ（日付と始値の辞書のリスト、新しい順）に変換"""
+        dates = self.dates[::-1].astype('datetime64[us]').tolist()
+        opens = self.opens[::-1].tolist()
+        return [{'日付': date, '始値': open_price} for date, open_price in zip(dates, opens)]
+
+
+def _to_datetime(day: np.datetime64) -> datetime:
+    return np.datetime64(day, 'us').item()
+
+
+def _rows_to_arrays(rows: List[Dict]):
+    """週足の辞書のリストを日付の昇順の配列に変換（同じ日付は先に出てくる行を使う）"""
+    first_rows = {}
+    for row in rows:
+        first_rows.setdefault(row['日付'], row['始値'])
+    days = sorted(first_rows)
+    dates = np.array(days, dtype='datetime64[D]')
+    opens = np.array([first_rows[day] for day in days], dtype=np.float64)
+    return dates, opens
+
+
+class WeeklyPriceStore:
+    """銘柄ごとの週足株価を保持するストア"""
+
+    def __init__(self, path: str = DEFAULT_PRICE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, code: str, name: str) -> str:
+        return os.path.join(self.path, code, name)
+
+    def load(self, code: str) -> WeeklyPriceHistory:
+        """保存済みの週足を読み込む（なければ空の履歴）"""
+        depth = 0
+        meta_path = self._file(code, _META_FILE)
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, encoding='utf-8') as f:
+                    depth = json.load(f).get('depth', 0)
+            except (OSError, ValueError):
+                depth = 0
+
+        # 書き込みの途中で止まった場合に備え、短い方の長さに揃える
+        length = min(_array_length(self._file(code, _DATES_FILE), 8),
+                     _array_length(self._file(code, _OPEN_FILE), 8))
+        if length == 0:
+            return WeeklyPriceHistory(np.zeros(0, dtype='datetime64[D]'), np.zeros(0), depth)
+        # memmapのままだと書き換え中のファイルを参照し続けるため、コピーとして読み込む
+        dates = np.fromfile(self._file(code, _DATES_FILE), dtype=np.int64, count=length)
+        opens = np.fromfile(self._file(code, _OPEN_FILE), dtype=np.float64, count=length)
+        return WeeklyPriceHistory(dates.view('datetime64[D]'), opens, depth)
+
+    def append(self, code: str, rows: List[Dict], depth: int) -> WeeklyPriceHistory:
+        """取得した週足を追記し、更新後の履歴を返す
+
+        取得した期間と重なる保存済みの週は取得したもので置き換える。取得した期間より
+        新しい週が保存されていなければ重なる部分より前を写して追記し、そうでなければ全体を書き直す。
+        どちらも一時ファイルに書いてから置き換える。
+        """
+        with self._lock:
+            history = self.load(code)
+            depth = max(depth, history.depth)
+            if rows:
+                new_dates, new_opens = _rows_to_arrays(rows)
+                stored = history.dates
+                cut = int(np.searchsorted(stored, new_dates[0], side='left'))
+                if not np.any(stored > new_dates[-1]):
+                    self._copy_and_append(code, cut, new_dates, new_opens)
+                else:
+                    keep = (stored < new_dates[0]) | (stored > new_dates[-1])
+                    dates = np.concatenate([stored[keep], new_dates])
+                    opens = np.concatenate([np.asarray(history.opens)[keep], new_opens])
+                    order = np.argsort(dates, kind='stable')
+                    self._rewrite(code, dates[order], opens[order])
+            if rows or depth != history.depth:
+                self._write_meta(code, depth)
+            return self.load(code)
+
+    def _copy_and_append(self, code: str, cut: int, dates: np.ndarray, opens: np.ndarray) -> None:
+        """先頭のcut件を一時ファイルに写して追記し、元のファイルと置き換え"""
+        os.makedirs(os.path.join(self.path, code), exist_ok=True)
+        for name, values in ((_DATES_FILE, dates.astype(np.int64)), (_OPEN_FILE, opens.astype(np.float64))):
+            path = self._file(code, name)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                if cut and os.path.exists(path):
+                    with open(path, 'rb') as source:
+                        f.write(source.read(cut * 8))
+                f.write(values.tobytes())
+            os.replace(temp_path, path)
+
+    def _rewrite(self, code: str, dates: np.ndarray, opens: np.ndarray) -> None:
+        """配列全体を一時ファイル経由で置き換え"""
+        for name, values in ((_DATES_FILE, dates.astype(np.int64)), (_OPEN_FILE, opens.astype(np.float64))):
+            path = self._file(code, name)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(values.tobytes())
+            os.replace(temp_path, path)
+
+    def _write_meta(self, code: str, depth: int) -> None:
+        os.makedirs(os.path.join(self.path, code), exist_ok=True)
+        path = self._file(code, _META_FILE)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'depth': depth, 'updated_at': datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(temp_path, path)
+
+
+def _array_length(path: str, item_size: int) -> int:
+    try:
+        return os.path.getsize(path) // item_size
+    except OSError:
+        return 0
+
+
+_default_store: Optional[WeeklyPriceStore] = None
+_store_disabled = False
+
+
+def get_default_price_store() -> Optional[WeeklyPriceStore]:
+    """共有ストアを取得（無効化されている場合はNone）"""
+    global _default_store
+    if _store_disabled:
+        return None
+    if _default_store is None:
+        _default_store = WeeklyPriceStore()
+    return _default_store
+
+
+def set_default_price_store(store: Optional[WeeklyPriceStore]) -> None:
+    """共有ストアを差し替え（Noneでストアを無効化）"""
+    global _default_store, _store_disabled
+    _default_store = store
+    _store_disabled = store is None
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""銘柄ごと・処理段階ごとの時間計測とプロファイル（--profile指定時だけ有効）
+
+各段階の経過時間・CPU時間（スレッド単位）・転送バイト数・確保メモリのピークを記録し、
+銘柄の処理が終わるたびに1行のJSONで追記する。段階は入れ子にでき、外側の段階には
+内側の段階を除いた分だけを計上するため、段階ごとの合計がそのまま銘柄の処理時間になる。
+
+無効時（共有のプロファイラが未設定）の profile_stage() は何もしないコンテキストを返す。
+確保メモリのピークはtracemallocの値を段階の開始時にリセットして測るため、
+並行処理では他の銘柄の確保も含まれる（正確な値は逐次処理で測る）。
+"""
+
+import contextlib
+import cProfile
+import heapq
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_PROFILE_DIR = "data/output/profile"
+
+_STAGES_FILE = "stages.jsonl"
+_SUMMARY_FILE = "summary.txt"
+_SLOWEST_DIR = "slowest"
+
+# 最も遅い銘柄のプロファイルに表示する関数の数・メモリ確保箇所の数
+_PROFILE_TOP_FUNCTIONS = 40
+_PROFILE_TOP_ALLOCATIONS = 20
+
+
+class _StageFrame:
+    """実行中の段階（入れ子の内側の段階の時間を差し引くために使う）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.bytes = 0
+        self.memory_start = 0
+
+
+class _CodeRecord:
+    """1銘柄の段階ごとの計測値"""
+
+    def __init__(self, code: str):
+        self.code = code
+        self.started_at = time.time()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.profile: Optional[pstats.Stats] = None
+        self.snapshot_start = None
+
+    def add(self, name: str, wall: float, cpu: float, nbytes: int, peak_bytes: int) -> None:
+        stage = self.stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0, 'peak_kib': 0.0})
+        stage['calls'] += 1
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+        stage['bytes'] += nbytes
+        stage['peak_kib'] = max(stage['peak_kib'], peak_bytes / 1024)
+
+    @property
+    def wall(self) -> float:
+        return sum(stage['wall'] for stage in self.stages.values())
+
+
+class StageProfiler:
+    """銘柄・段階ごとの計測値を記録し、JSON行と実行全体の集計表を書き出す
+
+    slowest > 0 の場合は各銘柄をcProfileで計測し、処理時間が長い上位slowest銘柄の
+    関数ごとの時間とメモリ確保箇所（tracemalloc）を slowest/<コード>.txt に保存する。
+    """
+
+    def __init__(self, directory: str = DEFAULT_PROFILE_DIR, slowest: int = 0,
+                 trace_memory: bool = True):
+        self.directory = directory
+        self.slowest = slowest
+        self.trace_memory = trace_memory or slowest > 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._records: Dict[str, _CodeRecord] = {}
+        self._file = open(os.path.join(directory, _STAGES_FILE), 'w', encoding='utf-8')
+        # 段階名 → 全銘柄の計測値（集計表用）
+        self._stage_totals: Dict[str, List[Tuple[float, float, int, float]]] = defaultdict(list)
+        self._code_walls: List[Tuple[float, str]] = []
+        # 処理時間が長い上位slowest銘柄（処理時間, コード, レポート）の最小ヒープ
+        self._slowest_reports: List[Tuple[float, str, str]] = []
+        self._started_at = time.time()
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self) -> List[_StageFrame]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, code: str) -> _CodeRecord:
+        with self._lock:
+            record = self._records.get(code)
+            if record is None:
+                record = self._records[code] = _CodeRecord(code)
+            return record
+
+    @contextlib.contextmanager
+    def code(self, code: str):
+        """このスレッドで以降に実行する段階をcodeの計測値として記録する"""
+        previous = getattr(self._local, 'code', None)
+        self._local.code = code
+        record = self._record(code)
+
+        profiler = None
+        if self.slowest > 0:
+            if record.snapshot_start is None:
+                record.snapshot_start = tracemalloc.take_snapshot()
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 他のスレッドでプロファイル中（Python 3.12以降は同時に1つだけ）
+                profiler = None
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                with self._lock:
+                    if record.profile is None:
+                        record.profile = pstats.Stats(profiler)
+                    else:
+                        record.profile.add(profiler)
+            self._local.code = previous
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """段階の経過時間・CPU時間・転送量・確保メモリのピークを記録"""
+        code = getattr(self._local, 'code', None)
+        if code is None:
+            # 銘柄に紐付かない処理（プール内のスレッドなど）は計測しない
+            yield
+            return
+
+        frame = _StageFrame(name)
+        if self.trace_memory:
+            frame.memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        stack = self._stack()
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            wall = time.perf_counter() - frame.wall_start
+            cpu = time.thread_time() - frame.cpu_start
+            peak_bytes = 0
+            if self.trace_memory:
+                peak_bytes = max(tracemalloc.get_traced_memory()[1] - frame.memory_start, 0)
+            if stack:
+                stack[-1].child_wall += wall
+                stack[-1].child_cpu += cpu
+            self._record(code).add(name, wall - frame.child_wall, cpu - frame.child_cpu,
+                                   frame.bytes, peak_bytes)
+
+    def add_bytes(self, nbytes: int) -> None:
+        """実行中の一番内側の段階に転送バイト数を加算"""
+        stack = self._stack()
+        if stack:
+            stack[-1].bytes += nbytes
+
+    def finish(self, code: str, ok: bool) -> None:
+        """銘柄の処理終了時に計測値をJSON行で書き出す"""
+        with self._lock:
+            record = self._records.pop(code, None)
+        if record is None:
+            return
+
+        entry = {
+            'code': code,
+            'status': 'ok' if ok else 'failed',
+            'started_at': record.started_at,
+            'wall': round(record.wall, 6),
+            'cpu': round(sum(stage['cpu'] for stage in record.stages.values()), 6),
+            'bytes': sum(int(stage['bytes']) for stage in record.stages.values()),
+            'stages': {name: {key: round(value, 6) if isinstance(value, float) else value
+                              for key, value in stage.items()}
+                       for name, stage in record.stages.items()},
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+
+        report = None
+        if self.slowest > 0 and self._is_slowest_candidate(record.wall):
+            report = self._format_code_report(record)
+
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            for name, stage in record.stages.items():
+                self._stage_totals[name].append((stage['wall'], stage['cpu'], stage['bytes'], stage['peak_kib']))
+            self._code_walls.append((record.wall, code))
+            if report is not None:
+                item = (record.wall, code, report)
+                if len(self._slowest_reports) < self.slowest:
+                    heapq.heappush(self._slowest_reports, item)
+                else:
+                    heapq.heappushpop(self._slowest_reports, item)
+
+    def _is_slowest_candidate(self, wall: float) -> bool:
+        with self._lock:
+            return len(self._slowest_reports) < self.slowest or wall > self._slowest_reports[0][0]
+
+    def _format_code_report(self, record: _CodeRecord) -> str:
+        """1銘柄の段階ごとの計測値・関数ごとの時間・メモリ確保箇所のレポート"""
+        lines = [f"銘柄 {record.code}: 処理時間 {record.wall:.3f}秒", ""]
+        for name, stage in sorted(record.stages.items(), key=lambda item: -item[1]['wall']):
+            lines.append(f"  {name}: {stage['wall']:.3f}秒 (CPU {stage['cpu']:.3f}秒, "
+                         f"{stage['bytes'] / 1024:.1f}KiB, ピーク{stage['peak_kib']:.1f}KiB)")
+
+        if record.profile is not None:
+            output = io.StringIO()
+            record.profile.stream = output
+            record.profile.sort_stats('cumulative').print_stats(_PROFILE_TOP_FUNCTIONS)
+            lines += ["", "=== cProfile（累積時間順） ===", output.getvalue()]
+
+        if record.snapshot_start is not None:
+            # 計測自体（cProfile・pstats・tracemalloc）の確保は除く
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, module.__file__) for module in (cProfile, pstats, tracemalloc)
+            ])
+            lines += ["=== tracemalloc（処理中に増えた確保箇所） ==="]
+            for stat in snapshot.compare_to(record.snapshot_start, 'lineno')[:_PROFILE_TOP_ALLOCATIONS]:
+                lines.append(f"  {stat}")
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self) -> str:
+        """実行全体の段階ごとの集計表"""
+        with self._lock:
+            stage_totals = {name: list(values) for name, values in self._stage_totals.items()}
+            code_walls = sorted(self._code_walls, reverse=True)
+
+        elapsed = time.time() - self._started_at
+        lines = [f"=== 段階ごとの計測（{len(code_walls)}銘柄, 経過{elapsed:.1f}秒） ===",
+                 f"{'段階':<12} {'銘柄数':>6} {'合計秒':>10} {'平均秒':>9} {'最大秒':>9} "
+                 f"{'CPU秒':>10} {'転送MiB':>9} {'最大ピークKiB':>13}"]
+        for name, values in sorted(stage_totals.items(), key=lambda item: -sum(v[0] for v in item[1])):
+            walls = [v[0] for v in values]
+            lines.append(
+                f"{name:<12} {len(values):>6} {sum(walls):>10.3f} {sum(walls) / len(walls):>9.3f} "
+                f"{max(walls):>9.3f} {sum(v[1] for v in values):>10.3f} "
+                f"{sum(v[2] for v in values) / 1024 / 1024:>9.2f} {max(v[3] for v in values):>13.1f}"
+            )
+        if code_walls:
+            lines += ["", "処理時間が長い銘柄:"]
+            lines += [f"  {code}: {wall:.3f}秒" for wall, code in code_walls[:10]]
+        return "\n".join(lines)
+
+    def close(self) -> str:
+        """集計表と最も遅い銘柄のレポートを保存してファイルを閉じる（集計表を返す）"""
+        summary = self.format_summary()
+        with open(os.path.join(self.directory, _SUMMARY_FILE), 'w', encoding='utf-8') as f:
+            f.write(summary + '\n')
+
+        if self._slowest_reports:
+            slowest_dir = os.path.join(self.directory, _SLOWEST_DIR)
+            os.makedirs(slowest_dir, exist_ok=True)
+            for _, code, report in self._slowest_reports:
+                with open(os.path.join(slowest_dir, f"{code}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(report)
+
+        with self._lock:
+            self._file.close()
+        return summary
+
+
+_default_profiler: Optional[StageProfiler] = None
+
+
+def get_default_profiler() -> Optional[StageProfiler]:
+    """共有のプロファイラを取得（--profile指定時以外はNone）"""
+    return _default_profiler
+
+
+def set_default_profiler(profiler: Optional[StageProfiler]) -> None:
+    """共有のプロファイラを設定（Noneで計測を止める）"""
+    global _default_profiler
+    _default_profiler = profiler
+
+
+def enable_profiler(directory: str = DEFAULT_PROFILE_DIR, slowest: int = 0) -> StageProfiler:
+    """プロファイラを作成して共有に設定"""
+    profiler = StageProfiler(directory, slowest=slowest)
+    set_default_profiler(profiler)
+    return profiler
+
+
+def profile_code(code: str):
+    """以降の段階をcodeの計測値として記録するコンテキスト（無効時は何もしない）"""
+    profiler = _default_profiler
+    return profiler.code(code) if profiler else contextlib.nullcontext()
+
+
+def profile_stage(name: str):
+    """段階を計測するコンテキスト（無効時は何もしない）"""
+    profiler = _default_profiler
+    return profiler.stage(name) if profiler else contextlib.nullcontext()
+
+
+def record_transfer(nbytes: int) -> None:
+    """実行中の段階に転送バイト数を加算（無効時は何もしない）"""
+    profiler = _default_profiler
+    if profiler:
+        profiler.add_bytes(nbytes)
+
+
+def finish_code(code: str, ok: bool) -> None:
+    """銘柄の計測値を書き出す（無効時は何もしない）"""
+    profiler = _default_profiler
+    if profiler:
+        profiler.finish(code, ok)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""ホストごとのトークンバケット方式レートリミッタ"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from src.endpoints import kabutan_host, tdnet_pdf_host
+
+
+# ホストごとの既定の予算（毎秒のリクエスト数, バースト上限）
+DEFAULT_HOST_RATES = {
+    'kabutan.jp': (1.0, 2.0),
+    'tdnet-pdf.kabutan.jp': (2.0, 4.0),
+}
+
+
+def host_rates(kabutan: Tuple[float, float] = DEFAULT_HOST_RATES['kabutan.jp'],
+               tdnet_pdf: Tuple[float, float] = DEFAULT_HOST_RATES['tdnet-pdf.kabutan.jp']
+               ) -> Dict[str, Tuple[float, float]]:
+    """株探とTDnet PDFの予算を現在の接続先のホスト名に割り当てる
+
+    接続先を環境変数で差し替えた場合も、予算はそのホストに適用される。
+    """
+    return {
+        kabutan_host(): kabutan,
+        tdnet_pdf_host(): tdnet_pdf,
+    }
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（トークンが貯まるまで呼び出し側を待たせる）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """トークンを消費し、待機した秒数を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先にトークンを予約してから待つ（待機中に他スレッドが追い越さないように）
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate: float, capacity: float) -> None:
+        """毎秒のトークン数とバースト上限を変更（貯まっているトークンは新しい上限までにする）"""
+        with self._lock:
+            self.rate = rate
+            self.capacity = capacity
+            self._tokens = min(self._tokens, capacity)
+
+
+class HostRateLimiter:
+    """URLのホスト名ごとに別々のトークンバケットで流量を制御"""
+
+    def __init__(self, rates: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.rates = dict(rates or host_rates())
+        self.buckets: Dict[str, TokenBucket] = {}
+        for host, (rate, capacity) in self.rates.items():
+            self.buckets[host] = TokenBucket(rate, capacity)
+
+    def acquire(self, url: str) -> float:
+        """URLのホストの予算を消費（予算が設定されていないホストは待たない）"""
+        bucket = self.buckets.get(urlparse(url).hostname or '')
+        if bucket is None:
+            return 0.0
+        return bucket.acquire()
+
+    def set_share(self, share: float) -> None:
+        """全体の予算のうちshare（0〜1）の割合だけを使う（複数ワーカーで予算を分け合う場合）"""
+        for host, (rate, capacity) in self.rates.items():
+            self.buckets[host].set_rate(rate * share, max(1.0, capacity * share))
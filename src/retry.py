@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""HTTPリクエストの再試行の方針（一時的な失敗の判定・ジッター付き指数バックオフ・Retry-After）"""
+
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import FrozenSet, Optional
+
+import requests
+
+
+# 再試行するステータス（タイムアウト・流量制限・サーバー側の一時的なエラー）
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+DEFAULT_MAX_RETRIES = 3
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """再試行の回数と待ち時間
+
+    n回目の再試行の前には base_delay * 2**(n-1) 秒（max_delayまで）の半分から全体までの
+    ランダムな時間だけ待つ。Retry-Afterが指定されていればその秒数より短くは待たない。
+    """
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    retry_statuses: FrozenSet[int] = RETRY_STATUSES
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """attempt回目（0始まり）の失敗の後に待つ秒数"""
+        if retry_after is not None:
+            # 同時に429を受けたリクエストが一斉に送り直さないよう、指定の秒数にジッターを足す
+            return min(self.max_delay, retry_after + random.uniform(0, self.base_delay))
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def retry_reason(self, response: Optional[requests.Response] = None,
+                     error: Optional[BaseException] = None) -> Optional[str]:
+        """再試行すべき失敗なら理由（ステータスコードやエラーの種類）、そうでなければNone"""
+        if error is not None:
+            if isinstance(error, requests.Timeout):
+                return 'timeout'
+            if isinstance(error, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+                return 'connection'
+            return None
+        if response is not None and response.status_code in self.retry_statuses:
+            return str(response.status_code)
+        return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を待つ秒数に変換（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""バッチ結果（銘柄ごとの最新四半期の行）を横断的にスクリーニング・順位付けするエンジン
+
+指標ごとに値を昇順の配列で保持し、パーセンタイル順位は二分探索、z値は累計和から求める。
+1銘柄の行が変わった場合はその銘柄の値だけを差し替え、全体を並べ直さない（差し替えた値は
+次に順位を求めるときにまとめて昇順配列へ差し込む）。1銘柄の値が変わると全銘柄の順位と
+総合スコアが変わりうるため、更新後の最初のscores()・top()は全銘柄を評価し直す（O(N)）。
+評価結果と上位の選択は次の更新まで再利用する。
+"""
+
+import math
+import operator
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.summary_writer import SUMMARY_COLUMNS
+
+
+# 総合スコアに使う指標と重み（値が大きいほど良い指標）
+DEFAULT_SCORE_WEIGHTS = {
+    '四半期成長率': 1.0,
+    '経常益利回り': 1.0,
+    '四半期割安率_四半期平均': 1.0,
+}
+
+DEFAULT_SCREENING_PATH = "data/output/batch_screening.csv"
+
+_FILTER_PATTERN = re.compile(r'^\s*(.+?)\s*(>=|<=|==|>|<)\s*(-?\d+(?:\.\d+)?)\s*$')
+_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+# 配列の初期容量（足りなくなったら倍に広げる）
+_INITIAL_CAPACITY = 64
+
+
+@dataclass(frozen=True)
+class ScreeningFilter:
+    """列の値に対する条件（例: 四半期成長率 >= 0.1）。値がない銘柄は条件を満たさない"""
+    column: str
+    op: str
+    value: float
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        """条件を満たすかを配列で返す（NaNは常にFalse）"""
+        with np.errstate(invalid='ignore'):
+            return _OPERATORS[self.op](values, self.value)
+
+    def __str__(self) -> str:
+        return f"{self.column}{self.op}{self.value:g}"
+
+
+def parse_filter(text: str) -> ScreeningFilter:
+    """「列名>=値」形式の文字列を条件に変換（形式が不正ならValueError）"""
+    match = _FILTER_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"フィルタの形式が不正です（例: 四半期成長率>=0.1）: {text}")
+    return ScreeningFilter(match.group(1), match.group(2), float(match.group(3)))
+
+
+def check_filter_columns(filters: Sequence[ScreeningFilter], weights: Optional[Dict[str, float]] = None) -> None:
+    """フィルタの列がサマリーの列か総合スコアの指標でなければValueError（打ち間違いで全銘柄が外れないように）"""
+    known = list(dict.fromkeys(SUMMARY_COLUMNS + list(weights or DEFAULT_SCORE_WEIGHTS)))
+    for screening_filter in filters:
+        if screening_filter.column not in known:
+            raise ValueError(f"フィルタの列がありません: {screening_filter.column}（使える列: {', '.join(known)}）")
+
+
+def _to_float(value) -> float:
+    """行の値をfloatに変換（Noneや数値でない値はNaN）"""
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _SortedColumn:
+    """1指標の値を昇順で保持し、順位・平均・標準偏差を求める
+
+    add()・remove()は値をためておくだけで、sorted_valuesを読むときにまとめて反映する
+    （1件ごとに配列全体を複写しない）。
+    """
+
+    def __init__(self, values: Optional[np.ndarray] = None):
+        values = np.asarray(values if values is not None else [], dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self._sorted_values = np.sort(values)
+        self._added: List[float] = []
+        self._removed: List[float] = []
+        self.count = len(values)
+        self.total = float(values.sum())
+        self.total_sq = float((values * values).sum())
+
+    @property
+    def sorted_values(self) -> np.ndarray:
+        """昇順の値（ためておいた挿入・削除を反映する）"""
+        if self._added or self._removed:
+            self._sorted_values = _merge_sorted(self._sorted_values, np.sort(self._added), np.sort(self._removed))
+            self._added = []
+            self._removed = []
+        return self._sorted_values
+
+    def add(self, value: float) -> None:
+        """値を挿入（NaNは無視）"""
+        if math.isnan(value):
+            return
+        self._added.append(value)
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+
+    def remove(self, value: float) -> None:
+        """値を1つ削除（NaNは無視）"""
+        if math.isnan(value):
+            return
+        self._removed.append(value)
+        self.count -= 1
+        self.total -= value
+        self.total_sq -= value * value
+
+    def percentile(self, values: np.ndarray) -> np.ndarray:
+        """パーセンタイル順位（0〜1、同値は平均順位。pandasのrank(pct=True)と同じ定義）"""
+        if self.count == 0:
+            return np.full(len(values), np.nan)
+        sorted_values = self.sorted_values
+        left = np.searchsorted(sorted_values, values, side='left')
+        right = np.searchsorted(sorted_values, values, side='right')
+        ranks = (left + right + 1) / 2 / self.count
+        return np.where(np.isnan(values), np.nan, ranks)
+
+    def zscore(self, values: np.ndarray) -> np.ndarray:
+        """z値（標本標準偏差で標準化。2銘柄未満かばらつきがなければNaN）"""
+        if self.count < 2:
+            return np.full(len(values), np.nan)
+        mean = self.total / self.count
+        variance = (self.total_sq - self.total * mean) / (self.count - 1)
+        if variance <= 0:
+            return np.full(len(values), np.nan)
+        return (values - mean) / math.sqrt(variance)
+
+
+def _merge_sorted(values: np.ndarray, added: np.ndarray, removed: np.ndarray) -> np.ndarray:
+    """昇順の配列に昇順の値を挿入してから削除する（挿入・削除とも1回の複写で済ませる）"""
+    if len(added):
+        values = np.insert(values, np.searchsorted(values, added), added)
+    if len(removed):
+        # 同じ値を複数削除する場合は、同値の並びの先頭から順に別の位置を消す
+        offsets = np.arange(len(removed)) - np.searchsorted(removed, removed, side='left')
+        values = np.delete(values, np.searchsorted(values, removed, side='left') + offsets)
+    return values
+
+
+def _largest(keys: np.ndarray, candidates: np.ndarray, n: int) -> np.ndarray:
+    """候補のうちキーが大きい順にn件（同値は候補の並び順、候補は昇順）"""
+    if n <= 0:
+        return candidates[:0]
+    if len(candidates) > n:
+        # 上位n件の境界の値を部分ソートで求め、境界より大きい候補と境界と同値の先頭の候補を残す
+        candidate_keys = keys[candidates]
+        threshold = np.partition(candidate_keys, len(candidates) - n)[len(candidates) - n]
+        above = candidate_keys > threshold
+        tied = np.flatnonzero(candidate_keys == threshold)[:n - int(above.sum())]
+        candidates = np.sort(np.concatenate([candidates[above], candidates[tied]]))
+    return candidates[np.argsort(-keys[candidates], kind='stable')]
+
+
+class ScreeningEngine:
+    """銘柄ごとの最新行を保持し、指標の順位・z値・総合スコアとフィルタ結果を計算する
+
+    update()で1銘柄ずつ行を追加・差し替えでき、順位の計算に全体の並べ替えは不要。
+    全銘柄の評価結果と上位の選択はupdate()・remove()まで保持して再利用する。
+    フィルタの列がサマリーの列でも重みの指標でもなければValueErrorを送出する。
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None,
+                 filters: Sequence[ScreeningFilter] = ()):
+        self.weights = dict(weights or DEFAULT_SCORE_WEIGHTS)
+        check_filter_columns(filters, self.weights)
+        self.filters = list(filters)
+        # 順位を付ける指標とフィルタで参照する列の値を配列で保持
+        self.columns = list(dict.fromkeys(list(self.weights) + [f.column for f in self.filters]))
+
+        self.codes: List[str] = []
+        self.rows: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._values = {column: np.full(_INITIAL_CAPACITY, np.nan) for column in self.columns}
+        self._sorted = {column: _SortedColumn() for column in self.weights}
+        # 全銘柄の評価結果と、(列, 条件一致のみか)ごとに選んだ上位の位置と全候補を選んだか（更新で破棄する）
+        self._evaluated: Optional[Dict[str, np.ndarray]] = None
+        self._top: Dict[Tuple[str, bool], Tuple[np.ndarray, bool]] = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], weights: Optional[Dict[str, float]] = None,
+                  filters: Sequence[ScreeningFilter] = ()) -> 'ScreeningEngine':
+        """バッチ結果の行から一括で作成（並べ替えは指標ごとに1回だけ）"""
+        engine = cls(weights, filters)
+        latest = {}
+        for row in rows:
+            latest[row['コード']] = row
+        engine.codes = list(latest)
+        engine.rows = list(latest.values())
+        engine._positions = {code: i for i, code in enumerate(engine.codes)}
+        capacity = max(_INITIAL_CAPACITY, len(engine.rows))
+        for column in engine.columns:
+            values = np.full(capacity, np.nan)
+            values[:len(engine.rows)] = [_to_float(row.get(column)) for row in engine.rows]
+            engine._values[column] = values
+        for column in engine.weights:
+            engine._sorted[column] = _SortedColumn(engine._values[column][:len(engine.rows)])
+        return engine
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def update(self, row: Dict) -> None:
+        """1銘柄の行を追加または差し替え（その銘柄の値だけを昇順配列から入れ替える）"""
+        code = row['コード']
+        self._invalidate()
+        position = self._positions.get(code)
+        if position is None:
+            position = len(self.codes)
+            self._ensure_capacity(position + 1)
+            self.codes.append(code)
+            self.rows.append(row)
+            self._positions[code] = position
+        else:
+            for column, sorted_column in self._sorted.items():
+                sorted_column.remove(self._values[column][position])
+            self.rows[position] = row
+
+        for column in self.columns:
+            value = _to_float(row.get(column))
+            self._values[column][position] = value
+            if column in self._sorted:
+                self._sorted[column].add(value)
+
+    def remove(self, code: str) -> None:
+        """銘柄を除外（最後の銘柄を空いた位置に移して詰める）"""
+        position = self._positions.pop(code, None)
+        if position is None:
+            return
+        self._invalidate()
+        for column, sorted_column in self._sorted.items():
+            sorted_column.remove(self._values[column][position])
+
+        last = len(self.codes) - 1
+        if position != last:
+            self.codes[position] = self.codes[last]
+            self.rows[position] = self.rows[last]
+            self._positions[self.codes[position]] = position
+            for values in self._values.values():
+                values[position] = values[last]
+        self.codes.pop()
+        self.rows.pop()
+        for values in self._values.values():
+            values[last] = np.nan
+
+    def _invalidate(self) -> None:
+        """保持している評価結果と上位の選択を破棄"""
+        self._evaluated = None
+        self._top = {}
+
+    def _ensure_capacity(self, size: int) -> None:
+        """配列の容量が足りなければ倍に広げる"""
+        capacity = len(next(iter(self._values.values()))) if self._values else size
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        for column, values in self._values.items():
+            grown = np.full(new_capacity, np.nan)
+            grown[:capacity] = values
+            self._values[column] = grown
+
+    def sort_columns(self) -> List[str]:
+        """top()で並べ替えに使える列（総合スコア・各指標の順位とz値・保持している列）"""
+        columns = ['総合スコア']
+        for column in self.weights:
+            columns += [f'{column}_順位', f'{column}_z値']
+        return columns + [column for column in self.columns if column not in columns]
+
+    def _column(self, column: str) -> np.ndarray:
+        return self._values[column][:len(self.codes)]
+
+    def _evaluate(self) -> Dict[str, np.ndarray]:
+        """全銘柄の順位・z値・総合スコア・フィルタ結果を配列で計算（次の更新まで結果を再利用）"""
+        if self._evaluated is None:
+            self._evaluated = self._evaluate_all()
+        return self._evaluated
+
+    def _evaluate_all(self) -> Dict[str, np.ndarray]:
+        result = {}
+        weighted_sum = np.zeros(len(self.codes))
+        weight_total = np.zeros(len(self.codes))
+        for column, weight in self.weights.items():
+            values = self._column(column)
+            percentile = self._sorted[column].percentile(values)
+            result[f'{column}_順位'] = percentile
+            result[f'{column}_z値'] = self._sorted[column].zscore(values)
+            available = ~np.isnan(percentile)
+            weighted_sum += np.where(available, percentile * weight, 0.0)
+            weight_total += np.where(available, weight, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result['総合スコア'] = np.where(weight_total > 0, weighted_sum / weight_total, np.nan)
+
+        passed = np.ones(len(self.codes), dtype=bool)
+        for screening_filter in self.filters:
+            passed &= screening_filter.evaluate(self._column(screening_filter.column))
+        result['条件一致'] = passed
+        return result
+
+    def scores(self) -> pd.DataFrame:
+        """全銘柄のスコア表（元の行に順位・z値・総合スコア・条件一致の列を追加）"""
+        frame = pd.DataFrame(self.rows)
+        for column, values in self._evaluate().items():
+            # 評価結果は次の更新まで再利用するため、表には複写を渡す
+            frame[column] = values.copy()
+        return frame
+
+    def score(self, code: str) -> Optional[Dict]:
+        """1銘柄のスコア（順位は二分探索で求めるため全体を計算しない）"""
+        position = self._positions.get(code)
+        if position is None:
+            return None
+        row = dict(self.rows[position])
+        weighted_sum = 0.0
+        weight_total = 0.0
+        for column, weight in self.weights.items():
+            value = np.array([self._values[column][position]])
+            percentile = float(self._sorted[column].percentile(value)[0])
+            row[f'{column}_順位'] = percentile
+            row[f'{column}_z値'] = float(self._sorted[column].zscore(value)[0])
+            if not math.isnan(percentile):
+                weighted_sum += percentile * weight
+                weight_total += weight
+        row['総合スコア'] = weighted_sum / weight_total if weight_total > 0 else math.nan
+        row['条件一致'] = all(
+            bool(f.evaluate(np.array([self._values[f.column][position]]))[0]) for f in self.filters
+        )
+        return row
+
+    def top(self, n: int, column: str = '総合スコア', passed_only: bool = True) -> List[Dict]:
+        """指定列の上位n銘柄（並べられない列ならValueError）
+
+        更新後の最初の呼び出しは全銘柄を評価し直し、部分ソートで上位n件を選ぶ（O(N)）。
+        次の更新までは選んだ結果を再利用し、より少ない件数の呼び出しはその先頭を返す。
+        """
+        if column not in self.sort_columns():
+            raise ValueError(f"並べ替えの列がありません: {column}（使える列: {', '.join(self.sort_columns())}）")
+        evaluated = self._evaluate()
+        selected, complete = self._top.get((column, passed_only), (None, False))
+        if selected is not None and (len(selected) >= n or complete):
+            best = selected[:max(n, 0)]
+        else:
+            keys = evaluated[column] if column in evaluated else self._column(column)
+            candidates = np.flatnonzero(~np.isnan(keys) & (evaluated['条件一致'] if passed_only else True))
+            best = _largest(keys, candidates, n)
+            self._top[(column, passed_only)] = (best, len(best) == len(candidates))
+
+        rows = []
+        for i in best:
+            row = dict(self.rows[i])
+            for name, values in evaluated.items():
+                row[name] = values[i].item()
+            rows.append(row)
+        return rows
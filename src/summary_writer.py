@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""バッチ結果のサマリーを1銘柄ずつ書き出すライター
+
+完了した銘柄の行を固定の列で途中経過ファイル（<出力名>.partial.csv）に追記していき、
+実行中でもそのファイルを読めるようにする。close()で銘柄リストの順に並べ直して
+CSV・gzip圧縮CSV・Parquetのいずれかに書き出し、一時ファイルから出力先へ置き換える。
+メモリに保持するのは銘柄ごとの行の位置だけで、行そのものはファイルから読み直す。
+"""
+
+import csv
+import gzip
+import io
+import itertools
+import math
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+DEFAULT_SUMMARY_PATH = "data/output/batch_summary.csv"
+
+# 出力形式 → 拡張子
+SUMMARY_FORMATS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'parquet': '.parquet',
+}
+
+# サマリーの列（build_summary_rowの列順）
+SUMMARY_COLUMNS = [
+    'コード', '銘柄名', '株価日付', '始値', '発表日', '決算期', '四半期', '売上高', '経常益',
+    '資本合計(純資産)', '売上高成長率', '四半期成長率', '経常益利回り',
+    '四半期割安率_四半期平均', '四半期割安率_前年同期ベース', '四半期割安率_前四半期',
+    '四半期成長率株価相関', '経常益利回り株価相関', '部分結果',
+]
+
+NUMERIC_COLUMNS = [
+    '売上高', '経常益', '資本合計(純資産)', '売上高成長率', '四半期成長率',
+    '経常益利回り', '四半期割安率_四半期平均', '四半期割安率_前年同期ベース', '四半期割安率_前四半期',
+    '始値', '四半期成長率株価相関', '経常益利回り株価相関',
+]
+
+# Parquetに書き出す際に1回にまとめる行数
+_PARQUET_CHUNK_ROWS = 1000
+
+_BOM = '\ufeff'
+
+
+def summary_path(fmt: str = 'csv', base: str = DEFAULT_SUMMARY_PATH) -> str:
+    """出力形式に合わせたサマリーのパス（batch_summary.csv → batch_summary.parquet など）"""
+    root = base[:-len('.csv')] if base.endswith('.csv') else base
+    return root + SUMMARY_FORMATS[fmt]
+
+
+def partial_path(output_file: str) -> str:
+    """実行中の途中経過ファイルのパス"""
+    for extension in sorted(SUMMARY_FORMATS.values(), key=len, reverse=True):
+        if output_file.endswith(extension):
+            return output_file[:-len(extension)] + '.partial.csv'
+    return output_file + '.partial.csv'
+
+
+def read_summary_head(output_file: str, rows: int) -> List[Dict]:
+    """書き出したサマリーの先頭rows行（プレビュー用に全体は読み込まない）"""
+    if output_file.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        batch = next(pq.ParquetFile(output_file).iter_batches(batch_size=rows), None)
+        return batch.to_pylist() if batch is not None else []
+    opener = gzip.open if output_file.endswith('.gz') else open
+    with opener(output_file, 'rt', encoding='utf-8-sig', newline='') as f:
+        return [{column: _parse_value(column, row.get(column) or '') for column in SUMMARY_COLUMNS}
+                for row in itertools.islice(csv.DictReader(f), rows)]
+
+
+def _format_value(column: str, value) -> str:
+    """CSVのセルの文字列（数値列はpd.to_numeric相当で変換し、変換できなければ空欄）"""
+    if value is None:
+        return ''
+    if column in NUMERIC_COLUMNS:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return ''
+        return '' if math.isnan(number) else repr(number)
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return str(value)
+
+
+def _parse_value(column: str, text: str):
+    """CSVのセルをParquetの値に戻す（空欄はNone）"""
+    if text == '':
+        return None
+    return float(text) if column in NUMERIC_COLUMNS else text
+
+
+def _csv_line(values: Iterable[str]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(values)
+    return buffer.getvalue().encode('utf-8')
+
+
+class SummaryWriter:
+    """完了した銘柄の行を追記し、close()で出力先に確定するサマリーライター"""
+
+    def __init__(self, output_file: str = DEFAULT_SUMMARY_PATH, fmt: str = 'csv'):
+        if fmt not in SUMMARY_FORMATS:
+            raise ValueError(f"サマリーの形式は {', '.join(SUMMARY_FORMATS)} のいずれかです: {fmt}")
+        self.output_file = output_file
+        self.format = fmt
+        self.partial_file = partial_path(output_file)
+        # 銘柄コード → 途中経過ファイル内の行の (位置, 長さ)
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.partial_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.partial_file, 'wb')
+        self._file.write(_BOM.encode('utf-8') + _csv_line(SUMMARY_COLUMNS))
+        self._file.flush()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def add(self, row: Dict) -> None:
+        """1銘柄の行を追記（同じ銘柄を再度追加した場合は後の行を使う）"""
+        line = _csv_line(_format_value(column, row.get(column)) for column in SUMMARY_COLUMNS)
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._offsets[str(row.get('コード'))] = (offset, len(line))
+
+    def add_all(self, rows: Iterable[Dict]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def close(self, order: Optional[List[str]] = None) -> Optional[str]:
+        """orderの銘柄順（省略時は追加順）に並べて出力先に書き出し、途中経過ファイルを削除
+
+        Parquetを指定してpyarrowがない場合は警告を表示してCSVで書き出す。
+        書き出した行がなければ何も書き出さずにNoneを返す。
+        """
+        with self._lock:
+            self._file.close()
+            codes = [code for code in (order if order is not None else list(self._offsets))
+                     if code in self._offsets]
+            if not codes:
+                os.remove(self.partial_file)
+                return None
+
+            output_file = self.output_file
+            fmt = self.format
+            if fmt == 'parquet':
+                try:
+                    import pyarrow  # noqa: F401
+                except ImportError:
+                    print("警告: pyarrowがインストールされていないためサマリーをCSVで保存します")
+                    fmt = 'csv'
+                    output_file = summary_path('csv', output_file[:-len('.parquet')])
+
+            temp_path = f"{output_file}.tmp"
+            with open(self.partial_file, 'rb') as source:
+                lines = self._ordered_lines(source, codes)
+                if fmt == 'parquet':
+                    self._write_parquet(temp_path, lines)
+                else:
+                    opener = gzip.open if fmt == 'csv.gz' else open
+                    with opener(temp_path, 'wb') as target:
+                        target.write(_BOM.encode('utf-8') + _csv_line(SUMMARY_COLUMNS))
+                        for line in lines:
+                            target.write(line)
+            os.replace(temp_path, output_file)
+            os.remove(self.partial_file)
+            self.output_file = output_file
+            return output_file
+
+    def abort(self) -> None:
+        """出力先を確定せずに終了（途中経過ファイルは残す）"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _ordered_lines(self, source, codes: List[str]) -> Iterator[bytes]:
+        for code in codes:
+            offset, length = self._offsets[code]
+            source.seek(offset)
+            yield source.read(length)
+
+    def _write_parquet(self, path: str, lines: Iterator[bytes]) -> None:
+        """行をまとめてParquetの行グループとして書き出す"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(column, pa.float64() if column in NUMERIC_COLUMNS else pa.string())
+                            for column in SUMMARY_COLUMNS])
+        with pq.ParquetWriter(path, schema) as writer:
+            chunk = []
+            for line in lines:
+                chunk.append(next(csv.reader([line.decode('utf-8')])))
+                if len(chunk) >= _PARQUET_CHUNK_ROWS:
+                    writer.write_table(_parquet_table(chunk, schema))
+                    chunk = []
+            if chunk:
+                writer.write_table(_parquet_table(chunk, schema))
+
+
+def _parquet_table(rows: List[List[str]], schema):
+    import pyarrow as pa
+
+    columns = {column: [_parse_value(column, row[i]) for row in rows]
+               for i, column in enumerate(SUMMARY_COLUMNS)}
+    return pa.table(columns, schema=schema)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""複数のワーカーで銘柄を分担して処理するための作業キュー（SQLite）
+
+銘柄ごとに状態（pending / leased / done / failed）と借用期限を持ち、ワーカーはclaim()で
+期限つきで銘柄を借りて処理し、結果をcomplete()で書き込む。期限までに結果を書かずに
+止まったワーカーの銘柄は、期限切れ後に別のワーカーが借り直す。
+
+同じマシンの複数プロセスや、ファイルシステムを共有する複数マシンから同じファイルを使う。
+ネットワークファイルシステムでも動くようにWALは使わず、書き込みはBEGIN IMMEDIATEで直列化する。
+"""
+
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+DEFAULT_QUEUE_PATH = "data/output/work_queue.sqlite3"
+
+# 借用期限（秒）
+DEFAULT_LEASE_SECONDS = 300.0
+
+# 生存の記録と借用期限の延長の間隔（秒、借用期限の1/3より長くはしない）
+HEARTBEAT_SECONDS = 5.0
+
+# 1銘柄を借りる回数の上限（失敗や期限切れが続く銘柄はfailedにする）
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 1回のclaimで借りる銘柄数の上限（実際に借りる数は残りの銘柄数をワーカー数で割って決める）
+DEFAULT_CLAIM_SIZE = 32
+
+
+def worker_id() -> str:
+    """このプロセスのワーカーID（ホスト名:プロセスID）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """銘柄の借用・完了・失敗を記録する作業キュー"""
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # 他のワーカーの書き込み中は最大60秒待つ。トランザクションは明示的に開始する
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS codes (
+                code TEXT PRIMARY KEY,
+                name TEXT,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS codes_status ON codes (status, position)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                heartbeat REAL NOT NULL
+            )"""
+        )
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], object]):
+        """書き込みを1つのトランザクションで実行（他のワーカーとの同時更新を直列化）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return value
+
+    def enqueue(self, code_list: List[Dict[str, str]], reset: bool = False) -> int:
+        """銘柄リストを登録（登録済みの銘柄はそのまま）。新しく登録した件数を返す"""
+        def insert(conn: sqlite3.Connection) -> int:
+            if reset:
+                conn.execute("DELETE FROM codes")
+            before = conn.execute("SELECT COUNT(*) FROM codes").fetchone()[0]
+            conn.executemany(
+                "INSERT OR IGNORE INTO codes (code, name, position, updated_at) VALUES (?, ?, ?, ?)",
+                [(info['code'], info.get('name', ''), position, time.time())
+                 for position, info in enumerate(code_list)]
+            )
+            return conn.execute("SELECT COUNT(*) FROM codes").fetchone()[0] - before
+        return self._transaction(insert)
+
+    def retry_failed(self) -> int:
+        """失敗した銘柄を借用回数を戻して未処理にする（再試行した件数を返す）"""
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE codes SET status = 'pending', attempts = 0, error = NULL, updated_at = ? "
+            "WHERE status = 'failed'",
+            (time.time(),)
+        ).rowcount)
+
+    def claim(self, worker: str, count: int = DEFAULT_CLAIM_SIZE,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS, workers: int = 1) -> List[Dict[str, str]]:
+        """未処理の銘柄と借用期限が切れた銘柄を借りる
+
+        借りられる銘柄をworkers個のワーカーで等分した数（切り上げ）を、最大count件借りる。
+        1つのワーカーが少ない銘柄リストを全部借りて、他のワーカーが待つだけにならないようにする。
+        まだ借りられていない銘柄を銘柄リストの順に先に借り、失敗して戻された銘柄は後に回す。
+        """
+        def take(conn: sqlite3.Connection) -> List[Dict[str, str]]:
+            now = time.time()
+            # 借用回数の上限に達したまま期限が切れた銘柄は失敗として確定する
+            conn.execute(
+                "UPDATE codes SET status = 'failed', error = 'lease expired', worker = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            available = conn.execute(
+                "SELECT COUNT(*) FROM codes WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)",
+                (now,)
+            ).fetchone()[0]
+            size = min(count, math.ceil(available / max(1, workers)))
+            rows = conn.execute(
+                "SELECT code, name FROM codes "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY attempts, position LIMIT ?",
+                (now, size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE codes SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE code = ?",
+                [(worker, now + lease_seconds, now, code) for code, _ in rows]
+            )
+            return [{'code': code, 'name': name or ''} for code, name in rows]
+        return self._transaction(take)
+
+    def complete(self, code: str, result: Dict) -> None:
+        """銘柄の結果を書き込んで完了にする"""
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE codes SET status = 'done', result = ?, error = NULL, worker = NULL, lease_until = NULL, "
+            "updated_at = ? WHERE code = ?",
+            (payload, time.time(), code)
+        ))
+
+    def fail(self, code: str, error: str = "") -> str:
+        """銘柄の失敗を記録（借用回数の上限までは未処理に戻す）。更新後の状態を返す"""
+        def mark(conn: sqlite3.Connection) -> str:
+            row = conn.execute("SELECT attempts FROM codes WHERE code = ?", (code,)).fetchone()
+            status = 'failed' if row is None or row[0] >= self.max_attempts else 'pending'
+            conn.execute(
+                "UPDATE codes SET status = ?, error = ?, worker = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE code = ? AND status != 'done'",
+                (status, error, time.time(), code)
+            )
+            return status
+        return self._transaction(mark)
+
+    def heartbeat(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> None:
+        """ワーカーの生存を記録し、借りている銘柄の期限を延長する"""
+        def beat(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            conn.execute(
+                "INSERT INTO workers (worker, started_at, heartbeat) VALUES (?, ?, ?) "
+                "ON CONFLICT(worker) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (worker, now, now)
+            )
+            conn.execute(
+                "UPDATE codes SET lease_until = ? WHERE status = 'leased' AND worker = ?",
+                (now + lease_seconds, worker)
+            )
+        self._transaction(beat)
+
+    def unregister(self, worker: str) -> None:
+        """ワーカーの終了を記録（レート予算の分割から外す）"""
+        self._transaction(lambda conn: conn.execute("DELETE FROM workers WHERE worker = ?", (worker,)))
+
+    def active_workers(self, within_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        """within_seconds以内に生存を記録したワーカーの数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat >= ?", (time.time() - within_seconds,)
+            ).fetchone()
+        return row[0]
+
+    def next_lease_expiry(self) -> Optional[float]:
+        """他のワーカーが借りている銘柄のうち最も早い借用期限（借用中の銘柄がなければNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(lease_until) FROM codes WHERE status = 'leased'").fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        """状態ごとの銘柄数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM codes GROUP BY status").fetchall()
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+    def share(self, workers: int) -> int:
+        """残りの銘柄（未処理と借用中）をworkers個のワーカーで等分した数（切り上げ、最小1）"""
+        counts = self.counts()
+        return max(1, math.ceil((counts['pending'] + counts['leased']) / max(1, workers)))
+
+    def results(self, batch_size: int = 500) -> Iterator[Dict]:
+        """完了した銘柄の結果を銘柄リストの順に返す（batch_size件ずつ読み出す）"""
+        position = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT position, result FROM codes WHERE status = 'done' AND position > ? "
+                    "ORDER BY position LIMIT ?",
+                    (position, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for position, result in rows:
+                yield json.loads(result)
+
+    def close(self) -> None:
+        """データベース接続を閉じる"""
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseKeeper:
+    """処理中に定期的に生存を記録して借用期限を延長するスレッド
+
+    on_active_workersには生存中のワーカー数が渡される（レート予算の分割に使う）。
+    同時に起動することがわかっているワーカーは、全員が生存を記録するまで（最長で借用期限まで）
+    expected_workersとして数える。その後は生存中のワーカー数だけで分け、先に終わったワーカーの
+    予算は残りのワーカーが使う。
+    """
+
+    def __init__(self, work_queue: WorkQueue, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 on_active_workers: Optional[Callable[[int], None]] = None, expected_workers: int = 1):
+        self.work_queue = work_queue
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.on_active_workers = on_active_workers
+        self.expected_workers = expected_workers
+        self._started_at = time.monotonic()
+        self._all_started = expected_workers <= 1
+        self.interval = min(HEARTBEAT_SECONDS, lease_seconds / 3)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def start(self) -> None:
+        self.beat()
+        self._thread.start()
+
+    def beat(self) -> None:
+        """生存を記録し、ワーカー数を通知"""
+        self.work_queue.heartbeat(self.worker, self.lease_seconds)
+        if self.on_active_workers:
+            active = self.work_queue.active_workers(self.lease_seconds)
+            if (not self._all_started
+                    and (active >= self.expected_workers
+                         or time.monotonic() - self._started_at >= self.lease_seconds)):
+                self._all_started = True
+            workers = active if self._all_started else max(self.expected_workers, active)
+            self.on_active_workers(max(1, workers))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.beat()
+            except sqlite3.Error as e:
+                print(f"作業キューの更新に失敗: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.work_queue.unregister(self.worker)
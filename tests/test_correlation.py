@@ -0,0 +1,52 @@
+"""株価相関エンジンのテスト
+
+tests/golden/correlation.json は、相関エンジンに書き換える前のqq.calculate_stock_correlations
+（最新3四半期・Pearson・最新の四半期のみ）の結果。入力は成長率のゴールデンデータ
+（tests/golden/growth_metrics.json）の出力に株価を加えたもの。
+"""
+
+import copy
+import json
+import math
+import os
+
+import pandas as pd
+import pytest
+
+import qq
+from src.correlation import CorrelationSettings, calculate_correlations, calculate_panel_correlations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMNS = ['四半期成長率株価相関', '経常益利回り株価相関']
+
+with open(os.path.join(ROOT, 'tests', 'golden', 'correlation.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+def correlations(rows):
+    """相関の列（NaNは比較できるよう文字列にする。株価が一定の窓はNaNになる）"""
+    return [{column: 'nan' if isinstance(row[column], float) and math.isnan(row[column]) else row[column]
+             for column in COLUMNS} for row in rows]
+
+
+@pytest.mark.parametrize('case', GOLDEN, ids=[case['name'] for case in GOLDEN])
+def test_default_settings_match_golden(case):
+    data = copy.deepcopy(case['data'])
+    calculate_correlations(data, CorrelationSettings())
+    assert correlations(data) == correlations(case['expected'])
+
+
+def test_qq_delegates_with_default_settings():
+    for case in GOLDEN:
+        data = copy.deepcopy(case['data'])
+        qq.calculate_stock_correlations(data, CorrelationSettings())
+        assert correlations(data) == correlations(case['expected'])
+
+
+def test_panel_matches_golden():
+    frame = pd.concat([pd.DataFrame(case['data']).assign(コード=case['name']) for case in GOLDEN],
+                      ignore_index=True)
+    panel = calculate_panel_correlations(frame, settings=CorrelationSettings())
+
+    expected = [row for case in GOLDEN for row in case['expected']]
+    assert correlations(panel.to_dict('records')) == correlations(expected)
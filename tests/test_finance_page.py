@@ -0,0 +1,40 @@
+"""財務ページ解析のテスト
+
+tests/golden/finance_page.json は、lxml版に書き換える前の実装（qq.get_fiscal_year_end_month と
+qq.parse_quarterly_rows）でbenchmarks/fixtures/の財務ページを解析した結果。
+"""
+
+import json
+import os
+
+import pytest
+
+from src.finance_page import parse_finance_page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+with open(os.path.join(ROOT, 'tests', 'golden', 'finance_page.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, f"finance_{name}.html"), encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name', sorted(GOLDEN))
+def test_parse_finance_page_matches_golden(name):
+    expected = GOLDEN[name]
+    page = parse_finance_page(read_fixture(name))
+
+    assert page.fiscal_year_end_month == expected['fiscal_year_end_month']
+    assert page.quarterly_rows == expected['quarterly_rows']
+    assert page.disclosure_links == [row['PDF_URL'] for row in expected['quarterly_rows'] if row['PDF_URL']]
+
+
+def test_empty_page():
+    page = parse_finance_page('')
+    assert page.fiscal_year_end_month == 3
+    assert page.quarterly_rows == []
+    assert page.disclosure_links == []
@@ -0,0 +1,65 @@
+"""成長率エンジンのテスト
+
+tests/golden/growth_metrics.json は、配列演算版に書き換える前のqq.calculate_qoq_growth_rateの結果。
+入力はbenchmarks/fixtures/の財務ページの四半期行（資本合計を補ったもの）と、乱数で作った履歴
+（欠損・0・-0.0・同じ決算期の行・並び順の入れ替えを含む）。
+"""
+
+import copy
+import json
+import math
+import os
+
+import pandas as pd
+import pytest
+
+import qq
+from src.growth_metrics import GROWTH_METRIC_COLUMNS, calculate_growth_metrics, calculate_panel_growth_metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'tests', 'golden', 'growth_metrics.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+def same_value(actual, expected):
+    """値が一致するか（0.0と-0.0も区別する）"""
+    if expected is None or actual is None:
+        return actual is None and expected is None
+    if isinstance(expected, float):
+        return actual == expected and math.copysign(1.0, actual) == math.copysign(1.0, expected)
+    return actual == expected
+
+
+@pytest.mark.parametrize('case', GOLDEN, ids=[case['name'] for case in GOLDEN])
+def test_growth_metrics_match_golden(case):
+    actual = calculate_growth_metrics(copy.deepcopy(case['data']), case['fiscal_year_end_month'])
+
+    assert len(actual) == len(case['expected'])
+    for row, expected in zip(actual, case['expected']):
+        assert set(row) == set(expected)
+        for column, value in expected.items():
+            assert same_value(row[column], value), (row['決算期'], column, row[column], value)
+
+
+def test_qq_delegates_to_engine():
+    case = GOLDEN[0]
+    assert qq.calculate_qoq_growth_rate(copy.deepcopy(case['data']), case['fiscal_year_end_month']) == \
+        case['expected']
+
+
+def test_panel_matches_golden():
+    frames = []
+    for case in GOLDEN:
+        frame = pd.DataFrame(case['data'], columns=['決算期', '売上高', '経常益', '資本合計'])
+        frames.append(frame.assign(コード=case['name'], 決算月=case['fiscal_year_end_month']))
+    panel = calculate_panel_growth_metrics(pd.concat(frames, ignore_index=True), fiscal_month_column='決算月')
+
+    expected = [row for case in GOLDEN for row in case['expected']]
+    for column in GROWTH_METRIC_COLUMNS:
+        for actual, row in zip(panel[column].tolist(), expected):
+            assert same_value(actual, row.get(column)), (row['決算期'], column, actual, row.get(column))
+
+
+def test_empty_data():
+    assert calculate_growth_metrics([], 3) == []
@@ -0,0 +1,53 @@
+"""発表日と週足株価の突き合わせのテスト
+
+tests/golden/price_matching.json は、ソート済みインデックスに書き換える前の
+qq.find_stock_price_after_announcementの結果。週足はbenchmarks/fixtures/の9984の週足ページ、
+発表日は固定データの財務ページの発表日・週足の日付そのもの・不正な文字列など。
+"""
+
+import contextlib
+import io
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from src.price_matching import PriceIndex, match_prices_panel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'tests', 'golden', 'price_matching.json'), encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+def weekly_data(case):
+    return [dict(row, 日付=datetime.fromisoformat(row['日付'])) for row in case['weekly_data']]
+
+
+@pytest.mark.parametrize('case', GOLDEN, ids=[case['name'] for case in GOLDEN])
+def test_price_index_matches_golden(case):
+    index = PriceIndex(weekly_data(case))
+    for announcement_date, expected in zip(case['announcements'], case['expected']):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = index.lookup(announcement_date)
+        assert result == {'株価日付': expected['株価日付'], '始値': expected['始値']}, announcement_date
+        assert output.getvalue() == expected['output']
+
+
+def test_panel_matches_golden():
+    announcements = pd.DataFrame([
+        {'コード': case['name'], '発表日': announcement_date}
+        for case in GOLDEN for announcement_date in case['announcements']
+    ])
+    prices = pd.DataFrame(
+        [dict(row, コード=case['name']) for case in GOLDEN for row in weekly_data(case)],
+        columns=['コード', '日付', '始値'],
+    )
+    result = match_prices_panel(announcements, prices)
+
+    expected = [row for case in GOLDEN for row in case['expected']]
+    assert result['株価日付'].tolist() == [row['株価日付'] for row in expected]
+    assert result['始値'].tolist() == [row['始値'] for row in expected]
@@ -0,0 +1,118 @@
+"""スクリーニングエンジンのテスト（1銘柄ずつの更新と一括作成が同じ結果になるか）"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.screening import ScreeningEngine, check_filter_columns, parse_filter
+
+
+def make_rows(count, seed=0):
+    """指標の一部が欠けた合成のバッチ結果の行"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(count):
+        row = {'コード': str(1000 + i), '銘柄名': f"合成銘柄{1000 + i}"}
+        for column in ['四半期成長率', '経常益利回り', '四半期割安率_四半期平均']:
+            # 同値と欠損も含める
+            value = round(float(rng.normal()), 1)
+            row[column] = None if rng.random() < 0.15 else value
+        rows.append(row)
+    return rows
+
+
+def sorted_scores(engine):
+    return engine.scores().sort_values('コード', ignore_index=True)
+
+
+@pytest.mark.parametrize('filters', [[], [parse_filter('四半期成長率>=0')]])
+def test_update_and_remove_match_from_rows(filters):
+    rows = make_rows(150)
+    replacements = make_rows(150, seed=1)
+
+    engine = ScreeningEngine(filters=filters)
+    for row in rows:
+        engine.update(row)
+    # 一部の銘柄を差し替え、一部を除外する（除外した銘柄の再追加も含める）
+    final = {row['コード']: row for row in rows}
+    for row in replacements[::3]:
+        engine.update(row)
+        final[row['コード']] = row
+    for row in rows[::5]:
+        engine.remove(row['コード'])
+        del final[row['コード']]
+    for row in rows[::10]:
+        engine.update(row)
+        final[row['コード']] = row
+    engine.remove('9999')
+
+    expected = ScreeningEngine.from_rows(final.values(), filters=filters)
+    assert len(engine) == len(expected) == len(final)
+    pd.testing.assert_frame_equal(sorted_scores(engine), sorted_scores(expected), check_exact=False, rtol=1e-9)
+
+    top = engine.top(10)
+    expected_top = expected.top(10)
+    assert [row['コード'] for row in top] == [row['コード'] for row in expected_top]
+    for row, expected_row in zip(top, expected_top):
+        assert row['総合スコア'] == pytest.approx(expected_row['総合スコア'])
+
+    for code in list(final)[:20]:
+        score = engine.score(code)
+        expected_score = expected.score(code)
+        assert score['条件一致'] == expected_score['条件一致']
+        for column in ['総合スコア', '四半期成長率_順位', '経常益利回り_z値']:
+            if math.isnan(expected_score[column]):
+                assert math.isnan(score[column])
+            else:
+                assert score[column] == pytest.approx(expected_score[column])
+
+
+def test_top_is_reused_until_update():
+    rows = make_rows(60)
+    engine = ScreeningEngine.from_rows(rows)
+    top = engine.top(10)
+    assert [row['コード'] for row in engine.top(5)] == [row['コード'] for row in top[:5]]
+    assert engine.top(0) == []
+
+    # 1位の銘柄の値を下げると、次のtop()は評価し直した結果を返す
+    first = dict(next(row for row in rows if row['コード'] == top[0]['コード']))
+    first.update({column: -10.0 for column in ['四半期成長率', '経常益利回り', '四半期割安率_四半期平均']})
+    engine.update(first)
+    expected = ScreeningEngine.from_rows([first if row['コード'] == first['コード'] else row for row in rows])
+    assert [row['コード'] for row in engine.top(10)] == [row['コード'] for row in expected.top(10)]
+    assert first['コード'] not in [row['コード'] for row in engine.top(10)]
+
+
+def test_percentile_matches_pandas_rank():
+    rows = make_rows(80)
+    scores = ScreeningEngine.from_rows(rows).scores()
+    expected = pd.to_numeric(scores['四半期成長率']).rank(pct=True)
+    pd.testing.assert_series_equal(scores['四半期成長率_順位'], expected, check_names=False)
+
+
+def test_unknown_filter_column_is_rejected():
+    with pytest.raises(ValueError, match='四半期成長'):
+        check_filter_columns([parse_filter('四半期成長>=0.1')])
+    with pytest.raises(ValueError):
+        ScreeningEngine(filters=[parse_filter('四半期成長>=0.1')])
+    check_filter_columns([parse_filter('売上高成長率>=0.1'), parse_filter('四半期成長率<1')])
+
+
+def test_unknown_sort_column_is_rejected():
+    engine = ScreeningEngine.from_rows(make_rows(10))
+    with pytest.raises(ValueError, match='並べ替えの列'):
+        engine.top(3, column='総合スコアx')
+    assert len(engine.top(3, column='経常益利回り_z値')) == 3
+    assert len(engine.top(3, column='経常益利回り')) == 3
+
+
+def test_parse_filter():
+    screening_filter = parse_filter(' 経常益利回り >= -0.5 ')
+    assert (screening_filter.column, screening_filter.op, screening_filter.value) == ('経常益利回り', '>=', -0.5)
+    with pytest.raises(ValueError, match='形式'):
+        parse_filter('経常益利回り 0.5')
+    # 演算子の打ち間違いは列名の一部になるため、列の確認で見つける
+    with pytest.raises(ValueError, match='列'):
+        check_filter_columns([parse_filter('経常益利回り => 0.5')])
@@ -0,0 +1,47 @@
+"""作業キューのテスト（複数のワーカーで銘柄を分担できるか）"""
+
+import os
+
+from src.work_queue import WorkQueue
+
+
+def make_code_list(count):
+    return [{'code': str(1000 + i), 'name': f"合成銘柄{1000 + i}"} for i in range(count)]
+
+
+def test_two_workers_each_get_a_share(tmp_path):
+    path = os.path.join(tmp_path, 'work_queue.sqlite3')
+    first = WorkQueue(path)
+    second = WorkQueue(path)
+    first.enqueue(make_code_list(40))
+
+    # run_queue_workerのように、先読みの上限（32件）と残りの等分の小さい方まで借り続ける
+    # （先に起動したワーカーが続けて借りても、もう1つのワーカーの分が残る）
+    claimed = {'first': [], 'second': []}
+    while True:
+        taken = 0
+        for name, work_queue in [('first', first), ('first', first), ('second', second)]:
+            limit = min(32, work_queue.share(2))
+            codes = work_queue.claim(name, max(0, limit - len(claimed[name])), workers=2)
+            claimed[name] += [info['code'] for info in codes]
+            taken += len(codes)
+        if not taken:
+            break
+
+    assert len(claimed['first']) + len(claimed['second']) == 40
+    assert set(claimed['first']).isdisjoint(claimed['second'])
+    assert len(claimed['first']) == len(claimed['second']) == 20
+    first.close()
+    second.close()
+
+
+def test_claim_is_limited_by_count(tmp_path):
+    work_queue = WorkQueue(os.path.join(tmp_path, 'work_queue.sqlite3'))
+    work_queue.enqueue(make_code_list(40))
+
+    assert [info['code'] for info in work_queue.claim('worker', 8)] == [str(1000 + i) for i in range(8)]
+    # 1つのワーカーだけなら残りを全部借りる
+    assert len(work_queue.claim('worker', 100)) == 32
+    assert work_queue.claim('worker', 100) == []
+    assert work_queue.counts()['leased'] == 40
+    work_queue.close()